@@ -0,0 +1,307 @@
+import sys
+
+import numpy as np
+import pandas as pd
+
+#########################
+# Streaming histogram binning (Sturges, Freedman-Diaconis, square root, ...)
+#########################
+
+# Values read per chunk from arrays, memory-mapped .npy files and CSV files
+CHUNK_SIZE = 1_000_000
+
+# Items kept per level of the quantile sketch; the rank error is roughly
+# (number of levels) / SKETCH_CAPACITY, well under 1% for billions of values
+SKETCH_CAPACITY = 2048
+
+# Missing-value markers used when reading CSV files (the WMO normals use -99.9)
+MISSING_VALUES = ['-99.9']
+
+# Bin rules supported by bin_edges, with the same formulas as np.histogram_bin_edges
+RULES = ('sturges', 'sqrt', 'rice', 'scott', 'fd', 'auto')
+
+
+class QuantileSketch:
+    """
+    A mergeable quantile sketch with a fixed memory footprint.
+
+    Values enter level 0; whenever a level holds more than `capacity` items it
+    is sorted and every other item (random offset) moves up one level, where
+    it stands for twice as many values. Two sketches merge by concatenating
+    their levels and compacting again, so chunks or files can be summarised
+    independently and combined.
+    """
+
+    def __init__(self, capacity=SKETCH_CAPACITY, seed=0):
+        self.capacity = capacity
+        self.levels = [np.empty(0)]
+        self.rng = np.random.default_rng(seed)
+
+    def _compact(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self.capacity:
+                items = np.sort(items)
+                # An odd item out stays behind so no weight is lost
+                keep = items[-1:] if len(items) % 2 else items[:0]
+                pairs = items[:len(items) - len(keep)]
+                promoted = pairs[self.rng.integers(2)::2]
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                self.levels[level] = keep
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
+
+    def update(self, values):
+        """Add an array of (finite) values."""
+        self.levels[0] = np.concatenate([self.levels[0], np.asarray(values, dtype=np.float64)])
+        self._compact()
+
+    def merge(self, other):
+        """Fold another sketch into this one."""
+        for level, items in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self._compact()
+
+    def quantile(self, q):
+        """
+        Return approximate quantiles.
+
+        Parameters:
+        - q: A quantile or array of quantiles in [0, 1].
+
+        Returns:
+        - The quantile value(s), interpolated like np.quantile on the weighted items.
+        """
+        items = np.concatenate(self.levels)
+        if len(items) == 0:
+            return np.full(np.shape(q), np.nan)
+        weights = np.concatenate([np.full(len(x), 2.0 ** i) for i, x in enumerate(self.levels)])
+        order = np.argsort(items)
+        items, weights = items[order], weights[order]
+        # Rank of each item's centre, scaled so the first and last items sit at
+        # 0 and 1 (with unit weights this is exactly np.quantile's 'linear' method)
+        centres = np.cumsum(weights) - weights / 2
+        span = centres[-1] - centres[0]
+        rank = (centres - centres[0]) / span if span > 0 else np.zeros_like(centres)
+        return np.interp(q, rank, items)
+
+
+class StreamSummary:
+    """
+    One-pass summary of a stream of values: exact count, min, max, mean and
+    variance, plus a QuantileSketch for the quartiles.
+
+    Summaries are mergeable, like the sketch they hold.
+    """
+
+    def __init__(self, capacity=SKETCH_CAPACITY, seed=0):
+        self.count = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.shift = 0.0
+        self.sketch = QuantileSketch(capacity, seed)
+
+    def update(self, values):
+        """Add an array of values (non-finite values are skipped)."""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[np.isfinite(values)]
+        if len(values) == 0:
+            return
+        self.count += len(values)
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        # Shift by the first value seen to keep the sum of squares well conditioned
+        if self.count == len(values):
+            self.shift = values[0]
+        centred = values - self.shift
+        self.total += centred.sum()
+        self.total_sq += np.dot(centred, centred)
+        self.sketch.update(values)
+
+    def merge(self, other):
+        """Fold another summary into this one."""
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.shift = other.shift
+        offset = other.shift - self.shift
+        self.total_sq += other.total_sq + 2 * offset * other.total + other.count * offset ** 2
+        self.total += other.total + other.count * offset
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.sketch.merge(other.sketch)
+
+    def std(self):
+        """Return the population standard deviation (as np.std)."""
+        if self.count == 0:
+            return np.nan
+        mean = self.total / self.count
+        return np.sqrt(max(self.total_sq / self.count - mean * mean, 0.0))
+
+    def iqr(self):
+        """Return the approximate interquartile range."""
+        q1, q3 = self.sketch.quantile([0.25, 0.75])
+        return q3 - q1
+
+
+def iter_chunks(source, column=None, chunk_size=CHUNK_SIZE):
+    """
+    Yield 1-D float arrays from a re-readable source.
+
+    Parameters:
+    - source: A NumPy array (including np.memmap), a path to a .npy file
+      (memory-mapped), or a path to a CSV file.
+    - column: For CSV files, the column to read (surrounding spaces in the
+      header are ignored, as in the padded WMO files).
+    - chunk_size: Number of values (or CSV rows) per chunk.
+
+    Yields:
+    - Arrays of values.
+    """
+    if isinstance(source, str) and source.endswith('.npy'):
+        source = np.load(source, mmap_mode='r')
+    if isinstance(source, np.ndarray):
+        flat = source.reshape(-1)
+        for start in range(0, len(flat), chunk_size):
+            yield np.asarray(flat[start:start + chunk_size], dtype=np.float64)
+        return
+    if column is None:
+        raise ValueError("A column is needed to read a CSV file")
+    reader = pd.read_csv(source, usecols=lambda name: name.strip() == column, skipinitialspace=True,
+                         na_values=MISSING_VALUES, chunksize=chunk_size)
+    for chunk in reader:
+        yield pd.to_numeric(chunk.iloc[:, 0], errors='coerce').to_numpy(dtype=np.float64)
+
+
+def summarize(source, column=None, chunk_size=CHUNK_SIZE):
+    """First pass: return a StreamSummary of a source (see iter_chunks)."""
+    summary = StreamSummary()
+    for chunk in iter_chunks(source, column, chunk_size):
+        summary.update(chunk)
+    return summary
+
+
+def bin_width(summary, rule):
+    """
+    Return the bin width a rule picks for a summarised stream.
+
+    Parameters:
+    - summary: A StreamSummary.
+    - rule: One of RULES.
+
+    Returns:
+    - The width (0 when the rule cannot pick one, e.g. a zero IQR).
+    """
+    n = summary.count
+    span = summary.max - summary.min
+    if rule == 'sturges':
+        return span / (np.log2(n) + 1.0)
+    if rule == 'sqrt':
+        return span / np.sqrt(n)
+    if rule == 'rice':
+        return span / (2.0 * n ** (1.0 / 3))
+    if rule == 'scott':
+        return (24.0 * np.pi ** 0.5 / n) ** (1.0 / 3.0) * summary.std()
+    if rule == 'fd':
+        return 2.0 * summary.iqr() * n ** (-1.0 / 3.0)
+    if rule == 'auto':
+        # Freedman-Diaconis, capped at twice the square-root rule's bin count
+        fd = max(bin_width(summary, 'fd'), bin_width(summary, 'sqrt') / 2)
+        return min(fd, bin_width(summary, 'sturges'))
+    raise ValueError(f"Unknown bin rule {rule!r}; expected one of {RULES}")
+
+
+def bin_edges(summary, rule='fd'):
+    """
+    Return histogram bin edges for a summarised stream.
+
+    Follows np.histogram_bin_edges: equal-width bins spanning [min, max], with
+    the count rounded up from the rule's width (and one bin if it is zero).
+
+    Parameters:
+    - summary: A StreamSummary.
+    - rule: One of RULES.
+
+    Returns:
+    - An array of edges.
+    """
+    if summary.count == 0:
+        return np.array([0.0, 1.0])
+    first, last = summary.min, summary.max
+    if first == last:
+        first, last = first - 0.5, last + 0.5
+    width = bin_width(summary, rule)
+    n_bins = int(np.ceil((last - first) / width)) if width else 1
+    return np.linspace(first, last, n_bins + 1)
+
+
+def fill_counts(source, edges, column=None, chunk_size=CHUNK_SIZE):
+    """
+    Second pass: count the values of a source falling into equal-width bins.
+
+    Parameters:
+    - source: See iter_chunks.
+    - edges: Equal-width bin edges (as returned by bin_edges).
+    - column, chunk_size: See iter_chunks.
+
+    Returns:
+    - An int64 array of counts; the last bin includes its right edge, as in np.histogram.
+    """
+    edges = np.asarray(edges, dtype=np.float64)
+    n_bins = len(edges) - 1
+    first, last = edges[0], edges[-1]
+    scale = n_bins / (last - first)
+    counts = np.zeros(n_bins, dtype=np.int64)
+    for chunk in iter_chunks(source, column, chunk_size):
+        chunk = chunk[(chunk >= first) & (chunk <= last)]
+        index = np.minimum(((chunk - first) * scale).astype(np.int64), n_bins - 1)
+        # Round-off can move a value lying on an edge into the neighbouring
+        # bin; compare with the edges themselves, as np.histogram does
+        index -= chunk < edges[index]
+        index += (chunk >= edges[index + 1]) & (index != n_bins - 1)
+        counts += np.bincount(index, minlength=n_bins)
+    return counts
+
+
+def histogram(source, rule='fd', column=None, chunk_size=CHUNK_SIZE):
+    """
+    Histogram a source too large for memory in two streaming passes.
+
+    Parameters:
+    - source: See iter_chunks (it is read twice).
+    - rule: One of RULES.
+    - column, chunk_size: See iter_chunks.
+
+    Returns:
+    - A tuple (counts, edges), like np.histogram.
+    """
+    edges = bin_edges(summarize(source, column, chunk_size), rule)
+    return fill_counts(source, edges, column, chunk_size), edges
+
+
+if __name__ == '__main__':
+    # python streaming_bins.py [<file.npy> | <file.csv> <column>] [rule]
+    if len(sys.argv) > 1:
+        path = sys.argv[1]
+        column = sys.argv[2] if not path.endswith('.npy') else None
+        rule = sys.argv[3 if column else 2] if len(sys.argv) > (3 if column else 2) else 'fd'
+        counts, edges = histogram(path, rule, column)
+        print(f"{counts.sum()} values, {len(counts)} bins ({rule}) from {edges[0]:g} to {edges[-1]:g}")
+        sys.exit()
+
+    # Compare with np.histogram_bin_edges on the skewed dataset of bins.ipynb
+    np.random.seed(0)
+    data = np.random.lognormal(mean=0, sigma=1, size=1000)
+    data_with_outliers = np.concatenate([data, np.random.uniform(low=20, high=50, size=10)])
+    summary = summarize(data_with_outliers, chunk_size=100)
+    for rule in RULES:
+        k_stream = len(bin_edges(summary, rule)) - 1
+        k_numpy = len(np.histogram_bin_edges(data_with_outliers, bins=rule)) - 1
+        print(f"{rule:>8}: {k_stream} bins (numpy: {k_numpy})")
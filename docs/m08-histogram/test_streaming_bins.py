@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from streaming_bins import RULES, StreamSummary, fill_counts, histogram, summarize
+
+#########################
+# Streaming histograms must match np.histogram on data that fits in memory
+#########################
+
+# Rules that only need the count, extremes and variance: edges are exact
+EXACT_RULES = ('sturges', 'sqrt', 'rice', 'scott')
+
+
+@pytest.fixture(scope='module')
+def skewed():
+    """The skewed sample with outliers of bins.ipynb."""
+    rng = np.random.default_rng(0)
+    data = rng.lognormal(mean=0, sigma=1, size=1000)
+    return np.concatenate([data, rng.uniform(low=20, high=50, size=10)])
+
+
+@pytest.mark.parametrize('rule', RULES)
+def test_matches_numpy_below_sketch_capacity(skewed, rule):
+    # With fewer values than the sketch holds, the quartiles are exact too
+    counts, edges = histogram(skewed, rule, chunk_size=97)
+    expected_counts, expected_edges = np.histogram(skewed, bins=rule)
+    np.testing.assert_allclose(edges, expected_edges)
+    np.testing.assert_array_equal(counts, expected_counts)
+
+
+@pytest.mark.parametrize('rule', RULES)
+def test_large_stream(rule):
+    rng = np.random.default_rng(1)
+    data = rng.gamma(2.0, 10.0, 300_000)
+    counts, edges = histogram(data, rule, chunk_size=10_000)
+    expected_edges = np.histogram_bin_edges(data, bins=rule)
+    if rule in EXACT_RULES:
+        np.testing.assert_allclose(edges, expected_edges)
+    else:
+        # The interquartile range comes from the sketch, so the bin count is close, not equal
+        assert abs(len(edges) - len(expected_edges)) <= 0.02 * len(expected_edges)
+    np.testing.assert_array_equal(counts, np.histogram(data, edges)[0])
+
+
+def test_values_on_edges_are_binned_like_numpy():
+    rng = np.random.default_rng(2)
+    for _ in range(50):
+        data = rng.integers(0, rng.integers(5, 500), rng.integers(50, 5000)).astype(np.float64)
+        for rule in RULES:
+            counts, edges = histogram(data, rule, chunk_size=333)
+            np.testing.assert_array_equal(counts, np.histogram(data, edges)[0])
+
+
+def test_merged_summaries_match_one_pass():
+    rng = np.random.default_rng(3)
+    data = rng.normal(1e6, 3.0, 50_000)  # large offset: the variance needs the shift
+    data[rng.random(len(data)) < 0.01] = np.nan
+    whole = summarize(data, chunk_size=len(data))
+    merged = StreamSummary()
+    for chunk in np.array_split(data, 7):
+        part = StreamSummary()
+        part.update(chunk)
+        merged.merge(part)
+    valid = data[np.isfinite(data)]
+    for summary in (whole, merged):
+        assert summary.count == len(valid)
+        assert summary.min == valid.min() and summary.max == valid.max()
+        assert summary.std() == pytest.approx(valid.std(), rel=1e-9)
+
+
+def test_files_match_arrays(tmp_path):
+    rng = np.random.default_rng(4)
+    data = rng.normal(20, 5, 5000).round(1)
+    npy = tmp_path / 'values.npy'
+    np.save(npy, data)
+    np.testing.assert_array_equal(histogram(str(npy), 'fd', chunk_size=999)[0], histogram(data, 'fd')[0])
+
+    # Padded WMO-style CSV with -99.9 for missing values
+    csv = tmp_path / 'values.csv'
+    column = np.where(rng.random(len(data)) < 0.05, -99.9, data)
+    csv.write_text('Station , Jan\n' + ''.join(f"s{i}, {v}\n" for i, v in enumerate(column)))
+    counts, edges = histogram(str(csv), 'sturges', column='Jan', chunk_size=700)
+    valid = column[column != -99.9]
+    np.testing.assert_array_equal(counts, np.histogram(valid, bins='sturges')[0])
+    np.testing.assert_array_equal(fill_counts(str(csv), list(edges), 'Jan'), counts)
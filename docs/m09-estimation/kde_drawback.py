@@ -1,51 +1,228 @@
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
-import seaborn as sns
 import numpy as np
 import imageio
-import os
+
+#########################
+# Animated KDE of a growing sample (data_kde_animation.gif)
+#########################
 
 # Parameters
 n_frames = 30  # Number of frames in the GIF
 n_max_points = 100  # Maximum number of data points
+grid_size = 100  # KDE evaluation grid points per axis
+n_levels = 10  # Contour levels (iso-proportions of the density, as in seaborn)
+thresh = 0.05  # Lowest iso-proportion drawn
+
+# Upper bound on the (grid cells x points) temporaries of one KDE evaluation
+MAX_BLOCK = 2_000_000
+
+# Frames rendered per worker task; at most two tasks per worker are in flight,
+# so only a few frames are held in memory ahead of the GIF writer
+FRAMES_PER_TASK = 4
+
+
+def frame_sizes(n_frames, n_max_points):
+    """Return the number of data points shown in each frame."""
+    return (np.arange(1, n_frames + 1) * n_max_points // n_frames).astype(np.int64)
+
+
+def prefix_covariances(data, sizes):
+    """
+    Return the sample covariance of every prefix data[:n] for n in sizes.
+
+    Uses running sums of x and x x^T, so all prefixes cost one pass over the data.
+
+    Parameters:
+    - data: An (n, 2) array of points.
+    - sizes: Array of prefix lengths.
+
+    Returns:
+    - An (len(sizes), 2, 2) array (NaN where a prefix has fewer than 2 points).
+    """
+    s1 = np.cumsum(data, axis=0)[sizes - 1]
+    s2 = np.cumsum(data[:, :, None] * data[:, None, :], axis=0)[sizes - 1]
+    n = sizes[:, None, None].astype(np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (s2 - s1[:, :, None] * s1[:, None, :] / n) / (n - 1)
+
+
+def iter_kde_frames(data, sizes, grid_x, grid_y):
+    """
+    Evaluate a Gaussian KDE of every prefix data[:n] on one shared grid, one frame at a time.
+
+    The bandwidth follows Scott's rule on each prefix, like scipy's gaussian_kde
+    (and so seaborn's kdeplot). The point-to-grid offsets are computed once for
+    the whole sample and each frame only re-weights the first n of them.
+
+    Parameters:
+    - data: An (n, 2) array of points.
+    - sizes: Array of prefix lengths, one per frame.
+    - grid_x, grid_y: 1-D arrays of grid coordinates.
+
+    Yields:
+    - One (len(grid_y), len(grid_x)) density array per frame, all NaN for
+      frames whose KDE is undefined (fewer than 3 points or a singular covariance).
+    """
+    n_used = int(sizes.max())
+    dx = grid_x[None, :, None] - data[None, None, :n_used, 0]  # (1, nx, n)
+    dy = grid_y[:, None, None] - data[None, None, :n_used, 1]  # (ny, 1, n)
+
+    covariances = prefix_covariances(data, sizes)
+    rows = max(1, MAX_BLOCK // (len(grid_x) * n_used))
+    for n, cov in zip(sizes, covariances):
+        density = np.full((len(grid_y), len(grid_x)), np.nan)
+        bandwidth = cov * n ** (-2 / 6)  # Scott's factor n^(-1/(d+4)), squared, d=2
+        det = np.linalg.det(bandwidth) if n > 2 else 0.0
+        if det > 1e-12:
+            (a, b), (_, c) = np.linalg.inv(bandwidth)
+            norm = 1.0 / (n * 2 * np.pi * np.sqrt(det))
+            for start in range(0, len(grid_y), rows):
+                ddx, ddy = dx[..., :n], dy[start:start + rows, :, :n]
+                q = a * ddx * ddx + 2 * b * ddx * ddy + c * ddy * ddy
+                density[start:start + rows] = np.exp(-0.5 * q).sum(axis=2) * norm
+        yield density
+
+
+def kde_frames(data, sizes, grid_x, grid_y):
+    """Return every frame of iter_kde_frames as one (frames, ny, nx) array."""
+    return np.stack(list(iter_kde_frames(data, sizes, grid_x, grid_y)))
+
 
-# Generate data
-np.random.seed(42)
-data = np.random.normal(size=(n_max_points, 2))
+def contour_levels(density, levels=n_levels, thresh=thresh):
+    """
+    Return the density values enclosing iso-proportions of the mass (seaborn's levels).
 
-# Directory for temporary image files
-os.makedirs('temp_images', exist_ok=True)
+    Parameters:
+    - density: A 2-D density array.
+    - levels: Number of levels.
+    - thresh: The lowest iso-proportion.
 
-# Create each frame
-filenames = []
-for i in range(1, n_frames + 1):
-    n_points = int(i * n_max_points / n_frames)
-    current_data = data[:n_points, :]
+    Returns:
+    - An increasing array of unique contour values.
+    """
+    values = np.sort(density.ravel())[::-1]
+    cumulative = np.cumsum(values) / values.sum()
+    idx = np.searchsorted(cumulative, 1 - np.linspace(thresh, 1, levels))
+    return np.unique(np.take(values, idx, mode='clip'))
+
+
+def shared_grid(data, grid_size=grid_size, cut=3):
+    """Return grid axes covering the data plus `cut` full-sample bandwidths."""
+    bandwidth = data.std(axis=0, ddof=1) * len(data) ** (-1 / 6)
+    low = data.min(axis=0) - cut * bandwidth
+    high = data.max(axis=0) + cut * bandwidth
+    return np.linspace(low[0], high[0], grid_size), np.linspace(low[1], high[1], grid_size)
+
+
+def render_frames(data, sizes, grid_x, grid_y):
+    """
+    Draw the frames of the given prefix sizes into RGB arrays, one at a time.
+
+    One figure is created and reused: the scatter offsets and titles are
+    updated in place and only the contour set is redrawn per frame. Frames are
+    read straight from the Agg canvas, so nothing is written to disk, and each
+    density is computed just before its frame is drawn.
+
+    Parameters:
+    - data: An (n, 2) array of points.
+    - sizes: Array of prefix lengths, one per frame.
+    - grid_x, grid_y: The shared KDE grid (also fixes the axis limits).
+
+    Yields:
+    - (height, width, 3) uint8 arrays.
+    """
 
     # Create figure with two subplots
     fig, axs = plt.subplots(1, 2, figsize=(10, 5))
-
-    # Scatter plot of data points
-    axs[0].scatter(current_data[:, 0], current_data[:, 1])
-    axs[0].set_title(f"Data Points (n={n_points})")
-    
-    # KDE plot
-    if n_points > 1:  # KDE requires at least 2 points
-        sns.kdeplot(x=current_data[:, 0], y=current_data[:, 1], ax=axs[1])
+    points = axs[0].scatter(data[:0, 0], data[:0, 1])
+    for ax in axs:
+        ax.set_xlim(grid_x[0], grid_x[-1])
+        ax.set_ylim(grid_y[0], grid_y[-1])
     axs[1].set_title("Kernel Density Estimation")
 
-    # Save the plot as an image
-    filename = f'temp_images/frame_{i:03d}.png'
-    plt.savefig(filename)
-    plt.close()
-    filenames.append(filename)
+    contours = None
+    for n, frame_density in zip(sizes, iter_kde_frames(data, sizes, grid_x, grid_y)):
+        # Scatter plot of data points
+        points.set_offsets(data[:n])
+        axs[0].set_title(f"Data Points (n={n})")
+
+        # KDE plot
+        if contours is not None:
+            contours.remove()
+            contours = None
+        if not np.isnan(frame_density).any():
+            contours = axs[1].contour(grid_x, grid_y, frame_density,
+                                      levels=contour_levels(frame_density), colors='C0')
+
+        fig.canvas.draw()
+        yield np.asarray(fig.canvas.buffer_rgba())[..., :3].copy()
+    plt.close(fig)
+
+
+def _render_block(args):
+    """Worker: render one block of frames (see render_frames)."""
+    return list(render_frames(*args))
+
+
+def in_order(executor, function, tasks, window):
+    """Yield function(task) for each task in order, with at most `window` tasks submitted ahead."""
+    pending = deque()
+    for task in tasks:
+        pending.append(executor.submit(function, task))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def write_animation(path, data, n_frames, n_max_points, workers=None):
+    """
+    Render the animation and stream its frames into a GIF.
+
+    Frames are appended as they are drawn; with workers, small blocks of
+    frames are rendered in parallel and appended in order as they finish, so
+    memory stays bounded whatever the number of frames.
+
+    Parameters:
+    - path: Output GIF path.
+    - data: An (n_max_points, 2) array of points.
+    - n_frames: Number of frames.
+    - n_max_points: Points shown in the last frame.
+    - workers: Number of worker processes; None or 1 renders in this process.
+    """
+    sizes = frame_sizes(n_frames, n_max_points)
+    grid_x, grid_y = shared_grid(data[:n_max_points])
+
+    with imageio.get_writer(path, mode='I') as writer:
+        if not workers or workers == 1:
+            for frame in render_frames(data, sizes, grid_x, grid_y):
+                writer.append_data(frame)
+            return
+        # Contiguous blocks of frames, appended in order as each worker finishes
+        tasks = ((data, sizes[start:start + FRAMES_PER_TASK], grid_x, grid_y)
+                 for start in range(0, len(sizes), FRAMES_PER_TASK))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for frames in in_order(executor, _render_block, tasks, 2 * workers):
+                for frame in frames:
+                    writer.append_data(frame)
+
 
-# Create GIF
-with imageio.get_writer('data_kde_animation.gif', mode='I') as writer:
-    for filename in filenames:
-        image = imageio.imread(filename)
-        writer.append_data(image)
-        os.remove(filename)  # Optionally remove the temporary file
+if __name__ == '__main__':
+    # python kde_drawback.py [n_frames] [n_max_points] [workers]
+    if len(sys.argv) > 1:
+        n_frames = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        n_max_points = int(sys.argv[2])
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else None
 
-# Clean up directory
-os.rmdir('temp_images')
+    # Generate data
+    np.random.seed(42)
+    data = np.random.normal(size=(n_max_points, 2))
 
+    write_animation('data_kde_animation.gif', data, n_frames, n_max_points, workers)
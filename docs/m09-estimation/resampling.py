@@ -0,0 +1,279 @@
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from binned_kde import bandwidth_factor
+
+#########################
+# Vectorised bootstrap and subsampling with batched statistics
+#########################
+
+# Most resamples drawn per block; a block is the unit of work handed to worker processes
+BLOCK_SIZE = 2000
+
+# Memory per block: drawing counts and computing a statistic peak at about
+# BYTES_PER_ENTRY bytes per (resample, sample, observation), so a block holds
+# at most BLOCK_MEMORY / (BYTES_PER_ENTRY * samples * n) resamples, and many
+# samples are split into groups when even one resample would not fit
+BLOCK_MEMORY = 256 * 2 ** 20
+BYTES_PER_ENTRY = 40
+
+# Statistics computed directly from resample counts (see resample_statistic)
+STATISTICS = ('mean', 'std', 'median', 'quantile')
+
+
+def bootstrap_counts(valid, n_resamples, rng):
+    """
+    Draw how often each observation appears in each bootstrap resample.
+
+    Counts carry the same information as index matrices but let statistics be
+    computed with dot products and cumulative sums instead of gathers and sorts.
+
+    Parameters:
+    - valid: An (S, n) bool array; each row is one sample, False entries are padding.
+    - n_resamples: Resamples per sample.
+    - rng: A np.random.Generator.
+
+    Returns:
+    - An (n_resamples, S, n) int array; each (resample, sample) row sums to
+      that sample's number of valid observations.
+    """
+    n_samples, n = valid.shape
+    sizes = valid.sum(axis=1)
+    # Positions of each row's valid entries first, so draw j of a resample
+    # picks order[floor(u * size)]; draws beyond a row's size are dropped
+    order = np.argsort(~valid, axis=1, kind='stable')
+    draws = np.floor(rng.random((n_resamples, n_samples, n)) * sizes[:, None]).astype(np.int64)
+    picked = np.take_along_axis(np.broadcast_to(order, draws.shape), draws, axis=2)
+    keep = np.arange(n) < sizes[:, None]
+    rows = np.arange(n_resamples * n_samples).reshape(n_resamples, n_samples, 1) * n
+    counts = np.bincount((rows + picked)[:, keep].ravel(), minlength=n_resamples * n_samples * n)
+    return counts.reshape(n_resamples, n_samples, n)
+
+
+def resample_statistic(values, counts, statistic='mean', q=None):
+    """
+    Compute a statistic of every resample from its counts.
+
+    Parameters:
+    - values: An (S, n) float array, sorted along each row when statistic
+      is 'median' or 'quantile' (padding may hold anything).
+    - counts: An (R, S, n) array from bootstrap_counts.
+    - statistic: One of STATISTICS.
+    - q: Quantile(s) in [0, 1] for 'quantile'.
+
+    Returns:
+    - An (R, S) array, or (R, S, len(q)) for an array of quantiles; NaN for empty samples.
+    """
+    sizes = counts.sum(axis=2)
+    filled = np.where(np.isfinite(values), values, 0.0)
+    if statistic in ('mean', 'std'):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result = np.einsum('rsn,sn->rs', counts, filled) / sizes
+            if statistic == 'std':
+                centred = filled - result[..., None]
+                result = np.sqrt((counts * centred * centred).sum(axis=2) / (sizes - 1))
+        result[sizes == 0] = np.nan
+        return result
+    if statistic == 'median':
+        statistic, q = 'quantile', 0.5
+    if statistic != 'quantile':
+        raise ValueError(f"Unknown statistic {statistic!r}; expected one of {STATISTICS}")
+
+    # The k-th smallest value of a resample is the first sorted value whose
+    # cumulative count exceeds k; interpolate between ranks as np.quantile does
+    cumulative = np.cumsum(counts, axis=2)
+    qs = np.atleast_1d(np.asarray(q, dtype=np.float64))
+    result = np.empty(counts.shape[:2] + (len(qs),))
+    for j, quantile in enumerate(qs):
+        h = (sizes - 1) * quantile
+        low = np.floor(h)
+        picked = []
+        for rank in (low, np.minimum(low + 1, sizes - 1)):
+            position = (cumulative <= rank[..., None]).sum(axis=2)
+            position = np.minimum(position, values.shape[1] - 1)
+            rows = np.broadcast_to(values, counts.shape)
+            picked.append(np.take_along_axis(rows, position[..., None], axis=2)[..., 0])
+        result[..., j] = picked[0] + (h - low) * (picked[1] - picked[0])
+    result[sizes == 0] = np.nan
+    return result if np.ndim(q) else result[..., 0]
+
+
+def _as_samples(data):
+    """Return (values, valid) as (S, n) arrays from one sample or a NaN-padded batch."""
+    values = np.atleast_2d(np.asarray(data, dtype=np.float64))
+    return values, np.isfinite(values)
+
+
+def _bootstrap_block(args):
+    """Worker: draw one block of resamples and compute its statistic."""
+    values, valid, n_resamples, seed, statistic, q = args
+    counts = bootstrap_counts(valid, n_resamples, np.random.default_rng(seed))
+    return resample_statistic(values, counts, statistic, q)
+
+
+def block_shape(n_samples, n, block_size=BLOCK_SIZE, memory=BLOCK_MEMORY):
+    """
+    Choose how many resamples and samples go into one block.
+
+    Parameters:
+    - n_samples, n: Shape of the (S, n) data.
+    - block_size: Most resamples per block.
+    - memory: Memory budget of one block in bytes.
+
+    Returns:
+    - A tuple (resamples per block, samples per group).
+    """
+    per_resample = BYTES_PER_ENTRY * max(n, 1)
+    samples = int(max(1, min(n_samples, memory // per_resample)))
+    resamples = int(max(1, min(block_size, memory // (per_resample * samples))))
+    return resamples, samples
+
+
+def _map_blocks(function, make_args, n_resamples, seed, block_size, workers):
+    """Run function over blocks of resamples, each seeded from one SeedSequence."""
+    sizes = [min(block_size, n_resamples - start) for start in range(0, n_resamples, block_size)]
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    seeds = seed.spawn(len(sizes))
+    tasks = [make_args(size, s) for size, s in zip(sizes, seeds)]
+    if workers and workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(function, tasks))
+    return [function(task) for task in tasks]
+
+
+def bootstrap(data, statistic='mean', n_resamples=10_000, q=None, seed=0,
+              block_size=BLOCK_SIZE, workers=None, memory=BLOCK_MEMORY):
+    """
+    Bootstrap distribution of a statistic for one sample or many samples at once.
+
+    Resamples are drawn in blocks sized to the memory budget (see
+    block_shape), each from its own child of one SeedSequence, so results
+    depend only on the seed, block size and budget, not on the number of
+    worker processes.
+
+    Parameters:
+    - data: A (n,) array, or an (S, n) array of S samples with NaN padding
+      (e.g. one row per station).
+    - statistic: One of STATISTICS.
+    - n_resamples: Number of resamples per sample.
+    - q: Quantile(s) for statistic='quantile'.
+    - seed: Seed of the random generator.
+    - block_size: Most resamples per block.
+    - workers: Number of worker processes; None or 1 computes in this process.
+    - memory: Memory budget of one block in bytes (each worker holds one block).
+
+    Returns:
+    - An (n_resamples,) array for one sample, else (n_resamples, S); a trailing
+      quantile axis is added for an array q.
+    """
+    values, valid = _as_samples(data)
+    if statistic in ('median', 'quantile'):
+        values = np.sort(values, axis=1)  # NaN padding sorts last
+        valid = np.isfinite(values)
+    resamples, samples = block_shape(*values.shape, block_size, memory)
+    groups = range(0, len(values), samples)
+    # One group keeps the seed as given; several each get a child of it
+    seeds = [seed] if len(groups) == 1 else np.random.SeedSequence(seed).spawn(len(groups))
+    results = []
+    for start, group_seed in zip(groups, seeds):
+        group = slice(start, start + samples)
+        blocks = _map_blocks(_bootstrap_block,
+                             lambda size, s: (values[group], valid[group], size, s, statistic, q),
+                             n_resamples, group_seed, resamples, workers)
+        results.append(np.concatenate(blocks, axis=0))
+    result = np.concatenate(results, axis=1)
+    return result[:, 0] if np.ndim(data) == 1 else result
+
+
+def confidence_interval(distribution, level=0.95, axis=0):
+    """Return the (low, high) percentile interval of a bootstrap distribution."""
+    alpha = (1 - level) / 2
+    low, high = np.nanquantile(distribution, [alpha, 1 - alpha], axis=axis)
+    return low, high
+
+
+def _kde_block(args):
+    """Worker: densities of one block of resamples as counts @ kernel matrix."""
+    valid, kernels, n_resamples, seed = args
+    counts = bootstrap_counts(valid, n_resamples, np.random.default_rng(seed))[:, 0]
+    return counts @ kernels / valid.sum()
+
+
+def kde_band(data, grid, n_resamples=1000, level=0.95, bw='scott', seed=0,
+             block_size=BLOCK_SIZE, workers=None, memory=BLOCK_MEMORY):
+    """
+    Pointwise bootstrap confidence band of a Gaussian KDE.
+
+    The bandwidth is fixed from the full sample, so every resample's density
+    is the count vector times one (n x grid) kernel matrix: a block of
+    resamples is a single matrix product.
+
+    Parameters:
+    - data: A (n,) array (NaN values are ignored).
+    - grid: Evaluation points.
+    - n_resamples: Number of resamples.
+    - level: Confidence level of the band.
+    - bw: 'scott', 'silverman' or a factor (see binned_kde.bandwidth_factor).
+    - seed, block_size, workers, memory: See bootstrap.
+
+    Returns:
+    - A tuple (density, low, high) of arrays over the grid.
+    """
+    values = np.asarray(data, dtype=np.float64)
+    values = values[np.isfinite(values)]
+    bandwidth = values.std(ddof=1) * bandwidth_factor(len(values), 1, bw)
+    offsets = (np.asarray(grid)[None, :] - values[:, None]) / bandwidth
+    kernels = np.exp(-0.5 * offsets ** 2) / (bandwidth * np.sqrt(2 * np.pi))
+    valid = np.ones((1, len(values)), dtype=bool)
+
+    # Each resample also holds a (grid) density row next to its counts
+    resamples, _ = block_shape(1, len(values) + len(kernels[0]), block_size, memory)
+    blocks = _map_blocks(_kde_block, lambda size, s: (valid, kernels, size, s),
+                         n_resamples, seed, resamples, workers)
+    low, high = confidence_interval(np.concatenate(blocks, axis=0), level)
+    return kernels.mean(axis=0), low, high
+
+
+if __name__ == '__main__':
+    # python resampling.py [n_resamples] [workers]
+    n_resamples = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+
+    rng = np.random.default_rng(0)
+    population = np.clip(rng.normal(6.3, 1.2, 3000), 1, 10)  # stands in for IMDB_Rating
+
+    for statistic, q in [('mean', None), ('median', None), ('quantile', [0.1, 0.9])]:
+        start = time.perf_counter()
+        distribution = bootstrap(population, statistic, n_resamples, q=q, workers=workers)
+        elapsed = time.perf_counter() - start
+        low, high = confidence_interval(distribution)
+        print(f"{statistic:>8}: 95% CI {np.round(low, 3)} - {np.round(high, 3)} "
+              f"({n_resamples} resamples of n={len(population)} in {elapsed:.2f} s)")
+
+    # One row per station: 30 yearly values each, some stations with gaps
+    stations = rng.normal(15, 5, size=(200, 30)) + rng.normal(0, 8, size=(200, 1))
+    stations[rng.random(stations.shape) < 0.1] = np.nan
+    start = time.perf_counter()
+    means = bootstrap(stations, 'mean', n_resamples, workers=workers)
+    print(f"   mean CI for {len(stations)} stations x {n_resamples} resamples in "
+          f"{time.perf_counter() - start:.2f} s")
+
+    # All stations of the normals table (about 6650 x 30 yearly values): the
+    # full count array would take tens of GB, so blocks follow BLOCK_MEMORY
+    stations = rng.normal(15, 5, size=(6650, 30)) + rng.normal(0, 8, size=(6650, 1))
+    stations[rng.random(stations.shape) < 0.1] = np.nan
+    resamples, samples = block_shape(*stations.shape)
+    start = time.perf_counter()
+    means = bootstrap(stations, 'mean', min(n_resamples, 2000), workers=workers)
+    print(f"   mean CI for {len(stations)} stations x {len(means)} resamples in "
+          f"{time.perf_counter() - start:.2f} s ({resamples} resamples per block)")
+
+    grid = np.linspace(1, 10, 200)
+    start = time.perf_counter()
+    density, low, high = kde_band(population[:500], grid, n_resamples, workers=workers)
+    print(f"KDE band on {len(grid)} points from {n_resamples} resamples in "
+          f"{time.perf_counter() - start:.2f} s (widest {np.max(high - low):.3f})")
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from resampling import block_shape, bootstrap, bootstrap_counts, resample_statistic
+
+#########################
+# Statistics from resample counts must equal those of the expanded resamples
+#########################
+
+
+@pytest.fixture(scope='module')
+def samples():
+    """Three samples of different sizes in one NaN-padded batch, with ties."""
+    rng = np.random.default_rng(0)
+    values = np.full((3, 40), np.nan)
+    values[0] = rng.normal(6.3, 1.2, 40).round(1)
+    values[1, :25] = rng.exponential(3.0, 25)
+    values[2, :7] = [1.0, 2.0, 2.0, 3.0, 5.0, 8.0, 13.0]
+    return values
+
+
+def expanded(values, counts):
+    """Materialise each (resample, sample) as np.repeat of the values by their counts."""
+    return [[np.repeat(values[s], counts[r, s]) for s in range(counts.shape[1])]
+            for r in range(counts.shape[0])]
+
+
+def test_counts_are_resamples(samples):
+    valid = np.isfinite(samples)
+    counts = bootstrap_counts(valid, 500, np.random.default_rng(1))
+    assert counts.shape == (500,) + samples.shape
+    np.testing.assert_array_equal(counts.sum(axis=2), np.broadcast_to(valid.sum(axis=1), (500, 3)))
+    assert not counts[:, ~valid].any()
+    # Every observation is drawn once per resample on average
+    mean_counts = counts.mean(axis=0)[valid]
+    assert np.abs(mean_counts - 1).max() < 0.25
+
+
+@pytest.mark.parametrize('statistic, q, reference', [
+    ('mean', None, lambda x: x.mean()),
+    ('std', None, lambda x: x.std(ddof=1)),
+    ('median', None, np.median),
+    ('quantile', 0.1, lambda x: np.quantile(x, 0.1)),
+    ('quantile', [0.05, 0.5, 0.95], lambda x: np.quantile(x, [0.05, 0.5, 0.95])),
+])
+def test_statistic_matches_expanded_resamples(samples, statistic, q, reference):
+    # Order statistics expect sorted rows (the padding sorts last)
+    values = np.sort(samples, axis=1) if statistic in ('median', 'quantile') else samples
+    counts = bootstrap_counts(np.isfinite(values), 200, np.random.default_rng(2))
+    result = resample_statistic(values, counts, statistic, q)
+    expected = np.array([[reference(x) for x in row] for row in expanded(values, counts)])
+    np.testing.assert_allclose(result, expected, rtol=1e-12, atol=1e-12)
+
+
+def test_bootstrap_matches_expanded_resamples(samples):
+    # bootstrap() on one sample is a single block drawn from the seed's first child
+    sample = samples[1, :25]
+    distribution = bootstrap(sample, 'mean', 300, seed=5)
+    counts = bootstrap_counts(np.ones((1, 25), dtype=bool), 300,
+                              np.random.default_rng(np.random.SeedSequence(5).spawn(1)[0]))
+    np.testing.assert_allclose(distribution, [x[0].mean() for x in expanded(sample[None], counts)])
+
+
+def test_results_do_not_depend_on_workers_or_groups(samples):
+    single = bootstrap(samples, 'median', 1000, seed=3, block_size=300)
+    parallel = bootstrap(samples, 'median', 1000, seed=3, block_size=300, workers=2)
+    np.testing.assert_array_equal(single, parallel)
+
+    # A budget that splits the samples into groups still gives one column per sample
+    memory = 40 * samples.shape[1]  # one resample of one sample
+    assert block_shape(*samples.shape, memory=memory) == (1, 1)
+    grouped = bootstrap(samples, 'mean', 200, seed=3, memory=memory)
+    assert grouped.shape == (200, 3)
+    np.testing.assert_allclose(grouped.mean(axis=0), np.nanmean(samples, axis=1), rtol=0.05)
@@ -0,0 +1,203 @@
+import json
+import sys
+from collections import defaultdict
+from itertools import islice
+
+import numpy as np
+
+from recommender import RecommendationEngine
+
+#########################
+# Batch evaluation of saved traveller profiles
+#########################
+
+# Number of (profile, station) pairs evaluated per block; bounds the size of
+# the temporary boolean arrays whatever the number of stations
+PAIR_BUDGET = 2**24
+
+# Maximum number of station names written per profile (None for all)
+MAX_STATIONS = 50
+
+
+def read_profiles(path):
+    """
+    Stream profiles from a JSON-lines file.
+
+    Each line looks like
+    {"id": "u1", "month": "Jul", "ranges": {"Precipitation (mm)": [0, 50]}}.
+
+    Parameters:
+    - path: Path to the profiles file.
+
+    Yields:
+    - Profile dicts.
+    """
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def validate_profile(engine, profile, index):
+    """
+    Check one profile the way the interactive endpoints check their queries.
+
+    Parameters:
+    - engine: A RecommendationEngine.
+    - profile: A profile dict (see read_profiles).
+    - index: Position of the profile in the input, used in error messages.
+
+    Returns:
+    - A tuple (month, filters) with filters as returned by engine.parse_filters.
+    """
+    try:
+        if not isinstance(profile, dict):
+            raise ValueError("expected a JSON object")
+        if 'month' not in profile:
+            raise ValueError("missing 'month'")
+        engine.check_month(profile['month'])
+        ranges = profile.get('ranges', {})
+        if not isinstance(ranges, dict):
+            raise ValueError("'ranges' must map parameters to [low, high]")
+        return profile['month'], engine.parse_filters(ranges)
+    except (ValueError, TypeError) as e:
+        name = profile.get('id') if isinstance(profile, dict) else None
+        raise ValueError(f"Profile {index} ({name!r}): {e}") from None
+
+
+def profile_bounds(filters, params):
+    """
+    Turn a list of validated filters into (low, high, constrained) arrays.
+
+    Parameters:
+    - filters: One dict mapping parameter -> (low, high) per profile (see validate_profile).
+    - params: The parameter of each column of the month matrix.
+
+    Returns:
+    - low, high: float arrays of shape (profiles, params).
+    - constrained: bool array marking which parameters each profile filters on.
+    """
+    column = {p: j for j, p in enumerate(params)}
+    low = np.full((len(filters), len(params)), -np.inf)
+    high = np.full((len(filters), len(params)), np.inf)
+    constrained = np.zeros((len(filters), len(params)), dtype=bool)
+    for i, profile_filters in enumerate(filters):
+        for p, (lo, hi) in profile_filters.items():
+            j = column[p]
+            low[i, j], high[i, j], constrained[i, j] = lo, hi, True
+    return low, high, constrained
+
+
+def match_block(matrix, low, high, constrained):
+    """
+    Evaluate a block of profiles against every station.
+
+    The (block x stations x params) comparison is broadcast one parameter at a
+    time and ANDed into a (block x stations) result, so the temporaries never
+    hold the params axis.
+
+    Parameters:
+    - matrix: The (stations x params) matrix of one month.
+    - low, high, constrained: Arrays of shape (block, params) from profile_bounds.
+
+    Returns:
+    - A (block x stations) boolean array of matches.
+    """
+    matches = np.ones((low.shape[0], matrix.shape[0]), dtype=bool)
+    for j in np.flatnonzero(constrained.any(axis=0)):
+        values = matrix[None, :, j]
+        inside = (values >= low[:, j, None]) & (values <= high[:, j, None])
+        # Profiles that do not filter on this parameter pass, even where data is missing
+        inside |= ~constrained[:, j, None]
+        matches &= inside
+    return matches
+
+
+def iter_batch(engine, profiles, block_size=None, max_stations=MAX_STATIONS):
+    """
+    Score profiles in blocks and yield one result per profile, in input order.
+
+    Each block of consecutive profiles is grouped by month and every group is
+    evaluated against that month's station matrix (profiles x stations x
+    params); the block's results are then yielded in input order.
+
+    Parameters:
+    - engine: A RecommendationEngine.
+    - profiles: Iterable of profile dicts (see read_profiles).
+    - block_size: Number of profiles per block (defaults to PAIR_BUDGET / stations).
+    - max_stations: Maximum number of station names returned per profile.
+
+    Yields:
+    - Dicts with the profile's input 'index' and 'id', 'month', 'count',
+      'countries' and 'stations'. An invalid profile raises ValueError
+      (see validate_profile).
+    """
+    stations = engine.df_wide['Station'].to_numpy()
+    countries = engine.df_wide['Country'].to_numpy()
+    if block_size is None:
+        block_size = max(1, PAIR_BUDGET // max(1, len(stations)))
+
+    numbered = enumerate(profiles)
+    while True:
+        block = list(islice(numbered, block_size))
+        if not block:
+            return
+        parsed = [validate_profile(engine, profile, i) for i, profile in block]
+
+        by_month = defaultdict(list)
+        for k, (month, _) in enumerate(parsed):
+            by_month[month].append(k)
+        matched = [None] * len(block)
+        for month, positions in by_month.items():
+            matrix, params = engine.filter_engine.month_matrix(month)
+            bounds = profile_bounds([parsed[k][1] for k in positions], params)
+            for k, row_mask in zip(positions, match_block(matrix, *bounds)):
+                matched[k] = np.flatnonzero(row_mask)
+
+        for (i, profile), (month, _), rows in zip(block, parsed, matched):
+            shown = rows if max_stations is None else rows[:max_stations]
+            yield {
+                'index': i,
+                'id': profile.get('id'),
+                'month': month,
+                'count': int(rows.size),
+                'countries': sorted(set(countries[rows].tolist())),
+                'stations': stations[shown].tolist()
+            }
+
+
+def run_batch(engine, profiles_path, out_path, block_size=None, max_stations=MAX_STATIONS):
+    """
+    Score every profile in a file and stream one JSON line per profile to disk.
+
+    The file is validated in a first pass, so an invalid profile is reported
+    before anything is written; results are then written in input order (see
+    iter_batch).
+
+    Parameters:
+    - engine: A RecommendationEngine.
+    - profiles_path: JSON-lines file of profiles (see read_profiles).
+    - out_path: JSON-lines file to write results to.
+    - block_size: Number of profiles per block (defaults to PAIR_BUDGET / stations).
+    - max_stations: Maximum number of station names written per profile.
+
+    Returns:
+    - The number of profiles written.
+    """
+    for i, profile in enumerate(read_profiles(profiles_path)):
+        validate_profile(engine, profile, i)
+
+    n_written = 0
+    with open(out_path, 'w', encoding='utf-8') as out:
+        for result in iter_batch(engine, read_profiles(profiles_path), block_size, max_stations):
+            out.write(json.dumps(result, ensure_ascii=False) + '\n')
+            n_written += 1
+    return n_written
+
+
+if __name__ == '__main__':
+    # python batch_recommend.py profiles.jsonl results.jsonl [data.csv]
+    csv_path = sys.argv[3] if len(sys.argv) > 3 else 'data.csv'
+    n = run_batch(RecommendationEngine(csv_path), sys.argv[1], sys.argv[2])
+    print(f"Scored {n} profiles into {sys.argv[2]}")
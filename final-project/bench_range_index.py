@@ -0,0 +1,94 @@
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from filter_engine import FilterEngine
+from range_index import SortedRangeIndex
+
+#########################
+# Benchmark: boolean-mask filtering vs. FilterEngine vs. SortedRangeIndex
+#########################
+
+# Synthetic parameters for one month, with rough (mean, std) per parameter
+synthetic_params = {
+    'Precipitation (mm)': (80, 60),
+    'Number of Days with Precipitation ≥ 1 mm (#Days)': (8, 5),
+    'Mean Daily Maximum Temperature (degC)': (22, 9),
+    'Mean Daily Minimum Temperature (degC)': (12, 9),
+    'Mean Daily Mean Temperature (degC)': (17, 9),
+    'Mean Sea Level Pressure (hPa)': (1013, 5),
+    'Mean Vapor Pressure (hPa)': (14, 7),
+    'Total Number of Hours of Sunshine (Hours)': (200, 70)
+}
+
+# The default slider ranges of the app, plus one extra parameter
+bench_filters = {
+    'Mean Daily Mean Temperature (degC)': (18, 25),
+    'Precipitation (mm)': (0, 50),
+    'Total Number of Hours of Sunshine (Hours)': (150, 400)
+}
+
+month = 'Jul'
+
+
+def make_stations(n, seed=0):
+    """Generate a synthetic wide table with n stations for one month."""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'Station': [f"S{i}" for i in range(n)],
+        'Country': rng.choice(['A', 'B', 'C', 'D'], size=n),
+        'Latitude': rng.uniform(-60, 70, size=n),
+        'Longitude': rng.uniform(-180, 180, size=n)
+    })
+    for p, (mean, std) in synthetic_params.items():
+        df[f"{p}_{month}"] = rng.normal(mean, std, size=n)
+    return df
+
+
+def boolean_mask_filter(df_wide, filters):
+    """The original app path: copy the frame, then mask it once per parameter."""
+    filtered = df_wide.copy()
+    for p, (low, high) in filters.items():
+        col_name = f"{p}_{month}"
+        filtered = filtered[(filtered[col_name] >= low) & (filtered[col_name] <= high)]
+    return filtered
+
+
+def best_time(func, repeat=5):
+    """Return the best wall time of several runs, in milliseconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+
+def run(sizes=(6_000, 100_000, 1_000_000)):
+    print(f"{'stations':>10} {'mask (ms)':>10} {'engine (ms)':>12} {'sorted (ms)':>12} "
+          f"{'build (ms)':>11} {'matches':>8}")
+    for n in sizes:
+        df_wide = make_stations(n)
+        engine = FilterEngine(df_wide)
+
+        start = time.perf_counter()
+        index = SortedRangeIndex(engine.values, engine.value_columns)
+        build_ms = (time.perf_counter() - start) * 1000
+        ranges = [(f"{p}_{month}", low, high) for p, (low, high) in bench_filters.items()]
+
+        expected = boolean_mask_filter(df_wide, bench_filters).index.to_numpy()
+        assert np.array_equal(engine.filter_indices(bench_filters, month), expected)
+        assert np.array_equal(index.query(ranges), expected)
+
+        mask_ms = best_time(lambda: boolean_mask_filter(df_wide, bench_filters))
+        engine_ms = best_time(lambda: engine.filter_indices(bench_filters, month))
+        sorted_ms = best_time(lambda: index.query(ranges))
+        print(f"{n:>10} {mask_ms:>10.2f} {engine_ms:>12.2f} {sorted_ms:>12.2f} "
+              f"{build_ms:>11.1f} {len(expected):>8}")
+
+
+if __name__ == '__main__':
+    # python bench_range_index.py [n_stations ...]
+    run([int(n) for n in sys.argv[1:]] or (6_000, 100_000, 1_000_000))
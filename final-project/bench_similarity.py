@@ -0,0 +1,78 @@
+import sys
+import time
+
+import numpy as np
+
+from similarity_index import SimilarityIndex
+
+#########################
+# Benchmark: exact vs. IVF climate-similarity search (recall and latency)
+#########################
+
+# Features of one month's climate vector (the 8 parameters in param_list)
+n_features = 8
+
+# Synthetic climate zones: stations scatter around a zone's typical climate
+n_zones = 40
+
+# Fraction of missing values (the real table has gaps in several parameters)
+missing_fraction = 0.15
+
+n_queries = 100
+k = 10
+probe_counts = (1, 4, 8, 16, 32)
+
+
+def make_vectors(n, seed=0):
+    """Generate n clustered climate vectors with missing values."""
+    rng = np.random.default_rng(seed)
+    zones = rng.normal(0, 3, size=(n_zones, n_features))
+    vectors = zones[rng.integers(0, n_zones, size=n)] + rng.normal(0, 1, size=(n, n_features))
+    vectors = vectors * rng.uniform(1, 100, size=n_features) + rng.uniform(-50, 1000, size=n_features)
+    vectors[rng.random(vectors.shape) < missing_fraction] = np.nan
+    return vectors
+
+
+def recall(found, expected):
+    """Return the mean fraction of the exact neighbours that were found."""
+    hits = [len(np.intersect1d(f[f >= 0], e[e >= 0])) / max(np.count_nonzero(e >= 0), 1)
+            for f, e in zip(found, expected)]
+    return float(np.mean(hits))
+
+
+def run(sizes=(6_000, 100_000)):
+    print(f"{'stations':>10} {'mode':>12} {'ms/query':>9} {'recall@10':>10} {'build (s)':>10}")
+    for n in sizes:
+        vectors = make_vectors(n)
+        queries = np.arange(0, n, n // n_queries)[:n_queries]
+
+        start = time.perf_counter()
+        index = SimilarityIndex(vectors)
+        build_s = time.perf_counter() - start
+
+        # Exact search, one query at a time (the interactive case) and batched
+        start = time.perf_counter()
+        for q in queries:
+            index.search(vectors[q], k, exclude=q)
+        single_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        start = time.perf_counter()
+        expected, _ = index.search(vectors[queries], k, exclude=queries)
+        batch_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        print(f"{n:>10} {'exact':>12} {single_ms:>9.3f} {1.0:>10.3f} {build_s:>10.2f}")
+        print(f"{n:>10} {'exact batch':>12} {batch_ms:>9.3f} {1.0:>10.3f} {'':>10}")
+
+        start = time.perf_counter()
+        index.build_lists()
+        lists_s = time.perf_counter() - start
+        for n_probe in probe_counts:
+            start = time.perf_counter()
+            found = np.vstack([index.search(vectors[q], k, exclude=q, approximate=True, n_probe=n_probe)[0]
+                               for q in queries])
+            ivf_ms = (time.perf_counter() - start) * 1000 / len(queries)
+            build = f"{lists_s:>10.2f}" if n_probe == probe_counts[0] else f"{'':>10}"
+            print(f"{n:>10} {f'ivf/{n_probe}':>12} {ivf_ms:>9.3f} {recall(found, expected):>10.3f} {build}")
+
+
+if __name__ == '__main__':
+    # python bench_similarity.py [n_stations ...]
+    run([int(n) for n in sys.argv[1:]] or (6_000, 100_000))
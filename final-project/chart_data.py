@@ -0,0 +1,189 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import Counter, namedtuple
+from contextlib import contextmanager
+
+import altair as alt
+
+#########################
+# Out-of-line chart data: publish tables as content-hashed static assets
+#########################
+
+# Streamlit serves ./static at app/static when server.enableStaticServing is on
+# (see .streamlit/config.toml); generated data goes in its 'data' subfolder
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'data')
+STATIC_URL = 'app/static/data'
+
+# Published files are pruned least recently published first beyond these limits.
+# Files still referenced by a long-lived chart (the base map, cached chart specs)
+# are retained and never pruned, however old (see retain and release).
+MAX_FILES = 1000
+MAX_BYTES = 512 * 2**20
+
+# Reference counts of retained file names, shared by every session
+_retained = Counter()
+_retained_lock = threading.Lock()
+
+# Per-thread stack of name lists filled by recording()
+_recording = threading.local()
+
+# A published dataset: the URL the browser fetches and the columns it contains
+PublishedData = namedtuple('PublishedData', ['url', 'columns'])
+
+
+def publish_bytes(payload, prefix, extension='json', static_dir=STATIC_DIR, static_url=STATIC_URL):
+    """
+    Write a payload once under a content-hashed file name and return its URL.
+
+    Because the file name contains a hash of its contents, identical data maps
+    to the same URL on every rerun and the browser can serve it from its cache.
+    Publishing refreshes the file's modification time, which prune_static uses
+    to remove the least recently published files once the directory is full.
+
+    Parameters:
+    - payload: The bytes to publish.
+    - prefix: File name prefix (e.g. 'stations').
+    - extension: File name extension.
+    - static_dir: Directory served as static files.
+    - static_url: URL path under which static_dir is served.
+
+    Returns:
+    - A PublishedData(url, columns) tuple with columns set to None.
+    """
+    digest = hashlib.sha256(payload).hexdigest()[:16]
+    filename = f"{prefix}-{digest}.{extension}"
+    path = os.path.join(static_dir, filename)
+
+    for names in getattr(_recording, 'stack', ()):
+        names.append(filename)
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        os.makedirs(static_dir, exist_ok=True)
+        # A unique temporary name, as concurrent sessions may publish the same digest
+        with tempfile.NamedTemporaryFile(dir=static_dir, prefix=filename, suffix='.tmp', delete=False) as f:
+            f.write(payload)
+        os.replace(f.name, path)
+        prune_static(static_dir, keep={filename})
+
+    return PublishedData(f"{static_url}/{filename}", None)
+
+
+@contextmanager
+def recording():
+    """
+    Collect the file names published by this thread inside a with block.
+
+    Yields:
+    - A list that receives each published file name (nested blocks all receive it).
+    """
+    names = []
+    stack = _recording.__dict__.setdefault('stack', [])
+    stack.append(names)
+    try:
+        yield names
+    finally:
+        stack.remove(names)
+
+
+def retain(names):
+    """Protect published file names from pruning until they are released as often."""
+    with _retained_lock:
+        _retained.update(names)
+
+
+def release(names):
+    """Undo one retain() of each name."""
+    with _retained_lock:
+        _retained.subtract(names)
+        for name in set(names):
+            if _retained[name] <= 0:
+                del _retained[name]
+
+
+def prune_static(static_dir=STATIC_DIR, max_files=MAX_FILES, max_bytes=MAX_BYTES, keep=()):
+    """
+    Delete the least recently published files until the directory is within its limits.
+
+    Retained files (see retain) are never deleted.
+
+    Parameters:
+    - static_dir: Directory of published files.
+    - max_files: Maximum number of files kept.
+    - max_bytes: Maximum total size of the files kept.
+    - keep: File names that are never deleted either (e.g. the one just published).
+
+    Returns:
+    - The number of files deleted.
+    """
+    entries = []
+    for entry in os.scandir(static_dir):
+        # Temporary files belong to writes in progress
+        if entry.is_file() and not entry.name.endswith('.tmp'):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.name))
+    n_files, n_bytes = len(entries), sum(size for _, size, _ in entries)
+    with _retained_lock:
+        keep = set(keep) | set(_retained)
+
+    deleted = 0
+    for _, size, name in sorted(entries):
+        if n_files <= max_files and n_bytes <= max_bytes:
+            break
+        if name in keep:
+            continue
+        try:
+            os.remove(os.path.join(static_dir, name))
+            deleted += 1
+        except FileNotFoundError:
+            pass  # already pruned by another session
+        n_files -= 1
+        n_bytes -= size
+    return deleted
+
+
+def publish_dataset(df, prefix='stations', static_dir=STATIC_DIR, static_url=STATIC_URL):
+    """
+    Publish a dataframe as a content-hashed JSON file (see publish_bytes).
+
+    The Vega-Lite spec then only carries the URL instead of the rows.
+
+    Parameters:
+    - df: The dataframe to publish.
+    - prefix: File name prefix (e.g. 'stations').
+    - static_dir: Directory served as static files.
+    - static_url: URL path under which static_dir is served.
+
+    Returns:
+    - A PublishedData(url, columns) tuple.
+    """
+    payload = df.to_json(orient='records', double_precision=6).encode('utf-8')
+    published = publish_bytes(payload, prefix, 'json', static_dir, static_url)
+    return published._replace(columns=list(df.columns))
+
+
+def chart_source(published):
+    """Return the Altair data object that references a published dataset by URL."""
+    return alt.UrlData(url=published.url, format=alt.JsonDataFormat(type='json'))
+
+
+def range_filters(filters, selected_month):
+    """
+    Express slider ranges as Vega-Lite predicates over the shared dataset.
+
+    Parameters:
+    - filters: Dict mapping parameter -> (low, high).
+    - selected_month: The month selected by the user.
+
+    Returns:
+    - A list of inclusive range predicates, matching FilterEngine semantics.
+    """
+    return [
+        alt.FieldRangePredicate(field=f"{p}_{selected_month}", range=[float(low), float(high)])
+        for p, (low, high) in filters.items()
+    ]
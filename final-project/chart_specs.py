@@ -0,0 +1,86 @@
+from collections import OrderedDict
+from threading import Lock
+
+from chart_data import recording, release, retain
+
+#########################
+# Memoised chart building with LRU eviction and hit/miss counters
+#########################
+
+# Default number of (month, parameters, map settings) combinations kept
+MAX_ENTRIES = 64
+
+
+class ChartSpecCache:
+    """
+    LRU cache for the parts of the map that only depend on the month and the
+    chosen parameters (station layer, background, heatmap), so that moving a
+    slider only rebuilds the flags layer.
+
+    The cache is shared by every session of the app, hence the lock. Files
+    published while building an entry are retained (see chart_data.retain)
+    until the entry is evicted, so pruning never breaks a cached chart.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, build):
+        """
+        Return the cached value for key, calling build() on a miss.
+
+        Parameters:
+        - key: A hashable key, e.g. (selected_month, tuple(chosen_params), ...).
+        - build: A function with no arguments that builds the value.
+
+        Returns:
+        - The cached or newly built value.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+
+        # Build outside the lock so slow builds do not block other sessions
+        with recording() as published:
+            value = build()
+        retain(published)
+
+        with self._lock:
+            if key in self._entries:
+                # Another session built the same key meanwhile
+                release(self._entries[key][1])
+            self._entries[key] = (value, published)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                release(evicted)
+                self.evictions += 1
+        return value
+
+    def stats(self):
+        """Return the counters as a dict (for display or logging)."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / total if total else 0.0
+            }
+
+    def clear(self):
+        """Drop all entries and reset the counters."""
+        with self._lock:
+            for _, published in self._entries.values():
+                release(published)
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
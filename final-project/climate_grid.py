@@ -0,0 +1,243 @@
+import io
+import os
+import re
+import tempfile
+
+import numpy as np
+from matplotlib import colormaps
+from PIL import Image
+from scipy.spatial import cKDTree
+
+from spatial_index import EARTH_RADIUS_KM
+from wide_cache import default_cache_dir, source_hash
+from world_topology import natural_earth1, natural_earth1_inverse
+
+#########################
+# Interpolation of station values onto a regular lat/lon grid (raster map layer)
+#########################
+
+# Grid resolutions offered in the app, in degrees
+GRID_RESOLUTIONS = [0.25, 0.5, 1.0, 2.0]
+
+# Number of nearest stations blended into each grid cell
+N_NEIGHBOURS = 8
+
+# Cells further than this from every station are left empty (oceans, deserts)
+MAX_DISTANCE_KM = 500
+
+# Interpolation methods: inverse-distance weighting or a Gaussian kernel
+METHODS = ('idw', 'gaussian')
+IDW_POWER = 2
+BANDWIDTH_KM = 150
+
+# Grid rows interpolated per chunk; bounds the (cells x neighbours) temporaries
+CHUNK_ROWS = 64
+
+# uint8 code used for empty cells in quantised grids
+NODATA = 255
+
+
+def grid_axes(resolution):
+    """
+    Return the cell-centre latitudes (north to south) and longitudes of a global grid.
+
+    Parameters:
+    - resolution: Cell size in degrees (must divide 180).
+
+    Returns:
+    - A tuple (lat, lon) of 1-D arrays.
+    """
+    lat = 90 - resolution * (np.arange(int(round(180 / resolution))) + 0.5)
+    lon = -180 + resolution * (np.arange(int(round(360 / resolution))) + 0.5)
+    return lat, lon
+
+
+def unit_vectors(lat, lon):
+    """Convert latitude/longitude in degrees to 3-D points on the unit sphere."""
+    phi = np.radians(lat)
+    lam = np.radians(lon)
+    return np.column_stack([np.cos(phi) * np.cos(lam), np.cos(phi) * np.sin(lam), np.sin(phi)])
+
+
+def interpolate_grid(lat, lon, values, resolution, method='idw', k=N_NEIGHBOURS,
+                     max_distance_km=MAX_DISTANCE_KM, chunk_rows=CHUNK_ROWS):
+    """
+    Interpolate scattered station values onto a global lat/lon grid.
+
+    Stations are placed on the unit sphere in a KD-tree, so neighbour searches
+    use chord distances (monotonic in great-circle distance) and work across the
+    antimeridian and near the poles. The grid is processed in chunks of rows;
+    each chunk is one vectorised k-nearest query and one weighted sum.
+
+    Parameters:
+    - lat, lon: Arrays of station coordinates in degrees.
+    - values: Array of station values (NaN stations are ignored).
+    - resolution: Cell size in degrees.
+    - method: 'idw' (inverse-distance weighting) or 'gaussian' (kernel smoothing).
+    - k: Number of nearest stations per cell.
+    - max_distance_km: Only stations within this distance contribute.
+    - chunk_rows: Number of grid rows per chunk.
+
+    Returns:
+    - A float32 array of shape (len(grid lat), len(grid lon)), north row first,
+      with NaN where no station is close enough.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown method {method!r}; expected one of {METHODS}")
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~(np.isnan(values) | np.isnan(lat) | np.isnan(lon))
+    grid_lat, grid_lon = grid_axes(resolution)
+    grid = np.full((len(grid_lat), len(grid_lon)), np.nan, dtype=np.float32)
+    if not valid.any():
+        return grid
+
+    tree = cKDTree(unit_vectors(np.asarray(lat)[valid], np.asarray(lon)[valid]))
+    station_values = np.append(values[valid], 0.0)  # index n = "no neighbour"
+    k = min(k, int(valid.sum()))
+    max_chord = 2 * np.sin(max_distance_km / EARTH_RADIUS_KM / 2)
+
+    for start in range(0, len(grid_lat), chunk_rows):
+        rows = grid_lat[start:start + chunk_rows]
+        cell_lat = np.repeat(rows, len(grid_lon))
+        cell_lon = np.tile(grid_lon, len(rows))
+        chord, idx = tree.query(unit_vectors(cell_lat, cell_lon), k=k,
+                                distance_upper_bound=max_chord, workers=-1)
+        chord = chord.reshape(len(cell_lat), k)
+        idx = idx.reshape(len(cell_lat), k)
+
+        found = np.isfinite(chord)
+        km = 2 * np.arcsin(np.minimum(np.where(found, chord, 0.0) / 2, 1.0)) * EARTH_RADIUS_KM
+        if method == 'idw':
+            weights = 1.0 / np.maximum(km, 1e-3) ** IDW_POWER
+        else:
+            weights = np.exp(-0.5 * (km / BANDWIDTH_KM) ** 2)
+        weights[~found] = 0.0
+
+        total = weights.sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            chunk = (weights * station_values[idx]).sum(axis=1) / total
+        chunk[total == 0] = np.nan
+        grid[start:start + len(rows)] = chunk.reshape(len(rows), len(grid_lon))
+    return grid
+
+
+def grid_cache_path(csv_path, param, month, resolution, method, cache_dir=None):
+    """Return the .npy path caching one interpolated grid."""
+    if cache_dir is None:
+        cache_dir = default_cache_dir(csv_path)
+    slug = re.sub(r'[^A-Za-z0-9]+', '-', param).strip('-')
+    return os.path.join(cache_dir, 'grids',
+                        f"grid_{source_hash(csv_path)}_{slug}_{month}_{resolution:g}_{method}.npy")
+
+
+def load_climate_grid(csv_path, df_wide, param, month, resolution, method='idw', cache_dir=None):
+    """
+    Return the interpolated grid of one Parameter_Month, computing it on first use.
+
+    Grids are stored as float16 (half the size of float32, ample precision for
+    a colour scale) and memory-mapped when read back.
+
+    Parameters:
+    - csv_path: Path to the long-format source CSV (part of the cache key).
+    - df_wide: The wide dataframe built from csv_path.
+    - param, month: The Parameter_Month column to interpolate.
+    - resolution: Cell size in degrees.
+    - method: Interpolation method (see interpolate_grid).
+    - cache_dir: Optional cache directory (defaults to default_cache_dir(csv_path)).
+
+    Returns:
+    - A float16 array (north row first), NaN where empty.
+    """
+    path = grid_cache_path(csv_path, param, month, resolution, method, cache_dir)
+    if os.path.exists(path):
+        return np.load(path, mmap_mode='r')
+    grid = interpolate_grid(df_wide['Latitude'].to_numpy(), df_wide['Longitude'].to_numpy(),
+                            df_wide[f"{param}_{month}"].to_numpy(), resolution, method)
+    grid = grid.astype(np.float16)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # A unique temporary name, as concurrent sessions may build the same grid
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix='.tmp', delete=False) as f:
+        np.save(f, grid)
+    os.replace(f.name, path)
+    return grid
+
+
+def quantize(grid, vmin, vmax):
+    """
+    Map a grid onto uint8 colour-scale codes 0-254, with NODATA for empty cells.
+
+    Parameters:
+    - grid: A float array.
+    - vmin, vmax: The values mapped to the ends of the colour scale.
+
+    Returns:
+    - A uint8 array of the same shape.
+    """
+    span = vmax - vmin if vmax > vmin else 1.0
+    scaled = (np.asarray(grid, dtype=np.float32) - vmin) / span * (NODATA - 1)
+    codes = np.clip(np.nan_to_num(scaled, nan=0.0), 0, NODATA - 1).round().astype(np.uint8)
+    codes[np.isnan(grid)] = NODATA
+    return codes
+
+
+def colour_ramp(scheme='viridis', n=256):
+    """
+    Sample a Matplotlib colour map, shared by every raster layer of the map.
+
+    Parameters:
+    - scheme: Colour map name (the Vega-Lite legends use the same scheme).
+    - n: Number of colours.
+
+    Returns:
+    - A list of n (r, g, b) tuples of ints, the form datashader's cmap takes.
+    """
+    rgb = (colormaps[scheme](np.linspace(0, 1, n))[:, :3] * 255).round().astype(np.uint8)
+    return [tuple(c) for c in rgb.tolist()]
+
+
+def colour_table(scheme='viridis', opacity=0.8):
+    """Return a (256, 4) uint8 RGBA lookup table; the NODATA entry is transparent."""
+    table = np.zeros((NODATA + 1, 4), dtype=np.uint8)
+    table[:NODATA, :3] = colour_ramp(scheme, NODATA)
+    table[:NODATA, 3] = int(opacity * 255)
+    return table
+
+
+def projected_extent():
+    """Return the (x_min, x_max, y_min, y_max) extent of the Natural Earth I world."""
+    x_max, _ = natural_earth1(180, 0)
+    _, y_max = natural_earth1(0, 90)
+    return -float(x_max), float(x_max), -float(y_max), float(y_max)
+
+
+def render_projected(codes, resolution, width=1000, scheme='viridis'):
+    """
+    Resample a quantised lat/lon grid into a Natural Earth I image.
+
+    Every output pixel is inverse-projected to longitude/latitude and takes the
+    code of the grid cell it falls in, so the image lines up with the
+    pre-projected world map.
+
+    Parameters:
+    - codes: A uint8 grid from quantize (north row first).
+    - resolution: Cell size of the grid in degrees.
+    - width: Image width in pixels (the height follows the projection's aspect).
+    - scheme: Matplotlib colour map name.
+
+    Returns:
+    - PNG bytes.
+    """
+    x_min, x_max, y_min, y_max = projected_extent()
+    height = int(round(width * (y_max - y_min) / (x_max - x_min)))
+    x = x_min + (np.arange(width) + 0.5) * (x_max - x_min) / width
+    y = y_max - (np.arange(height) + 0.5) * (y_max - y_min) / height
+    lon, lat = natural_earth1_inverse(*np.meshgrid(x, y))
+
+    inside = (np.abs(lon) <= 180) & (np.abs(lat) <= 90)
+    row = np.clip(((90 - lat) / resolution).astype(np.int64), 0, codes.shape[0] - 1)
+    col = np.clip(((lon + 180) / resolution).astype(np.int64), 0, codes.shape[1] - 1)
+    pixels = np.where(inside, codes[row, col], NODATA)
+
+    buffer = io.BytesIO()
+    Image.fromarray(colour_table(scheme)[pixels], 'RGBA').save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
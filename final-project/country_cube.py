@@ -0,0 +1,158 @@
+import os
+import tempfile
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from wide_cache import default_cache_dir, source_hash
+
+#########################
+# Country x parameter x month rollup cube, precomputed once per source CSV
+#########################
+
+# Aggregates stored for every (country, parameter, month) cell
+CUBE_STATS = ('mean', 'min', 'max', 'count')
+
+# countries: sorted country names; station_country: each station's index into
+# countries; mean/min/max: float arrays (countries x params x months) with NaN
+# where a country has no data; count: int array of the stations with data
+CountryCube = namedtuple('CountryCube', ['countries', 'params', 'months', 'station_country',
+                                         'mean', 'min', 'max', 'count'])
+
+
+def build_country_cube(df_wide, params, months):
+    """
+    Aggregate the wide table into a country x parameter x month cube.
+
+    Stations are sorted by country once, and every statistic is computed for all
+    Parameter_Month columns at once with ufunc.reduceat over the country groups.
+
+    Parameters:
+    - df_wide: The wide dataframe (ID_COLUMNS followed by Parameter_Month columns).
+    - params: The parameters to aggregate, in order.
+    - months: The months to aggregate, in order.
+
+    Returns:
+    - A CountryCube.
+    """
+    station_country, countries = pd.factorize(df_wide['Country'], sort=True)
+    columns = [f"{p}_{m}" for p in params for m in months]
+    values = df_wide.reindex(columns=columns).to_numpy(dtype=np.float64)
+
+    order = np.argsort(station_country, kind='stable')
+    values = values[order]
+    starts = np.flatnonzero(np.r_[True, np.diff(station_country[order]) != 0])
+
+    valid = ~np.isnan(values)
+    count = np.add.reduceat(valid, starts, axis=0).astype(np.int64)
+    total = np.add.reduceat(np.where(valid, values, 0.0), starts, axis=0)
+    low = np.minimum.reduceat(np.where(valid, values, np.inf), starts, axis=0)
+    high = np.maximum.reduceat(np.where(valid, values, -np.inf), starts, axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+    empty = count == 0
+    low[empty] = high[empty] = mean[empty] = np.nan
+
+    shape = (len(countries), len(params), len(months))
+    return CountryCube(
+        countries=np.asarray(countries, dtype=str), params=list(params), months=list(months),
+        station_country=station_country.astype(np.int32),
+        mean=mean.reshape(shape), min=low.reshape(shape), max=high.reshape(shape),
+        count=count.reshape(shape)
+    )
+
+
+def save_country_cube(cube, path):
+    """Write a CountryCube to an .npz file (atomically, through a uniquely named temporary file)."""
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path) or '.', suffix='.tmp', delete=False) as f:
+        np.savez(f, countries=cube.countries, params=np.asarray(cube.params, dtype=str),
+                 months=np.asarray(cube.months, dtype=str), station_country=cube.station_country,
+                 mean=cube.mean, min=cube.min, max=cube.max, count=cube.count)
+    os.replace(f.name, path)
+
+
+def read_country_cube(path):
+    """Read a CountryCube written by save_country_cube."""
+    with np.load(path, allow_pickle=False) as data:
+        return CountryCube(
+            countries=data['countries'], params=data['params'].tolist(),
+            months=data['months'].tolist(), station_country=data['station_country'],
+            mean=data['mean'], min=data['min'], max=data['max'], count=data['count']
+        )
+
+
+def load_country_cube(csv_path, df_wide, params, months, cache_dir=None):
+    """
+    Return the country cube for a source CSV, computing it on first use.
+
+    Like the statistics index, the cube shares the wide table's cache key, so
+    it is rebuilt exactly when the wide table is.
+
+    Parameters:
+    - csv_path: Path to the long-format source CSV.
+    - df_wide: The wide dataframe built from csv_path.
+    - params, months: The parameters and months to aggregate.
+    - cache_dir: Optional cache directory (defaults to default_cache_dir(csv_path)).
+
+    Returns:
+    - A CountryCube.
+    """
+    if cache_dir is None:
+        cache_dir = default_cache_dir(csv_path)
+    path = os.path.join(cache_dir, f"cube_{source_hash(csv_path)}.npz")
+    if os.path.exists(path):
+        cube = read_country_cube(path)
+        if cube.params == list(params) and cube.months == list(months):
+            return cube
+    cube = build_country_cube(df_wide, params, months)
+    os.makedirs(cache_dir, exist_ok=True)
+    save_country_cube(cube, path)
+    return cube
+
+
+def country_frame(cube, month, params, stat='mean'):
+    """
+    Return one statistic of the cube for a month as a country-indexed dataframe.
+
+    Parameters:
+    - cube: A CountryCube.
+    - month: The month abbreviation.
+    - params: The parameters to include (one column each).
+    - stat: One of CUBE_STATS.
+
+    Returns:
+    - A dataframe with a 'Country' column, a 'Stations' column (stations with
+      data for the first parameter) and one column per parameter.
+    """
+    if stat not in CUBE_STATS:
+        raise ValueError(f"Unknown statistic {stat!r}; expected one of {CUBE_STATS}")
+    m = cube.months.index(month)
+    j = [cube.params.index(p) for p in params]
+    values = getattr(cube, stat)[:, j, m]
+    frame = pd.DataFrame(values, columns=list(params))
+    frame.insert(0, 'Country', cube.countries)
+    frame.insert(1, 'Stations', cube.count[:, j[0], m] if j else 0)
+    return frame
+
+
+def matching_countries(cube, month, filters, stat='mean'):
+    """
+    Return the positions of countries whose aggregate satisfies every range.
+
+    Parameters:
+    - cube: A CountryCube.
+    - month: The month abbreviation.
+    - filters: Dict mapping parameter -> (low, high).
+    - stat: The statistic compared with the ranges ('mean', 'min' or 'max').
+
+    Returns:
+    - A sorted array of positions into cube.countries.
+    """
+    m = cube.months.index(month)
+    values = getattr(cube, stat)
+    keep = np.ones(len(cube.countries), dtype=bool)
+    for p, (low, high) in filters.items():
+        column = values[:, cube.params.index(p), m]
+        keep &= (column >= low) & (column <= high)
+    return np.flatnonzero(keep)
@@ -0,0 +1,265 @@
+import numpy as np
+
+from range_index import SortedRangeIndex
+from wide_cache import ID_COLUMNS
+
+#########################
+# Vectorised multi-criterion range filter over the wide table
+#########################
+
+
+def estimate_selectivity(entry, low, high):
+    """
+    Estimate the fraction of stations whose value lies in [low, high].
+
+    Parameters:
+    - entry: A statistics dict with 'min', 'max', 'count', 'bin_edges' and 'hist'
+      (see stats_index.py), or a dict with only 'min' and 'max'.
+    - low, high: The range selected on the slider.
+
+    Returns:
+    - A number between 0 and 1 (smaller means more selective).
+    """
+    if entry is None or entry.get('min') is None:
+        return 1.0
+    col_min, col_max = entry['min'], entry['max']
+    if high < col_min or low > col_max:
+        return 0.0
+
+    edges = entry.get('bin_edges')
+    if edges and entry.get('count'):
+        # Sum the histogram bins covered by the range, pro-rating the partial ones
+        edges = np.asarray(edges)
+        hist = np.asarray(entry['hist'], dtype=np.float64)
+        widths = np.maximum(edges[1:] - edges[:-1], 1e-12)
+        overlap = np.clip(np.minimum(edges[1:], high) - np.maximum(edges[:-1], low), 0, None)
+        return float((hist * np.minimum(overlap / widths, 1.0)).sum() / entry['count'])
+
+    # Without a histogram assume values are uniform between min and max
+    span = col_max - col_min
+    if span <= 0:
+        return 1.0
+    return (min(high, col_max) - max(low, col_min)) / span
+
+
+def month_slice(positions):
+    """
+    Express evenly spaced column positions as a slice, so indexing returns a view.
+
+    Parameters:
+    - positions: Increasing column positions (a month's columns are 12 apart,
+      as the wide table is sorted by parameter then month).
+
+    Returns:
+    - A slice, or the positions themselves if they are not evenly spaced.
+    """
+    steps = set(np.diff(positions).tolist())
+    if len(positions) == 0 or len(steps) > 1 or 0 in steps:
+        return positions
+    step = steps.pop() if steps else 1
+    return slice(positions[0], positions[-1] + 1, step)
+
+
+class PredicateBitmaps:
+    """
+    Per-session cache of packed bitmaps, one per active Parameter_Month predicate.
+
+    Each entry maps a column name to ((low, high), bitmap), where bitmap is the
+    np.packbits of the predicate's boolean mask over all stations. When a single
+    slider moves only that entry is recomputed; the others are reused and ANDed.
+    """
+
+    def __init__(self):
+        self._bitmaps = {}
+        self.recomputed = 0
+        self.reused = 0
+
+    def get(self, col_name, bounds):
+        """Return the cached bitmap for a column if it was built for the same bounds."""
+        entry = self._bitmaps.get(col_name)
+        if entry is not None and entry[0] == bounds:
+            self.reused += 1
+            return entry[1]
+        return None
+
+    def put(self, col_name, bounds, bitmap):
+        """Store the bitmap computed for a column and bounds."""
+        self.recomputed += 1
+        self._bitmaps[col_name] = (bounds, bitmap)
+
+    def retain(self, col_names):
+        """Drop bitmaps for predicates that are no longer active."""
+        for col_name in list(self._bitmaps):
+            if col_name not in col_names:
+                del self._bitmaps[col_name]
+
+
+class FilterEngine:
+    """
+    Evaluate slider range filters directly on the wide table's float64 matrix.
+
+    The Parameter_Month block of df_wide is used as is (the memory-mapped cache
+    when it comes from load_wide_table), and each month is a strided
+    (stations x params) view of it. The predicates are applied most selective
+    first: the first one scans a full column, later ones only look at the
+    surviving row positions. The result is an array of row positions, so
+    neither the dataframe nor the matrix is ever copied.
+    """
+
+    def __init__(self, df_wide, stats=None, use_range_index=False):
+        """
+        Parameters:
+        - df_wide: The wide dataframe (ID_COLUMNS followed by Parameter_Month columns).
+        - stats: Optional statistics index used for selectivity estimates.
+        - use_range_index: Build a SortedRangeIndex so filter_indices answers each
+          predicate with binary searches instead of a column scan.
+        """
+        self.value_columns = [c for c in df_wide.columns if c not in ID_COLUMNS]
+        self.column_positions = {c: j for j, c in enumerate(self.value_columns)}
+        # No dtype argument: the cached block is already float64 and is returned as a view
+        self.values = df_wide[self.value_columns].to_numpy()
+        self.n_rows = self.values.shape[0]
+        self.stats = stats
+        self._month_matrices = {}
+        self.range_index = None
+        if use_range_index:
+            self.range_index = SortedRangeIndex(self.values, self.value_columns)
+
+    def month_matrix(self, month):
+        """
+        Return the (stations x params) matrix for one month.
+
+        Parameters:
+        - month: The selected month.
+
+        Returns:
+        - A tuple (matrix, params) where matrix is a view of self.values and
+          params lists the parameter of each column (cached per month).
+        """
+        cached = self._month_matrices.get(month)
+        if cached is None:
+            suffix = f"_{month}"
+            columns = [c for c in self.value_columns if c.endswith(suffix)]
+            params = [c[:-len(suffix)] for c in columns]
+            positions = [self.column_positions[c] for c in columns]
+            cached = (self.values[:, month_slice(positions)], params)
+            self._month_matrices[month] = cached
+        return cached
+
+    def _column_stats(self, col_name, column):
+        """Return stats for a column, falling back to its min/max."""
+        if self.stats is not None and col_name in self.stats:
+            return self.stats[col_name]
+        if np.isnan(column).all():
+            return None
+        return {'min': float(np.nanmin(column)), 'max': float(np.nanmax(column))}
+
+    def order_predicates(self, filters, month):
+        """
+        Sort the active predicates from most to least selective.
+
+        Parameters:
+        - filters: Dict mapping parameter -> (low, high).
+        - month: The selected month.
+
+        Returns:
+        - A list of (column index in month_matrix, low, high) tuples.
+        """
+        matrix, params = self.month_matrix(month)
+        scored = []
+        for j, p in enumerate(params):
+            if p not in filters:
+                continue
+            low, high = filters[p]
+            entry = self._column_stats(f"{p}_{month}", matrix[:, j])
+            scored.append((estimate_selectivity(entry, low, high), j, low, high))
+        scored.sort(key=lambda item: item[0])
+        return [(j, low, high) for _, j, low, high in scored]
+
+    def filter_indices(self, filters, month):
+        """
+        Return the row positions of stations that satisfy every range filter.
+
+        Parameters:
+        - filters: Dict mapping parameter -> (low, high), as built from the sliders.
+        - month: The selected month.
+
+        Returns:
+        - A sorted int64 array of row positions into df_wide.
+        """
+        if self.range_index is not None:
+            return self.range_index.query([
+                (f"{p}_{month}", low, high) for p, (low, high) in filters.items()
+                if f"{p}_{month}" in self.column_positions
+            ])
+
+        predicates = self.order_predicates(filters, month)
+        if not predicates:
+            return np.arange(self.n_rows)
+        matrix, _ = self.month_matrix(month)
+
+        # The most selective predicate scans its whole column
+        j, low, high = predicates[0]
+        column = matrix[:, j]
+        rows = np.flatnonzero((column >= low) & (column <= high))
+
+        # The others only gather the rows that are still candidates
+        for j, low, high in predicates[1:]:
+            if rows.size == 0:
+                break
+            values = matrix[rows, j]
+            rows = rows[(values >= low) & (values <= high)]
+
+        return rows
+
+    def predicate_bitmap(self, param, month, low, high):
+        """
+        Compute the packed bitmap of stations with low <= value <= high.
+
+        Parameters:
+        - param: The climate parameter.
+        - month: The selected month.
+        - low, high: The slider range.
+
+        Returns:
+        - A uint8 array of ceil(n_rows / 8) bytes (see np.packbits).
+        """
+        matrix, params = self.month_matrix(month)
+        column = matrix[:, params.index(param)]
+        return np.packbits((column >= low) & (column <= high))
+
+    def filter_indices_incremental(self, filters, month, bitmaps):
+        """
+        Like filter_indices, but reuse per-predicate bitmaps between reruns.
+
+        Only predicates whose (low, high) changed since the previous call are
+        re-evaluated; the result is the AND of all cached bitmaps, so moving one
+        slider costs one column comparison plus a few byte-wise ANDs.
+
+        Parameters:
+        - filters: Dict mapping parameter -> (low, high), as built from the sliders.
+        - month: The selected month.
+        - bitmaps: A PredicateBitmaps instance kept in the user's session.
+
+        Returns:
+        - A sorted int64 array of row positions into df_wide.
+        """
+        _, params = self.month_matrix(month)
+        active = {f"{p}_{month}": p for p in filters if p in params}
+        bitmaps.retain(active)
+        if not active:
+            return np.arange(self.n_rows)
+
+        combined = None
+        for col_name, p in active.items():
+            bounds = (float(filters[p][0]), float(filters[p][1]))
+            bitmap = bitmaps.get(col_name, bounds)
+            if bitmap is None:
+                bitmap = self.predicate_bitmap(p, month, *bounds)
+                bitmaps.put(col_name, bounds, bitmap)
+            if combined is None:
+                combined = bitmap.copy()
+            else:
+                np.bitwise_and(combined, bitmap, out=combined)
+
+        return np.flatnonzero(np.unpackbits(combined, count=self.n_rows))
@@ -1,9 +1,21 @@
+import numpy as np
 import pandas as pd
 import altair as alt
 import streamlit as st
-from vega_datasets import data
+import os
 import urllib.parse  # for URL encoding
 
+from chart_data import PublishedData, chart_source, publish_bytes, publish_dataset, range_filters, recording, retain
+from chart_specs import ChartSpecCache
+from climate_grid import GRID_RESOLUTIONS, projected_extent, quantize, render_projected
+from filter_engine import PredicateBitmaps
+from map_lod import POINT_BUDGET, level_of_detail
+from recommend_server import start_in_background
+from recommender import RecommendationEngine, default_conditions, months, param_list
+from spatial_index import radius_viewport
+from stats_index import get_column_stats
+from world_topology import available_levels, natural_earth1, topology_data
+
 #########################
 # Initial Setup and Data Preparation
 #########################
@@ -15,97 +27,164 @@ st.set_page_config(
     initial_sidebar_state="collapsed"  # Start with the sidebar collapsed
 )
 
-# Load the dataset from a CSV file with caching for performance
-@st.cache_data
+# Load the recommendation engine (wide table, statistics, filters) once.
+# cache_resource keeps one shared instance instead of pickling a copy per rerun.
+@st.cache_resource
 def load_data():
-    df = pd.read_csv('data.csv')
-    return df
-
-df = load_data()
+    engine = RecommendationEngine('data.csv')
+    # Optionally serve the same engine over HTTP (see recommend_server.py)
+    if os.environ.get('RECOMMENDER_PORT'):
+        start_in_background(engine, port=int(os.environ['RECOMMENDER_PORT']))
+    return engine
 
-# Disable the maximum row limit for Altair to handle large datasets
-alt.data_transformers.disable_max_rows()
+engine = load_data()
+df_wide, stats = engine.df_wide, engine.stats
 
-# List of climate parameters to consider
-param_list = [
-    'Precipitation (mm)',
-    'Number of Days with Precipitation ≥ 1 mm (#Days)',
-    'Mean Daily Maximum Temperature (degC)',
-    'Mean Daily Minimum Temperature (degC)',
-    'Mean Daily Mean Temperature (degC)',
-    'Mean Sea Level Pressure (hPa)',
-    'Mean Vapor Pressure (hPa)',
-    'Total Number of Hours of Sunshine (Hours)'
-]
+# One chart cache shared by all sessions (see chart_specs.py)
+@st.cache_resource
+def load_spec_cache():
+    return ChartSpecCache()
 
-# List of months for selection
-months = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 
-          'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+spec_cache = load_spec_cache()
 
-# Load the world map data for the background of the heatmap
-world_map = alt.topo_feature(data.world_110m.url, feature="countries")
+# Disable the maximum row limit for Altair to handle large datasets
+alt.data_transformers.disable_max_rows()
 
-# Convert the data from wide to long format for easier manipulation
-df_long = df.melt(
-    id_vars=['Station', 'Country', 'Latitude', 'Longitude', 'Parameter'], 
-    var_name='Month', 
-    value_name='Value'
+# Load the world map data for the background of the heatmap from the bundled
+# topology, optionally pre-projected so the browser does not re-project it.
+# The published file is retained for as long as this cached resource lives.
+@st.cache_resource
+def load_world_map(level, projected):
+    with recording() as published:
+        world_map = topology_data(level, projected)
+    retain(published)
+    return world_map
+
+map_levels = available_levels()
+map_level = st.sidebar.selectbox(
+    "Map detail",
+    options=map_levels,
+    index=map_levels.index('110m') if '110m' in map_levels else 0
 )
-
-# Combine Parameter and Month into a single column for pivoting
-df_long['Parameter_Month'] = df_long['Parameter'] + '_' + df_long['Month']
-
-# Pivot the long dataframe back to wide format, now with Parameter_Month as columns
-df_wide = df_long.pivot_table(
-    index=['Station', 'Country', 'Latitude', 'Longitude'], 
-    columns='Parameter_Month', 
-    values='Value'
-).reset_index()
-
-# Remove the hierarchical column index created by pivot_table
-df_wide.columns.name = None
-
-# Remove any columns that contain '_Elem' in their name
-df_wide = df_wide.loc[:, ~df_wide.columns.str.contains('_Elem')]
-
-# Define default optimal conditions for temperature and precipitation
-default_conditions = {
-    'Mean Daily Mean Temperature (degC)': (18, 25),  # Optimal temperature range in °C
-    'Precipitation (mm)': (0, 50)                    # Optimal precipitation range in mm
-}
+pre_projected = st.sidebar.checkbox("Pre-projected map", value=True)
+world_map = load_world_map(map_level, pre_projected)
+
+# Draw the climate values as station circles or as an interpolated raster
+climate_layer = st.sidebar.selectbox(
+    "Climate layer",
+    options=["Stations", "Interpolated grid", "Pre-rendered tiles"],
+    help="Pre-rendered tiles are built offline with `python tile_pyramid.py`."
+)
+grid_resolution = None
+if climate_layer == "Interpolated grid":
+    if pre_projected:
+        grid_resolution = st.sidebar.selectbox(
+            "Grid resolution (degrees)", options=GRID_RESOLUTIONS, index=GRID_RESOLUTIONS.index(0.5)
+        )
+    else:
+        st.sidebar.caption("The interpolated grid is drawn on the pre-projected map only.")
+
+# Stations can be drawn as Vega-Lite circles or aggregated server-side into one image
+renderer = 'altair'
+if climate_layer == "Stations":
+    renderer = st.sidebar.radio(
+        "Station renderer",
+        options=['altair', 'datashader'],
+        format_func={'altair': "Altair (vector circles)", 'datashader': "Datashader (server-side image)"}.get,
+        help="Datashader draws every station into a fixed-size image, so the browser cost "
+             "no longer grows with the number of stations."
+    )
+    if renderer == 'datashader' and not pre_projected:
+        st.sidebar.caption("The datashader renderer is drawn on the pre-projected map only.")
 
 #########################
 # Function Definitions
 #########################
 
-def get_min_max(df, param, month):
+def plot_density(stats, param, month):
     """
-    Calculate the minimum and maximum values for a specific parameter and month.
+    Draw a small histogram of the data density for a slider.
     
     Parameters:
-    - df: The dataframe containing the data.
-    - param: The climate parameter (e.g., 'Precipitation (mm)').
-    - month: The month for which to calculate the min and max.
+    - stats: The precomputed statistics index.
+    - param: The climate parameter.
+    - month: The selected month.
     
     Returns:
-    - A tuple containing (min_value, max_value).
+    - An Altair bar chart, or None if the column has no data.
     """
-    col_name = f"{param}_{month}"
-    if col_name in df.columns:
-        return float(df[col_name].min()), float(df[col_name].max())
-    return None, None
+    entry = get_column_stats(stats, param, month)
+    if entry is None:
+        return None
+    edges = entry['bin_edges']
+    bins = pd.DataFrame({
+        'start': edges[:-1],
+        'end': edges[1:],
+        'count': entry['hist']
+    })
+    return alt.Chart(bins).mark_bar(color='lightgray').encode(
+        x=alt.X('start:Q', title=None, axis=None),
+        x2='end:Q',
+        y=alt.Y('count:Q', title=None, axis=None),
+        tooltip=[alt.Tooltip('count:Q', title='Stations')]
+    ).properties(height=40)
+
+def map_position(projected):
+    """
+    Return the position encodings and projection used by the map layers.
+    
+    Parameters:
+    - projected: Whether the layers carry pre-projected 'x'/'y' columns.
+    
+    Returns:
+    - A tuple (encodings, projection) to pass to encode() and project().
+    """
+    if projected:
+        return {'longitude': 'x:Q', 'latitude': 'y:Q'}, {'type': 'identity', 'reflectY': True}
+    return {'longitude': 'Longitude:Q', 'latitude': 'Latitude:Q'}, {'type': 'naturalEarth1'}
 
-def plot_heatmap(selected_month, filtered_df, chosen_params):
+def viewport_fit(viewport, projected):
     """
-    Generate an Altair heatmap based on the selected month and chosen parameters.
+    Return a GeoJSON feature the map projection is fitted to, or None for the world.
+    
+    Parameters:
+    - viewport: A (lon_min, lon_max, lat_min, lat_max) box, or None.
+    - projected: Whether the map layers are pre-projected.
+    
+    Returns:
+    - A MultiPoint feature sampled over the box (so the fit follows the curved
+      Natural Earth edges), or None if there is no viewport or it crosses the
+      antimeridian.
+    """
+    if viewport is None or viewport[0] > viewport[1]:
+        return None
+    lon_min, lon_max, lat_min, lat_max = viewport
+    lon, lat = np.meshgrid(np.linspace(lon_min, lon_max, 5), np.linspace(lat_min, lat_max, 5))
+    lon, lat = lon.ravel(), lat.ravel()
+    if projected:
+        lon, lat = natural_earth1(lon, lat)
+    return {
+        'type': 'Feature',
+        'properties': {},
+        'geometry': {'type': 'MultiPoint', 'coordinates': np.column_stack([lon, lat]).tolist()}
+    }
+
+def with_projected_xy(df):
+    """Add Natural Earth I 'x'/'y' columns matching the pre-projected map."""
+    x, y = natural_earth1(df['Longitude'].to_numpy(), df['Latitude'].to_numpy())
+    return df.assign(x=x, y=y)
+
+def chart_columns(selected_month, columns, chosen_params):
+    """
+    Pick the color and size columns of the heatmap.
     
     Parameters:
     - selected_month: The month selected by the user.
-    - filtered_df: The dataframe filtered based on user inputs.
+    - columns: The columns available in the station data.
     - chosen_params: List of parameters selected by the user.
     
     Returns:
-    - An Altair chart object representing the heatmap.
+    - A tuple (color_column, size_column).
     """
     # Define default color and size parameters
     color_param = 'Mean Daily Mean Temperature (degC)'
@@ -116,21 +195,60 @@ def plot_heatmap(selected_month, filtered_df, chosen_params):
     size_column = f"{size_param}_{selected_month}"
 
     # If the default columns are not present, use the first chosen parameter
-    if color_column not in filtered_df.columns and len(chosen_params) > 0:
+    if color_column not in columns and len(chosen_params) > 0:
         color_column = f"{chosen_params[0]}_{selected_month}"
-    if size_column not in filtered_df.columns and len(chosen_params) > 0:
+    if size_column not in columns and len(chosen_params) > 0:
         size_column = f"{chosen_params[0]}_{selected_month}"
 
-    # Create the background map
-    background = alt.Chart(world_map).mark_geoshape(
-        fill='lightgray',
-        stroke='white'
-    ).project('naturalEarth1').properties(
-        width=1000,
-        height=600
-    )
+    return color_column, size_column
 
-    # Define the tooltip information to display on hover
+def prepare_station_data(df, selected_month, chosen_params, point_budget=POINT_BUDGET, projected=False,
+                         viewport=None, publish=True):
+    """
+    Reduce the station table to what the map needs and publish it as a static asset.
+    
+    Parameters:
+    - df: The wide dataframe.
+    - selected_month: The month selected by the user.
+    - chosen_params: List of parameters selected by the user.
+    - point_budget: Maximum number of circles to draw; denser station sets are
+      binned into a lat/lon grid server-side (see map_lod.py).
+    - projected: Add pre-projected 'x'/'y' columns for the pre-projected map.
+    - viewport: Optional (lon_min, lon_max, lat_min, lat_max) box; only the
+      stations inside it (looked up with the engine's spatial index) are sent.
+    - publish: Write the table out; when False (the stations are drawn as a
+      server-side image) only its columns are returned, with url None.
+    
+    Returns:
+    - A tuple (station_data, cell_size): the PublishedData for the map layers and
+      the grid cell size in degrees, or None if stations are shown individually.
+    """
+    if viewport is not None:
+        df = df.iloc[engine.viewport_rows(viewport)]
+    color_column, size_column = chart_columns(selected_month, df.columns, chosen_params)
+    value_columns = [color_column, size_column] + [f"{p}_{selected_month}" for p in chosen_params]
+    value_columns = [c for c in dict.fromkeys(value_columns) if c in df.columns]
+
+    # Only ship as many marks as the point budget allows
+    plot_df, cell_size = level_of_detail(df, value_columns, point_budget)
+    if projected:
+        plot_df = with_projected_xy(plot_df)
+    if not publish:
+        return PublishedData(None, list(plot_df.columns)), cell_size
+    return publish_dataset(plot_df, 'stations'), cell_size
+
+def station_tooltips(selected_month, columns, chosen_params):
+    """
+    Build the tooltip list shared by the heatmap and the flags.
+    
+    Parameters:
+    - selected_month: The month selected by the user.
+    - columns: The columns available in the station data.
+    - chosen_params: List of parameters selected by the user.
+    
+    Returns:
+    - A list of Altair tooltips.
+    """
     tooltip_list = [
         alt.Tooltip('Station:N', title='Station'),
         alt.Tooltip('Country:N', title='Country'),
@@ -139,21 +257,150 @@ def plot_heatmap(selected_month, filtered_df, chosen_params):
     ]
     for p in chosen_params:
         col = f"{p}_{selected_month}"
-        if col in filtered_df.columns:
+        if col in columns:
             tooltip_list.append(alt.Tooltip(col + ":Q", title=p))
+    return tooltip_list
 
-    # Create the heatmap layer with legends
-    heatmap = alt.Chart(filtered_df).mark_circle().encode(
-        longitude='Longitude:Q',
-        latitude='Latitude:Q',
+def prepare_grid_image(selected_month, color_column, resolution):
+    """
+    Interpolate the color column onto a grid and publish it as a projected PNG.
+    
+    Parameters:
+    - selected_month: The month selected by the user.
+    - color_column: The Parameter_Month column drawn as colors.
+    - resolution: Grid cell size in degrees.
+    
+    Returns:
+    - A tuple (image, domain): the PublishedData of the PNG and the (min, max)
+      of the color scale, or (None, None) if the column has no data that month.
+    """
+    param = color_column[:-len(selected_month) - 1]
+    domain = engine.get_min_max(param, selected_month)
+    if domain[0] is None:
+        return None, None
+    grid = engine.climate_grid(param, selected_month, resolution)
+    image = publish_bytes(render_projected(quantize(grid, *domain), resolution), 'grid', 'png')
+    return image, domain
+
+def prepare_shaded_image(selected_month, color_column, viewport=None):
+    """
+    Aggregate every station into a datashader image and publish it as a PNG.
+    
+    Parameters:
+    - selected_month: The month selected by the user.
+    - color_column: The Parameter_Month column drawn as colors.
+    - viewport: Optional box; only this area is rendered, at full image size.
+    
+    Returns:
+    - A tuple (image, domain, extent): the PublishedData of the PNG, the (min, max)
+      of the color scale and the projected extent the image covers.
+    """
+    # Imported here so datashader is only loaded when this renderer is chosen
+    from shaded_points import render_points, viewport_extent
+
+    param = color_column[:-len(selected_month) - 1]
+    domain = engine.get_min_max(param, selected_month)
+    extent = viewport_extent(viewport)
+    x, y = natural_earth1(df_wide['Longitude'].to_numpy(), df_wide['Latitude'].to_numpy())
+    png = render_points(x, y, df_wide[color_column].to_numpy(), extent, domain)
+    return publish_bytes(png, 'points', 'png'), domain, extent
+
+def plot_heatmap(selected_month, station_data, chosen_params, cell_size=None, projected=False, viewport=None,
+                 grid_resolution=None, renderer='altair'):
+    """
+    Generate an Altair heatmap based on the selected month and chosen parameters.
+    
+    Parameters:
+    - selected_month: The month selected by the user.
+    - station_data: The PublishedData returned by prepare_station_data.
+    - chosen_params: List of parameters selected by the user.
+    - cell_size: Grid cell size if the stations were binned, else None.
+    - projected: Whether world_map and station_data are pre-projected.
+    - viewport: Optional box to zoom the map to (see viewport_fit).
+    - grid_resolution: When set (pre-projected map only), draw the color column
+      as an interpolated raster of this resolution instead of station circles.
+    - renderer: 'altair' draws one circle per station; 'datashader' (pre-projected
+      map only) draws all stations into one server-side image.
+    
+    Returns:
+    - An Altair chart object representing the heatmap.
+    """
+    color_column, size_column = chart_columns(selected_month, station_data.columns, chosen_params)
+    position, projection = map_position(projected)
+    fit = viewport_fit(viewport, projected)
+    if fit is not None:
+        projection = dict(projection, fit=fit)
+
+    # Create the background map
+    background = alt.Chart(world_map).mark_geoshape(
+        fill='lightgray',
+        stroke='white',
+        clip=True
+    ).project(**projection).properties(
+        width=1000,
+        height=600
+    )
+
+    # Define the tooltip information to display on hover
+    tooltip_list = station_tooltips(selected_month, station_data.columns, chosen_params)
+    if cell_size is not None:
+        tooltip_list.append(alt.Tooltip('Stations:Q', title=f"Stations in {cell_size}° cell"))
+
+    image = None
+    if grid_resolution is not None and projected:
+        image, domain = prepare_grid_image(selected_month, color_column, grid_resolution)
+        if image is None:
+            # No data to interpolate: leave the raster layer empty
+            return background
+        extent = projected_extent()
+    elif renderer == 'datashader' and projected:
+        image, domain, extent = prepare_shaded_image(selected_month, color_column, viewport)
+
+    if image is not None:
+        # One image stretched over its projected extent: its pixel corners come
+        # from the chart's own projection, so it follows any fit/zoom
+        x_min, x_max, y_min, y_max = extent
+        bounds = ("geoBounds('projection', {type: 'Feature', geometry: {type: 'MultiPoint', "
+                  f"coordinates: [[{x_min}, {y_min}], [{x_max}, {y_max}]]}}}})")
+        raster = alt.Chart(pd.DataFrame({'url': [image.url]})).mark_image(
+            aspect=False,
+            clip=True,
+            x=alt.expr(f"{bounds}[0][0]"),
+            y=alt.expr(f"{bounds}[0][1]"),
+            x2=alt.expr(f"{bounds}[1][0]"),
+            y2=alt.expr(f"{bounds}[1][1]")
+        ).encode(url='url:N')
+        # Redraw the borders on top of the raster and keep a color legend
+        borders = alt.Chart(world_map).mark_geoshape(
+            filled=False,
+            stroke='white',
+            strokeWidth=0.5,
+            clip=True
+        ).project(**projection)
+        legend = alt.Chart(pd.DataFrame({color_column: list(domain)})).mark_circle(opacity=0).encode(
+            color=alt.Color(
+                color_column + ':Q',
+                scale=alt.Scale(scheme='viridis', domain=list(domain)),
+                title='Mean Daily Mean Temperature (degC)',
+                legend=alt.Legend(orient='bottom')
+            )
+        )
+        return (background + raster + borders + legend).configure_legend(
+            labelFontSize=10,
+            titleFontSize=12
+        )
+
+    # Create the heatmap layer with legends; the rows are fetched from the published URL
+    heatmap = alt.Chart(chart_source(station_data)).mark_circle(clip=True).encode(
+        **position,
         color=alt.Color(
-            color_column, 
+            color_column + ':Q', 
             scale=alt.Scale(scheme='viridis'), 
             title='Mean Daily Mean Temperature (degC)',
             legend=alt.Legend(orient='bottom')  # Move color legend to bottom
         ),
         size=alt.Size(
-            size_column, 
+            size_column + ':Q', 
             title='Precipitation (mm)',
             legend=alt.Legend(orient='bottom')  # Move size legend to bottom
         ),
@@ -168,36 +415,86 @@ def plot_heatmap(selected_month, filtered_df, chosen_params):
 
     return chart
 
-def add_flags(target_df, selected_month, chosen_params):
+def plot_tiles(selected_month, color_column, tile_manifest, tile_view, level):
+    """
+    Draw the map from pre-rendered background and climate tiles (see tile_pyramid.py).
+    
+    Parameters:
+    - selected_month: The month selected by the user.
+    - color_column: The Parameter_Month column whose tiles are shown.
+    - tile_manifest: The manifest of built tile layers.
+    - tile_view: The (zoom, window, factor) returned by view_window.
+    - level: The map detail level; its background is used when it was built.
+    
+    Returns:
+    - An Altair chart with the tiles as images and the color legend; vector
+      layers drawn on top must use window_projection(*tile_view).
+    """
+    from tile_pyramid import visible_tiles
+
+    entry = tile_manifest[color_column]
+    background_name = f"background-{level}"
+    if background_name not in tile_manifest:
+        background_name = next(name for name in tile_manifest if name.startswith('background-'))
+    zoom, window, factor = tile_view
+    tiles = pd.concat([visible_tiles(tile_manifest[background_name], *tile_view),
+                       visible_tiles(entry, *tile_view)], ignore_index=True)
+
+    # Overlap neighbouring tiles by a pixel so no seams show when they are scaled
+    tile_size = 256 * factor + 1
+    images = alt.Chart(tiles).mark_image(
+        width=tile_size, height=tile_size, align='left', baseline='top', clip=True
+    ).encode(
+        x=alt.X('px:Q', scale=None),
+        y=alt.Y('py:Q', scale=None),
+        url='url:N'
+    )
+    legend = alt.Chart(pd.DataFrame({color_column: entry['span']})).mark_circle(opacity=0).encode(
+        color=alt.Color(
+            color_column + ':Q',
+            scale=alt.Scale(scheme='viridis', domain=entry['span']),
+            title='Mean Daily Mean Temperature (degC)',
+            legend=alt.Legend(orient='bottom')
+        )
+    )
+    return (images + legend).properties(
+        width=window[2] * factor,
+        height=window[3] * factor
+    ).configure_legend(
+        labelFontSize=10,
+        titleFontSize=12
+    )
+
+def add_flags(station_data, selected_month, chosen_params, filters=None, projected=False, projection=None):
     """
     Add red flag markers to the map for locations that meet all filter criteria.
     
     Parameters:
-    - target_df: The dataframe containing locations that meet the filter criteria.
+    - station_data: PublishedData with the stations to draw from.
     - selected_month: The month selected by the user.
     - chosen_params: List of parameters selected by the user.
+    - filters: Dict mapping parameter -> (low, high). When given, the flags are a
+      filter over station_data (the dataset shared with the heatmap); when None,
+      every row of station_data is flagged.
+    - projected: Whether station_data carries pre-projected 'x'/'y' columns.
+    - projection: Optional explicit projection (used over pre-rendered tiles).
     
     Returns:
     - An Altair chart object with red flags.
     """
     # Define the tooltip information for the flags
-    tooltip_list = [
-        alt.Tooltip('Station:N', title='Station'),
-        alt.Tooltip('Country:N', title='Country'),
-        alt.Tooltip('Latitude:Q', title='Latitude'),
-        alt.Tooltip('Longitude:Q', title='Longitude')
-    ]
-    for p in chosen_params:
-        col = f"{p}_{selected_month}"
-        if col in target_df.columns:
-            tooltip_list.append(alt.Tooltip(col + ":Q", title=p))
+    tooltip_list = station_tooltips(selected_month, station_data.columns, chosen_params)
+    position, _ = map_position(projected)
 
     # Create the flag markers
-    points = alt.Chart(target_df).mark_text(text="🚩", size=15, color='red').encode(
-        longitude='Longitude:Q',
-        latitude='Latitude:Q',
+    points = alt.Chart(chart_source(station_data)).mark_text(text="🚩", size=15, color='red', clip=True).encode(
+        **position,
         tooltip=tooltip_list
     )
+    for predicate in range_filters(filters or {}, selected_month):
+        points = points.transform_filter(predicate)
+    if projection is not None:
+        points = points.project(**projection)
     return points
 
 #########################
@@ -273,16 +570,10 @@ with st.expander("📋 **Select Climate Parameters:**", expanded=True):
 if chosen_params:
     st.write("### 📏 **Adjust Climate Parameters Ranges:**")
     for p in chosen_params:
-        # Calculate the minimum and maximum values for the current parameter and month
-        param_min, param_max = get_min_max(df_wide, p, selected_month)
+        # Look up the slider bounds and the default optimal range for this month
+        param_min, param_max = engine.get_min_max(p, selected_month)
         if param_min is not None and param_max is not None:
-            if p in default_conditions:
-                # Apply default optimal conditions within the data's range
-                default_low, default_high = default_conditions[p]
-                default_low = max(param_min, default_low)
-                default_high = min(param_max, default_high)
-            else:
-                default_low, default_high = param_min, param_max
+            default_low, default_high = engine.default_range(p, selected_month)
 
             # Define a unique key for each slider based on parameter and month
             slider_key = f'slider_{p}_{selected_month}'
@@ -290,6 +581,11 @@ if chosen_params:
             # Define the default range for the slider
             slider_default = (float(default_low), float(default_high))
 
+            # Show how the stations are distributed over the slider's range
+            density = plot_density(stats, p, selected_month)
+            if density is not None:
+                st.altair_chart(density, use_container_width=True)
+
             # Create the slider with consistent float types
             user_range = st.slider(
                 f"**{p}:**",
@@ -304,51 +600,175 @@ if chosen_params:
 else:
     st.info("✅ **Select at least one climate parameter to see corresponding sliders and recommendations.**")
 
+# Station pickers list rows, labelled with the country, since some names are
+# shared by several stations
+station_labels = engine.station_labels()
+station_options = sorted(range(len(station_labels)), key=station_labels.__getitem__)
+
+# Optionally restrict the search to stations around a place
+near_center, near_radius, viewport = None, None, None
+if st.checkbox("📍 **Only show stations near a place**", key="near_place"):
+    near_cols = st.columns(2)
+    with near_cols[0]:
+        near_station = st.selectbox("Reference station", options=station_options,
+                                    format_func=station_labels.__getitem__, key="near_station")
+    with near_cols[1]:
+        near_radius = st.slider("Radius (km)", 50, 3000, 300, step=50, key="near_radius")
+    near_center = engine.locate(near_station)
+    viewport = radius_viewport(*near_center, near_radius)
+
 st.markdown("---")  # Separator line
 
-# Apply the filters to the dataframe
-filtered = df_wide.copy()
-for p, (low, high) in filters.items():
-    col_name = f"{p}_{selected_month}"
-    filtered = filtered[(filtered[col_name] >= low) & (filtered[col_name] <= high)]
+# Apply all filters, re-evaluating only the predicates whose slider moved
+if 'filter_bitmaps' not in st.session_state:
+    st.session_state.filter_bitmaps = PredicateBitmaps()
+if near_center is None:
+    matches = engine.match(selected_month, filters, st.session_state.filter_bitmaps)
+    filtered = df_wide.iloc[matches]
+else:
+    # Matching stations within the radius, nearest first
+    matches, near_distances = engine.near(
+        selected_month, filters, *near_center, radius_km=near_radius,
+        bitmaps=st.session_state.filter_bitmaps
+    )
+    filtered = df_wide.iloc[matches].assign(**{'Distance (km)': near_distances})
 
 # Visualization Section
 st.subheader("📊 **Climate Conditions Map**")
 st.write("The map below highlights countries that match your specified climate preferences. Countries meeting all criteria are marked with red flags.")
 
-# Generate the heatmap based on the filtered data
-base_chart = plot_heatmap(selected_month, df_wide, chosen_params)
+# Let advanced users trade map detail for speed on dense station sets
+point_budget = st.sidebar.number_input(
+    "Map point budget",
+    min_value=100,
+    value=POINT_BUDGET,
+    step=500,
+    help="Above this many stations the map shows grid-cell averages instead of individual stations."
+)
+
+# Use the pre-rendered tiles when they have been built for the color column
+tile_manifest, tile_dir, tile_projection = {}, None, None
+if climate_layer == "Pre-rendered tiles":
+    # Imported here so datashader and xarray are only loaded when tiles are shown
+    from tile_pyramid import read_manifest, view_window, window_projection
+
+    tile_manifest = read_manifest()
+    tile_column, _ = chart_columns(selected_month, df_wide.columns, chosen_params)
+    if tile_column in tile_manifest and any(name.startswith('background-') for name in tile_manifest):
+        tile_dir = tile_manifest[tile_column]['dir']
+        tile_view = view_window(viewport, tile_manifest[tile_column]['max_zoom'])
+        tile_projection = window_projection(*tile_view)
+    else:
+        st.sidebar.warning(f"No tiles for {tile_column}; run `python tile_pyramid.py` to build them.")
+# The vector layers are drawn in the tiles' mercator projection, not pre-projected
+vectors_projected = pre_projected and tile_dir is None
+# Raster base maps draw the stations server-side, so the station table is not published
+raster_base = tile_dir is not None or (pre_projected and (grid_resolution is not None or renderer == 'datashader'))
+
+# Publish the station layer and build the heatmap once per month, parameter set
+# and map setting; moving a slider reuses them and only rebuilds the flags
+def build_base_chart():
+    station_data, cell_size = prepare_station_data(
+        df_wide, selected_month, chosen_params, point_budget, vectors_projected, viewport, publish=not raster_base
+    )
+    if tile_dir is not None:
+        base_chart = plot_tiles(selected_month, tile_column, tile_manifest, tile_view, map_level)
+    else:
+        base_chart = plot_heatmap(selected_month, station_data, chosen_params, cell_size, pre_projected, viewport,
+                                  grid_resolution, renderer)
+    return station_data, cell_size, base_chart
+
+base_key = (selected_month, tuple(chosen_params), point_budget, map_level, pre_projected, viewport,
+            grid_resolution, tile_dir, renderer)
+station_data, cell_size, base_chart = spec_cache.get(base_key, build_base_chart)
 
 # Add flags for the filtered countries
-flag_chart = add_flags(filtered, selected_month, chosen_params)
+if cell_size is None and near_center is None and station_data.url is not None:
+    # The flags are a filter over the same published stations
+    flag_chart = add_flags(station_data, selected_month, chosen_params, filters, vectors_projected, tile_projection)
+else:
+    # Binned cells cannot be flagged, the radius is not a range filter and raster
+    # maps publish no stations, so publish the matching stations themselves
+    flag_columns = ['Station', 'Country', 'Latitude', 'Longitude']
+    flag_columns += [f"{p}_{selected_month}" for p in chosen_params]
+    flagged = filtered[flag_columns]
+    if vectors_projected:
+        flagged = with_projected_xy(flagged)
+    flag_chart = add_flags(publish_dataset(flagged, 'flags'), selected_month, chosen_params, None, vectors_projected,
+                           tile_projection)
 
 # Combine the heatmap and flags into one chart
 combined_chart = base_chart + flag_chart
 
-# Display the combined chart in Streamlit
-st.altair_chart(combined_chart, use_container_width=True)
+# Display the combined chart in Streamlit (tiles keep the size their projection was computed for)
+st.altair_chart(combined_chart, use_container_width=tile_dir is None)
+
+# Report how often the cached base chart was reused
+cache_stats = spec_cache.stats()
+st.sidebar.caption(
+    f"Chart cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+    f"{cache_stats['evictions']} evictions ({cache_stats['entries']} entries)"
+)
 
 # Results Section
 st.subheader("📝 **Your Ideal Countries:**")
 st.write("Below is a table of countries that meet your climate preferences. Click on a country name to explore more about traveling there.")
 
 # Define columns to display
-display_cols = ['Station', 'Country', 'Latitude', 'Longitude']
-for p in chosen_params:
-    col_name = f"{p}_{selected_month}"
-    if col_name in df_wide.columns:
-        display_cols.append(col_name)
+display_cols = engine.display_columns(selected_month, chosen_params)
+if near_center is not None:
+    display_cols.append('Distance (km)')
 
 # Display the filtered countries in a table
 st.dataframe(filtered[display_cols])
 
+# Rank the stations closest to the chosen ranges, including those just outside them
+if filters and st.checkbox("🔎 **Also show the closest near matches**", key="show_nearest"):
+    k = st.slider("Number of near matches", 5, 100, 20, key="nearest_k")
+    nearest_rows, distances = engine.nearest(selected_month, filters, k)
+    nearest = df_wide.iloc[nearest_rows][engine.display_columns(selected_month, chosen_params)].assign(Distance=distances)
+    st.caption("Distance 0 meets every range; larger values are further outside them (normalised by each parameter's range).")
+    st.dataframe(nearest)
+
+# Check the same ranges against every month at once
+if filters and st.checkbox("🗓️ **Find the best months for these ranges**", key="show_best_months"):
+    year = engine.best_month_records(filters)
+    per_month = pd.DataFrame({'Month': months, 'Stations': [year['per_month'][m] for m in months]})
+    st.altair_chart(alt.Chart(per_month).mark_bar().encode(
+        x=alt.X('Month:N', sort=months), y='Stations:Q', tooltip=['Month', 'Stations']
+    ), use_container_width=True)
+    st.dataframe(pd.DataFrame(year['stations']))
+
+# Country-level view served from the precomputed country cube
+if filters and st.checkbox("🏳️ **Compare country averages**", key="show_country_cube"):
+    country_view = engine.country_records(selected_month, filters)
+    st.caption(f"{country_view['count']} countries whose station average meets every range in {selected_month}.")
+    st.dataframe(pd.DataFrame(country_view['countries']))
+
+# Stations whose climate resembles a chosen station's, over all parameters
+if st.checkbox("🧭 **Find places with a similar climate**", key="show_similar"):
+    similar_cols = st.columns(3)
+    with similar_cols[0]:
+        similar_station = st.selectbox("Reference station", options=station_options,
+                                       format_func=station_labels.__getitem__, key="similar_station")
+    with similar_cols[1]:
+        similar_span = st.radio("Compare", [f"{selected_month} only", "Whole year"], key="similar_span")
+    with similar_cols[2]:
+        similar_k = st.slider("Number of stations", 5, 50, 10, key="similar_k")
+    similar_month = None if similar_span == "Whole year" else selected_month
+    similar_rows, similar_distances = engine.similar(similar_station, similar_month, similar_k)
+    # Without a month there are no Parameter_Month columns to show, only the station columns
+    similar_columns = engine.display_columns(similar_month, chosen_params)
+    st.caption("Distance is the typical difference across all parameters, in standard deviations over all stations; "
+               "parameters a station has no data for count as a typical difference between unrelated stations.")
+    st.dataframe(df_wide.iloc[similar_rows][similar_columns].assign(Distance=similar_distances))
+
 # **Display the list of country names with clickable links**
 st.subheader("🌐 **List of Countries:**")
 st.write("Explore detailed travel information for each country by clicking on their names below:")
 
-# Extract unique country names and sort them
-countries = filtered['Country'].unique()
-sorted_countries = sorted(countries)
+# Look up the sorted country names from the precomputed country codes
+sorted_countries = engine.countries_of(matches)
 
 # A bulleted list of countries with clickable links using Markdown
 # Each link directs to Lonely Planet's search page for the respective country
@@ -364,7 +784,7 @@ st.markdown("---")
 st.write("""
 ### 🔍 **Data Sources**
 - **Climate Data:** [WMO Climate Normals from NCEI](https://www.ncei.noaa.gov/products/wmo-climate-normals)
-- **World Map Data:** [Vega Datasets](https://github.com/vega/vega-datasets)
+- **World Map Data:** [Natural Earth](https://www.naturalearthdata.com/) (bundled in `static/topology`)
 
 ### 📧 **Contact**
 For any questions or feedback, feel free to reach out at [shinjih@iu.edu](mailto:shinjih@iu.edu).
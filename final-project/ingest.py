@@ -0,0 +1,218 @@
+import os
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+#########################
+# Streaming, parallel ingest of the WMO 1991-2020 normals files
+#########################
+
+# Element codes used in the WMO files and the parameter names used by the app
+param_map = {
+    1: 'Precipitation (mm)',
+    2: 'Number of Days with Precipitation ≥ 1 mm (#Days)',
+    3: 'Mean Daily Maximum Temperature (degC)',
+    4: 'Mean Daily Minimum Temperature (degC)',
+    5: 'Mean Daily Mean Temperature (degC)',
+    6: 'Mean Sea Level Pressure (hPa)',
+    7: 'Mean Vapor Pressure (hPa)',
+    8: 'Total Number of Hours of Sunshine (Hours)'
+}
+
+# The eight element files shipped in data/
+element_files = ['DP01', 'MNVP', 'MSLP', 'PRCP', 'TAVG', 'TMAX', 'TMIN', 'TSUN']
+
+months = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+          'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+# Columns we keep, in the same order as the 'data.csv' written by the notebook
+output_columns = ['Elem', 'Latitude', 'Longitude', 'Country', 'Station'] + months + ['Parameter']
+
+# Columns dropped by the original preprocessing
+dropped_columns = ['Rgn', 'ID', 'WIGOS_ID', 'Elevation', 'Annual']
+
+# Explicit dtypes so pandas does not have to infer them per chunk
+column_dtypes = {
+    'Elem': 'int16',
+    'Latitude': 'float64',
+    'Longitude': 'float64',
+    'Country': 'object',
+    'Station': 'object',
+    **{m: 'float64' for m in months}
+}
+
+# The WMO files mark missing values with -99.9
+missing_values = ['-99.9']
+
+
+def normals_path(data_dir, element):
+    """Return the path of the WMO normals file for an element code such as 'TAVG'."""
+    return os.path.join(data_dir, f"wmo_normals_9120_{element}.csv")
+
+
+def read_header(path):
+    """
+    Read the padded header line of a WMO normals file and strip it.
+
+    Parameters:
+    - path: Path to a wmo_normals_9120_*.csv file.
+
+    Returns:
+    - The list of trimmed column names.
+    """
+    with open(path, encoding='utf-8') as f:
+        return [name.strip() for name in f.readline().rstrip('\r\n').split(',')]
+
+
+def iter_normals(path, chunksize=50_000, dropna=True):
+    """
+    Stream a WMO normals file as cleaned dataframe chunks.
+
+    Whitespace is trimmed while parsing: the header is read and stripped once,
+    leading padding is skipped by the parser and trailing padding on the text
+    columns is removed by converters, so no pass over the finished frame is needed.
+
+    Parameters:
+    - path: Path to a wmo_normals_9120_*.csv file.
+    - chunksize: Number of rows per yielded chunk (bounds peak memory).
+    - dropna: Drop rows with any missing monthly value, as the notebook did.
+
+    Yields:
+    - Dataframes with output_columns.
+    """
+    names = read_header(path)
+    usecols = [c for c in names if c not in dropped_columns]
+
+    reader = pd.read_csv(
+        path,
+        header=0,
+        names=names,
+        usecols=usecols,
+        skipinitialspace=True,
+        dtype={c: t for c, t in column_dtypes.items() if c not in ('Country', 'Station')},
+        converters={'Country': str.strip, 'Station': str.strip},
+        na_values=missing_values,
+        keep_default_na=False,
+        chunksize=chunksize
+    )
+    for chunk in reader:
+        chunk['Parameter'] = chunk['Elem'].map(param_map)
+        if dropna:
+            chunk = chunk.dropna()
+        yield chunk[output_columns]
+
+
+def read_normals(path, dropna=True):
+    """
+    Read a whole WMO normals file into one cleaned dataframe.
+
+    Parameters:
+    - path: Path to a wmo_normals_9120_*.csv file.
+    - dropna: Drop rows with any missing monthly value.
+
+    Returns:
+    - A dataframe with output_columns.
+    """
+    chunks = list(iter_normals(path, dropna=dropna))
+    if not chunks:
+        return pd.DataFrame(columns=output_columns)
+    return pd.concat(chunks, ignore_index=True)
+
+
+def _write_part(args):
+    """Worker: stream one normals file into a headerless CSV part file."""
+    path, part_path, chunksize, dropna = args
+    n_rows = 0
+    with open(part_path, 'w', encoding='utf-8', newline='') as f:
+        for chunk in iter_normals(path, chunksize=chunksize, dropna=dropna):
+            chunk.to_csv(f, header=False, index=False)
+            n_rows += len(chunk)
+    return n_rows
+
+
+def load_all(data_dir='data', elements=None, max_workers=None, dropna=True):
+    """
+    Read the normals files in parallel (one file per worker) and concatenate them.
+
+    Parameters:
+    - data_dir: Directory containing the wmo_normals_9120_*.csv files.
+    - elements: Element codes to read (defaults to element_files).
+    - max_workers: Size of the process pool (defaults to the number of CPUs).
+    - dropna: Drop rows with any missing monthly value.
+
+    Returns:
+    - The combined long dataframe (same layout as 'data.csv').
+    """
+    paths = [normals_path(data_dir, e) for e in (elements or element_files)]
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        frames = list(pool.map(read_normals, paths, [dropna] * len(paths)))
+    return pd.concat(frames, ignore_index=True)
+
+
+def ingest_to_csv(out_path='data.csv', data_dir='data', elements=None,
+                  chunksize=50_000, max_workers=None, dropna=True):
+    """
+    Stream all normals files into a single long CSV without holding them in memory.
+
+    Each worker parses one file chunk by chunk into its own part file, and the
+    parts are then concatenated in element order, so peak memory is bounded by
+    chunksize times the number of workers rather than by the total file size.
+
+    Parameters:
+    - out_path: Path of the combined CSV to write (read by the app and wide_cache).
+    - data_dir: Directory containing the wmo_normals_9120_*.csv files.
+    - elements: Element codes to read (defaults to element_files).
+    - chunksize: Number of rows parsed per chunk in each worker.
+    - max_workers: Size of the process pool (defaults to the number of CPUs).
+    - dropna: Drop rows with any missing monthly value.
+
+    Returns:
+    - The number of data rows written.
+    """
+    elements = elements or element_files
+    paths = [normals_path(data_dir, e) for e in elements]
+    part_paths = [f"{out_path}.{e}.part" for e in elements]
+    jobs = [(p, part, chunksize, dropna) for p, part in zip(paths, part_paths)]
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        counts = list(pool.map(_write_part, jobs))
+
+    tmp_path = out_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8', newline='') as out:
+        out.write(','.join(output_columns) + '\n')
+        for part in part_paths:
+            with open(part, encoding='utf-8') as f:
+                shutil.copyfileobj(f, out)
+            os.remove(part)
+    os.replace(tmp_path, out_path)
+
+    return sum(counts)
+
+
+def build_caches(csv_path):
+    """
+    Build the wide table, statistics index and country cube caches of a CSV up front.
+
+    Parameters:
+    - csv_path: The long-format CSV written by ingest_to_csv.
+
+    Returns:
+    - The RecommendationEngine that built them.
+    """
+    # Imported here: the engine is only needed when the caches are built
+    from recommender import RecommendationEngine
+
+    return RecommendationEngine(csv_path)
+
+
+if __name__ == '__main__':
+    # Rebuild the app's input: python ingest.py [data_dir] [out_path]
+    data_dir = sys.argv[1] if len(sys.argv) > 1 else 'data'
+    out_path = sys.argv[2] if len(sys.argv) > 2 else 'data.csv'
+    n = ingest_to_csv(out_path, data_dir)
+    print(f"Wrote {n} rows to {out_path}")
+
+    engine = build_caches(out_path)
+    print(f"Cached {len(engine.df_wide)} stations and {len(engine.country_cube.countries)} countries")
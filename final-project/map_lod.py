@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+
+#########################
+# Level-of-detail reduction of the station layer before it is sent to Vega-Lite
+#########################
+
+# Default maximum number of marks shipped to the browser for the station layer.
+# Below the ~6.6k WMO stations, so the world view is binned (into 1-degree cells)
+# while a zoomed-in view, cropped by the app's spatial index, shows every station.
+POINT_BUDGET = 4000
+
+# Grid cell sizes (degrees) tried from finest to coarsest when binning
+CELL_SIZES = [0.25, 0.5, 1, 2, 5, 10, 20]
+
+
+def grid_cells(df, cell_size):
+    """Return an integer lat/lon grid cell id for every station."""
+    rows = np.floor((df['Latitude'].to_numpy() + 90) / cell_size).astype(np.int64)
+    cols = np.floor((df['Longitude'].to_numpy() + 180) / cell_size).astype(np.int64)
+    return rows * int(np.ceil(360 / cell_size) + 1) + cols
+
+
+def bin_stations(df, value_columns, cell_size):
+    """
+    Aggregate stations into a regular lat/lon grid.
+
+    Each cell becomes one mark placed at the mean station position, carrying the
+    mean of every value column and the number of stations it stands for. Cells
+    whose stations belong to more than one country are labelled 'Mixed'.
+
+    Parameters:
+    - df: A dataframe with the station columns and the value columns.
+    - value_columns: The Parameter_Month columns to average.
+    - cell_size: Cell size in degrees.
+
+    Returns:
+    - A dataframe with 'Station', 'Country', 'Latitude', 'Longitude', the value
+      columns and 'Stations' (station count per cell).
+    """
+    cells = grid_cells(df, cell_size)
+    grouped = df.groupby(cells, sort=False)
+    binned = grouped[['Latitude', 'Longitude'] + list(value_columns)].mean()
+    binned['Stations'] = grouped.size()
+    binned['Country'] = grouped['Country'].first().where(grouped['Country'].nunique() == 1, 'Mixed')
+    binned['Station'] = binned['Stations'].map(lambda n: f"{n} station" if n == 1 else f"{n} stations")
+    return binned.reset_index(drop=True)
+
+
+def level_of_detail(df, value_columns, point_budget=POINT_BUDGET):
+    """
+    Reduce the station layer to at most point_budget marks.
+
+    If the stations fit the budget they are returned individually; otherwise
+    they are binned into the finest grid from CELL_SIZES that fits. Callers
+    showing part of the map pass only the visible stations (see
+    RecommendationEngine.viewport_rows).
+
+    Parameters:
+    - df: The wide dataframe (or any subset of it).
+    - value_columns: The Parameter_Month columns used by the chart.
+    - point_budget: Maximum number of marks to ship.
+
+    Returns:
+    - A tuple (plot_df, cell_size) where cell_size is None for individual stations.
+    """
+    columns = ['Station', 'Country', 'Latitude', 'Longitude'] + list(value_columns)
+    visible = df[columns]
+    if len(visible) <= point_budget:
+        return visible, None
+
+    for cell_size in CELL_SIZES:
+        if pd.unique(grid_cells(visible, cell_size)).size <= point_budget:
+            return bin_stations(visible, value_columns, cell_size), cell_size
+    cell_size = CELL_SIZES[-1]
+    return bin_stations(visible, value_columns, cell_size), cell_size
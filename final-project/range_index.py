@@ -0,0 +1,97 @@
+import numpy as np
+
+#########################
+# Sorted-column range index for sub-linear slider queries
+#########################
+
+
+class SortedRangeIndex:
+    """
+    Per-column sorted index (argsort + searchsorted) over a value matrix.
+
+    For every column the row positions are stored in value order, so a
+    (low, high) predicate resolves to a contiguous slice of row positions with
+    two binary searches. Missing values sort to the end and are never returned.
+    The inverse permutation (each row's rank per column) is kept too, so testing
+    whether a row belongs to another predicate's slice is a single comparison.
+    """
+
+    def __init__(self, values, columns):
+        """
+        Parameters:
+        - values: A (rows x columns) float matrix, e.g. FilterEngine.values.
+        - columns: The column name of each matrix column.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        self.columns = list(columns)
+        self.column_positions = {c: j for j, c in enumerate(self.columns)}
+        self.n_rows = values.shape[0]
+
+        # np.argsort puts NaN last, so the valid values form a sorted prefix
+        id_dtype = np.int32 if self.n_rows < 2**31 else np.int64
+        order = np.argsort(values, axis=0, kind='stable')
+        self.order = np.asfortranarray(order.astype(id_dtype))
+        self.sorted_values = np.asfortranarray(np.take_along_axis(values, order, axis=0))
+        self.n_valid = (~np.isnan(values)).sum(axis=0)
+
+        # rank[row, j] is the position of row in column j's sorted order
+        self.rank = np.empty_like(self.order)
+        np.put_along_axis(self.rank, order, np.arange(self.n_rows, dtype=id_dtype)[:, None], axis=0)
+
+    def range_bounds(self, col_name, low, high):
+        """
+        Locate a predicate in a column's sorted order.
+
+        Parameters:
+        - col_name: A Parameter_Month column name.
+        - low, high: The slider range.
+
+        Returns:
+        - A tuple (j, start, stop): rows order[start:stop, j] satisfy the predicate.
+        """
+        j = self.column_positions[col_name]
+        sorted_column = self.sorted_values[:self.n_valid[j], j]
+        start = np.searchsorted(sorted_column, low, side='left')
+        stop = np.searchsorted(sorted_column, high, side='right')
+        return j, start, stop
+
+    def range_slice(self, col_name, low, high):
+        """
+        Return the row positions with low <= value <= high for one column.
+
+        Parameters:
+        - col_name: A Parameter_Month column name.
+        - low, high: The slider range.
+
+        Returns:
+        - A view of the sorted order array (row positions in value order).
+        """
+        j, start, stop = self.range_bounds(col_name, low, high)
+        return self.order[start:stop, j]
+
+    def query(self, ranges):
+        """
+        Intersect several range predicates.
+
+        The smallest slice provides the candidate ids; every other predicate
+        keeps the candidates whose rank in its column falls inside its slice.
+        The cost is O(k log n + k * m) for k predicates and m candidates.
+
+        Parameters:
+        - ranges: A list of (col_name, low, high) tuples.
+
+        Returns:
+        - A sorted int64 array of row positions satisfying every predicate.
+        """
+        if not ranges:
+            return np.arange(self.n_rows)
+
+        bounds = sorted((self.range_bounds(*r) for r in ranges), key=lambda b: b[2] - b[1])
+        j, start, stop = bounds[0]
+        rows = self.order[start:stop, j]
+        for j, start, stop in bounds[1:]:
+            if rows.size == 0:
+                break
+            ranks = self.rank[rows, j]
+            rows = rows[(ranks >= start) & (ranks < stop)]
+        return np.sort(rows).astype(np.int64)
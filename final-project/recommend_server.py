@@ -0,0 +1,209 @@
+import json
+import sys
+import threading
+import urllib.parse
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from batch_recommend import iter_batch, validate_profile
+from recommender import RecommendationEngine
+
+#########################
+# Local HTTP/JSON endpoint for the recommendation engine
+#########################
+
+# Default address and worker pool size
+HOST = '127.0.0.1'
+PORT = 8600
+MAX_WORKERS = 8
+
+# Largest accepted POST /batch body; bigger runs should use batch_recommend.py
+MAX_BATCH_BYTES = 64 * 2**20
+
+
+class PooledHTTPServer(HTTPServer):
+    """HTTPServer that handles each request on a fixed-size thread pool."""
+
+    def __init__(self, address, handler, engine, max_workers=MAX_WORKERS):
+        super().__init__(address, handler)
+        self.engine = engine
+        self.pool = ThreadPoolExecutor(max_workers=max_workers)
+        # Batch jobs run one at a time, off the request pool
+        self.batch_pool = ThreadPoolExecutor(max_workers=1)
+        self.jobs = {}
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process_request, request, client_address)
+
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def submit_batch(self, profiles):
+        """Start scoring validated profiles in the background and return the job id."""
+        job = uuid.uuid4().hex
+        self.jobs[job] = self.batch_pool.submit(lambda: list(iter_batch(self.engine, profiles)))
+        return job
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=True)
+        self.batch_pool.shutdown(wait=True)
+
+
+class RecommendHandler(BaseHTTPRequestHandler):
+    """
+    Routes:
+    - GET /health
+    - GET /bounds?month=Jul
+    - GET /recommend?month=Jul&Precipitation (mm)=0,50[&limit=100]
+    - GET /nearest?month=Jul&Precipitation (mm)=0,50[&k=20]
+    - GET /best_months?Precipitation (mm)=0,50[&limit=100]
+    - GET /near?month=Jul&lat=38.7&lon=-9.1&radius_km=300[&k=20]&Precipitation (mm)=0,50
+      (or station=Tokyo or row=6009 instead of lat/lon)
+    - GET /countries?month=Jul&Precipitation (mm)=0,50[&stat=mean]
+    - GET /similar?station=Tokyo[&month=Apr][&k=10][&approximate=1]
+      (or row=6009 for a station whose name is shared; without a month,
+      whole-year climates are compared)
+    - POST /batch with one profile per line (see batch_recommend.read_profiles)
+      returns 202 and {"job": id} once every profile is valid
+    - GET /batch?job=id returns {"status": "running"}, or {"status": "done",
+      "results": [...]} in input order (the job is then forgotten)
+    """
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        query = {k: v[-1] for k, v in urllib.parse.parse_qs(url.query).items()}
+        engine = self.server.engine
+        try:
+            if url.path == '/health':
+                self.send_json(200, {'status': 'ok', 'stations': len(engine.df_wide)})
+            elif url.path == '/bounds':
+                self.send_json(200, engine.bounds(query.get('month', 'Jan')))
+            elif url.path == '/recommend':
+                limit = int(query['limit']) if 'limit' in query else None
+                filters = engine.parse_filters(query, ('month', 'limit'))
+                self.send_json(200, engine.recommend(query.get('month', 'Jan'), filters, limit))
+            elif url.path == '/nearest':
+                k = int(query.get('k', 20))
+                filters = engine.parse_filters(query, ('month', 'k'))
+                self.send_json(200, engine.nearest_records(query.get('month', 'Jan'), filters, k))
+            elif url.path == '/best_months':
+                limit = int(query['limit']) if 'limit' in query else None
+                filters = engine.parse_filters(query, ('limit',))
+                self.send_json(200, engine.best_month_records(filters, limit))
+            elif url.path == '/near':
+                if 'row' in query:
+                    lat, lon = engine.locate(int(query['row']))
+                elif 'station' in query:
+                    lat, lon = engine.locate(query['station'])
+                else:
+                    lat, lon = float(query['lat']), float(query['lon'])
+                radius_km = float(query['radius_km']) if 'radius_km' in query else None
+                k = int(query['k']) if 'k' in query else None
+                filters = engine.parse_filters(query, ('month', 'station', 'row', 'lat', 'lon', 'radius_km', 'k'))
+                self.send_json(200, engine.near_records(query.get('month', 'Jan'), filters,
+                                                        lat, lon, radius_km, k))
+            elif url.path == '/countries':
+                filters = engine.parse_filters(query, ('month', 'stat'))
+                self.send_json(200, engine.country_records(query.get('month', 'Jan'), filters,
+                                                           query.get('stat', 'mean')))
+            elif url.path == '/batch':
+                future = self.server.jobs.get(query['job'])
+                if future is None:
+                    self.send_json(404, {'error': f"Unknown job {query['job']!r}"})
+                elif not future.done():
+                    self.send_json(200, {'status': 'running'})
+                else:
+                    self.server.jobs.pop(query['job'], None)
+                    try:
+                        self.send_json(200, {'status': 'done', 'results': future.result()})
+                    except Exception as e:
+                        self.send_json(500, {'status': 'failed', 'error': str(e)})
+            elif url.path == '/similar':
+                station = int(query['row']) if 'row' in query else query['station']
+                k = int(query.get('k', 10))
+                approximate = query.get('approximate', '0') not in ('0', 'false', '')
+                self.send_json(200, engine.similar_records(station, query.get('month'), k, approximate))
+            else:
+                self.send_json(404, {'error': f"Unknown path {url.path!r}"})
+        except (ValueError, KeyError) as e:
+            self.send_json(400, {'error': str(e)})
+
+    def do_POST(self):
+        url = urllib.parse.urlparse(self.path)
+        if url.path != '/batch':
+            self.send_json(404, {'error': f"Unknown path {url.path!r}"})
+            return
+        length = int(self.headers.get('Content-Length', 0))
+        if length > MAX_BATCH_BYTES:
+            self.send_json(413, {'error': f"Batch larger than {MAX_BATCH_BYTES} bytes"})
+            return
+        try:
+            lines = self.rfile.read(length).decode('utf-8').splitlines()
+            profiles = [json.loads(line) for line in lines if line.strip()]
+            for i, profile in enumerate(profiles):
+                validate_profile(self.server.engine, profile, i)
+        except ValueError as e:
+            self.send_json(400, {'error': str(e)})
+            return
+        self.send_json(202, {'job': self.server.submit_batch(profiles), 'profiles': len(profiles)})
+
+    def log_message(self, format, *args):
+        # Keep load tests quiet; errors still go through handle_error
+        pass
+
+
+def make_server(engine, host=HOST, port=PORT, max_workers=MAX_WORKERS):
+    """
+    Create (but do not start) a server bound to host:port.
+
+    Parameters:
+    - engine: The RecommendationEngine to serve.
+    - host, port: Address to bind.
+    - max_workers: Size of the request thread pool.
+
+    Returns:
+    - A PooledHTTPServer.
+    """
+    return PooledHTTPServer((host, port), RecommendHandler, engine, max_workers)
+
+
+def start_in_background(engine, host=HOST, port=PORT, max_workers=MAX_WORKERS):
+    """
+    Serve an existing engine from a daemon thread (used by the Streamlit app so
+    both share one in-memory table and its caches).
+
+    Returns:
+    - The running PooledHTTPServer.
+    """
+    server = make_server(engine, host, port, max_workers)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    # python recommend_server.py [port] [data.csv]
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else PORT
+    csv_path = sys.argv[2] if len(sys.argv) > 2 else 'data.csv'
+    server = make_server(RecommendationEngine(csv_path), port=port)
+    print(f"Serving recommendations on http://{HOST}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
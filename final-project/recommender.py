@@ -0,0 +1,588 @@
+import numpy as np
+
+from climate_grid import load_climate_grid
+from country_cube import country_frame, load_country_cube, matching_countries
+from filter_engine import FilterEngine
+from scoring import box_distance, top_k
+from similarity_index import SimilarityIndex, climate_vectors
+from spatial_index import StationLocator
+from stats_index import get_column_stats, load_stats_index
+from wide_cache import ID_COLUMNS, load_wide_table
+from year_search import mask_to_months, month_matches, year_tensor
+
+#########################
+# Headless recommendation engine shared by the Streamlit app and the HTTP API
+#########################
+
+# List of climate parameters to consider
+param_list = [
+    'Precipitation (mm)',
+    'Number of Days with Precipitation ≥ 1 mm (#Days)',
+    'Mean Daily Maximum Temperature (degC)',
+    'Mean Daily Minimum Temperature (degC)',
+    'Mean Daily Mean Temperature (degC)',
+    'Mean Sea Level Pressure (hPa)',
+    'Mean Vapor Pressure (hPa)',
+    'Total Number of Hours of Sunshine (Hours)'
+]
+
+# List of months for selection
+months = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+          'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+# Define default optimal conditions for temperature and precipitation
+default_conditions = {
+    'Mean Daily Mean Temperature (degC)': (18, 25),  # Optimal temperature range in °C
+    'Precipitation (mm)': (0, 50)                    # Optimal precipitation range in mm
+}
+
+# Stations with the same name this close (in degrees) are one station listed
+# twice, e.g. Simferopol under both Ukraine and Russia
+TWIN_DEGREES = 0.05
+
+
+def json_records(df):
+    """Convert a dataframe to a list of dicts with NaN replaced by None (valid JSON)."""
+    return df.astype(object).where(df.notna(), None).to_dict(orient='records')
+
+
+class RecommendationEngine:
+    """
+    Keep the prepared station table in memory and answer recommendation queries.
+
+    The wide table, statistics index, country cube and filter engine are loaded
+    once (from the on-disk caches in wide_cache.py, stats_index.py and
+    country_cube.py) and are safe to share between threads: queries only read them.
+    """
+
+    def __init__(self, csv_path='data.csv', cache_dir=None):
+        """
+        Parameters:
+        - csv_path: Path to the long-format source CSV.
+        - cache_dir: Optional cache directory for the wide table and statistics.
+        """
+        self.csv_path, self.cache_dir = csv_path, cache_dir
+        self.df_wide = load_wide_table(csv_path, cache_dir)
+        self.stats = load_stats_index(csv_path, self.df_wide, cache_dir)
+        self.filter_engine = FilterEngine(self.df_wide, self.stats)
+        self.country_cube = load_country_cube(csv_path, self.df_wide, param_list, months, cache_dir)
+        self._year_tensor = None
+        self._locator = None
+        self._similarity = {}
+
+    def check_month(self, month):
+        """Raise ValueError for an unknown month abbreviation."""
+        if month not in months:
+            raise ValueError(f"Unknown month {month!r}; expected one of {months}")
+
+    def check_count(self, name, value):
+        """Raise ValueError unless a result count (limit, k) is None or at least 1."""
+        if value is not None and value < 1:
+            raise ValueError(f"{name} must be at least 1, got {value}")
+
+    def get_min_max(self, param, month):
+        """
+        Look up the minimum and maximum values for a specific parameter and month.
+
+        Parameters:
+        - param: The climate parameter (e.g., 'Precipitation (mm)').
+        - month: The month for which to look up the min and max.
+
+        Returns:
+        - A tuple containing (min_value, max_value), or (None, None) if there is no data.
+        """
+        entry = get_column_stats(self.stats, param, month)
+        if entry is not None:
+            return entry['min'], entry['max']
+        return None, None
+
+    def default_range(self, param, month):
+        """
+        Return the default slider range: the optimal conditions clipped to the data.
+
+        Parameters:
+        - param: The climate parameter.
+        - month: The selected month.
+
+        Returns:
+        - A tuple (low, high), or None if the parameter has no data that month.
+        """
+        param_min, param_max = self.get_min_max(param, month)
+        if param_min is None or param_max is None:
+            return None
+        if param in default_conditions:
+            # Apply default optimal conditions within the data's range
+            default_low, default_high = default_conditions[param]
+            return max(param_min, default_low), min(param_max, default_high)
+        return param_min, param_max
+
+    def parse_filters(self, query, allowed=()):
+        """
+        Build a filters dict from query arguments such as {'Precipitation (mm)': '0,50'}.
+
+        Parameters:
+        - query: Dict mapping parameter name -> 'low,high' string or (low, high) pair.
+        - allowed: Other keys the query may hold (e.g. 'month'); they are skipped.
+          Any other key raises ValueError, so a misspelt parameter is not
+          silently treated as "no filter".
+
+        Returns:
+        - A dict mapping parameter -> (low, high).
+        """
+        filters = {}
+        for param, value in query.items():
+            if param in allowed:
+                continue
+            if param not in param_list:
+                raise ValueError(f"Unknown query argument {param!r}; expected one of "
+                                 f"{list(allowed)} or a climate parameter")
+            if isinstance(value, str):
+                parts = value.split(',')
+                if len(parts) != 2:
+                    raise ValueError(f"Range for {param!r} must be 'low,high', got {value!r}")
+                value = parts
+            low, high = (float(v) for v in value)
+            if not (np.isfinite(low) and np.isfinite(high)):
+                raise ValueError(f"Range for {param!r} must be finite, got {value!r}")
+            if low > high:
+                raise ValueError(f"Range for {param!r} has low > high")
+            filters[param] = (low, high)
+        return filters
+
+    def match(self, month, filters, bitmaps=None):
+        """
+        Return the row positions of stations that satisfy every range filter.
+
+        Parameters:
+        - month: The selected month.
+        - filters: Dict mapping parameter -> (low, high).
+        - bitmaps: Optional PredicateBitmaps to reuse between calls (one per session).
+
+        Returns:
+        - A sorted array of row positions into df_wide.
+        """
+        self.check_month(month)
+        if bitmaps is not None:
+            return self.filter_engine.filter_indices_incremental(filters, month, bitmaps)
+        return self.filter_engine.filter_indices(filters, month)
+
+    def display_columns(self, month, params):
+        """Return the station columns plus one column per parameter for a month."""
+        columns = list(ID_COLUMNS)
+        for p in params:
+            col_name = f"{p}_{month}"
+            if col_name in self.df_wide.columns:
+                columns.append(col_name)
+        return columns
+
+    def recommend(self, month, filters, limit=None):
+        """
+        Answer a recommendation query.
+
+        Parameters:
+        - month: The selected month.
+        - filters: Dict mapping parameter -> (low, high).
+        - limit: Optional maximum number of stations returned.
+
+        Returns:
+        - A JSON-serialisable dict with the matching stations and their countries.
+        """
+        self.check_count('limit', limit)
+        rows = self.match(month, filters)
+        matched = self.df_wide.iloc[rows]
+        shown = matched if limit is None else matched.iloc[:limit]
+        return {
+            'month': month,
+            'filters': {p: list(r) for p, r in filters.items()},
+            'count': int(len(rows)),
+            'countries': sorted(matched['Country'].unique().tolist()),
+            'stations': json_records(shown[self.display_columns(month, filters)])
+        }
+
+    def bounds(self, month):
+        """
+        Return the slider bounds and defaults of every parameter for a month.
+
+        Parameters:
+        - month: The selected month.
+
+        Returns:
+        - A dict mapping parameter -> {'min', 'max', 'default'}.
+        """
+        self.check_month(month)
+        result = {}
+        for p in param_list:
+            param_min, param_max = self.get_min_max(p, month)
+            if param_min is None:
+                continue
+            result[p] = {'min': param_min, 'max': param_max,
+                         'default': list(self.default_range(p, month))}
+        return result
+
+    def nearest(self, month, filters, k=20):
+        """
+        Rank stations by their normalised distance to the preference box.
+
+        Unlike match, stations slightly outside a range are not dropped: each
+        parameter's overshoot is divided by that parameter's data range for the
+        month, and the k stations with the smallest combined distance are returned
+        (distance 0 means every range is met).
+
+        Parameters:
+        - month: The selected month.
+        - filters: Dict mapping parameter -> (low, high).
+        - k: Number of stations to return.
+
+        Returns:
+        - A tuple (rows, distances) of arrays, nearest first.
+        """
+        self.check_month(month)
+        self.check_count('k', k)
+        matrix, params = self.filter_engine.month_matrix(month)
+        chosen = [p for p in filters if p in params]
+        columns = [params.index(p) for p in chosen]
+
+        low = [filters[p][0] for p in chosen]
+        high = [filters[p][1] for p in chosen]
+        scale = []
+        for p in chosen:
+            param_min, param_max = self.get_min_max(p, month)
+            scale.append(param_max - param_min if param_min is not None else 1.0)
+
+        distance = box_distance(matrix[:, columns], low, high, scale)
+        rows = top_k(distance, k)
+        return rows, distance[rows]
+
+    def nearest_records(self, month, filters, k=20):
+        """
+        Answer a closeness query (see nearest) as a JSON-serialisable dict.
+
+        Parameters:
+        - month: The selected month.
+        - filters: Dict mapping parameter -> (low, high).
+        - k: Number of stations to return.
+
+        Returns:
+        - A dict with the k nearest stations and their distances.
+        """
+        rows, distances = self.nearest(month, filters, k)
+        nearest = self.df_wide.iloc[rows][self.display_columns(month, filters)]
+        return {
+            'month': month,
+            'filters': {p: list(r) for p, r in filters.items()},
+            'stations': json_records(nearest.assign(Distance=distances))
+        }
+
+    def year_tensor(self):
+        """
+        Return the (stations x months x params) tensor of every Parameter_Month
+        column, built on first use and then shared by all queries.
+        """
+        if self._year_tensor is None:
+            fe = self.filter_engine
+            self._year_tensor = year_tensor(fe.values, fe.column_positions, param_list, months)
+        return self._year_tensor
+
+    def best_months(self, filters):
+        """
+        Evaluate the ranges against all 12 months in one pass.
+
+        Parameters:
+        - filters: Dict mapping parameter -> (low, high), applied to every month.
+
+        Returns:
+        - mask: uint16 array with one 12-bit month mask per station (bit 0 = Jan).
+        - best: int array with the index of each station's best month, or -1
+          (see year_search.month_matches).
+        """
+        chosen = [p for p in filters if p in param_list]
+        tensor = self.year_tensor()[:, :, [param_list.index(p) for p in chosen]]
+
+        low = [filters[p][0] for p in chosen]
+        high = [filters[p][1] for p in chosen]
+        scale = []
+        for p in chosen:
+            # Normalise by the parameter's range over the whole year
+            bounds = [self.get_min_max(p, m) for m in months]
+            lows = [b[0] for b in bounds if b[0] is not None]
+            highs = [b[1] for b in bounds if b[1] is not None]
+            scale.append(max(highs) - min(lows) if lows else 1.0)
+
+        mask, best, _ = month_matches(tensor, low, high, scale)
+        return mask, best
+
+    def best_month_records(self, filters, limit=None):
+        """
+        Answer a whole-year query as a JSON-serialisable dict.
+
+        Stations matching in at least one month are listed, those matching in
+        the most months first.
+
+        Parameters:
+        - filters: Dict mapping parameter -> (low, high).
+        - limit: Optional maximum number of stations returned.
+
+        Returns:
+        - A dict with the number of matching stations per month and, per station,
+          its matching months and best month.
+        """
+        self.check_count('limit', limit)
+        mask, best = self.best_months(filters)
+        n_months = np.unpackbits(mask.view(np.uint8)).reshape(len(mask), 16).sum(axis=1)
+        rows = np.flatnonzero(n_months)
+        rows = rows[np.argsort(-n_months[rows], kind='stable')]
+        shown = rows if limit is None else rows[:limit]
+
+        stations = json_records(self.df_wide.iloc[shown][ID_COLUMNS])
+        for record, row in zip(stations, shown):
+            record['Months'] = mask_to_months(int(mask[row]), months)
+            record['Best month'] = months[best[row]]
+        return {
+            'filters': {p: list(r) for p, r in filters.items()},
+            'count': int(len(rows)),
+            'per_month': {m: int(np.count_nonzero(mask >> i & 1)) for i, m in enumerate(months)},
+            'stations': stations
+        }
+
+    def locator(self):
+        """Return the station StationLocator, built on first use."""
+        if self._locator is None:
+            self._locator = StationLocator(self.df_wide['Latitude'].to_numpy(),
+                                           self.df_wide['Longitude'].to_numpy())
+        return self._locator
+
+    def station_row(self, station):
+        """
+        Look up a station's row position.
+
+        Some names are shared by several stations (e.g. 'Valencia' in Spain,
+        Colombia and Venezuela), so callers that list stations should pass rows.
+
+        Parameters:
+        - station: A row position into df_wide, or a station name
+          (case-insensitive) that only one station has, e.g. 'Tokyo'.
+
+        Returns:
+        - The station's row position in df_wide.
+        """
+        if isinstance(station, (int, np.integer)):
+            if not 0 <= station < len(self.df_wide):
+                raise ValueError(f"Station row {station} out of range")
+            return int(station)
+        names = self.df_wide['Station'].str.upper().to_numpy()
+        rows = np.flatnonzero(names == station.strip().upper())
+        if rows.size == 0:
+            raise ValueError(f"Unknown station {station!r}")
+        if rows.size > 1:
+            raise ValueError(f"Station name {station!r} is shared by rows {rows.tolist()}; pass a row instead")
+        return int(rows[0])
+
+    def station_labels(self):
+        """
+        Return a display label per station: 'Name (Country)', plus the
+        coordinates where a name and country occur more than once.
+        """
+        ids = self.df_wide[ID_COLUMNS]
+        labels = ids['Station'] + ' (' + ids['Country'] + ')'
+        repeated = labels.duplicated(keep=False)
+        labels[repeated] = (labels[repeated].str[:-1] + ', ' + ids['Latitude'][repeated].round(2).astype(str)
+                            + ', ' + ids['Longitude'][repeated].round(2).astype(str) + ')')
+        return labels.tolist()
+
+    def locate(self, station):
+        """
+        Look up a station's coordinates.
+
+        Parameters:
+        - station: A row position or station name (see station_row).
+
+        Returns:
+        - A tuple (lat, lon).
+        """
+        row = self.df_wide.iloc[self.station_row(station)]
+        return float(row['Latitude']), float(row['Longitude'])
+
+    def near(self, month, filters, lat, lon, radius_km=None, k=None, bitmaps=None):
+        """
+        Combine the climate range filter with a spatial query around a point.
+
+        Parameters:
+        - month: The selected month.
+        - filters: Dict mapping parameter -> (low, high).
+        - lat, lon: The query point in degrees.
+        - radius_km: Keep matching stations within this distance.
+        - k: Keep at most the k closest matching stations.
+          At least one of radius_km and k must be given.
+        - bitmaps: Optional PredicateBitmaps passed on to match.
+
+        Returns:
+        - A tuple (rows, distances_km) of matching stations, nearest first.
+        """
+        if radius_km is None and k is None:
+            raise ValueError("Give a radius_km, a k, or both")
+        self.check_count('k', k)
+        allowed = np.zeros(len(self.df_wide), dtype=bool)
+        allowed[self.match(month, filters, bitmaps)] = True
+
+        if radius_km is not None:
+            rows, distances = self.locator().within(lat, lon, radius_km)
+            keep = allowed[rows]
+            rows, distances = rows[keep], distances[keep]
+            if k is not None:
+                rows, distances = rows[:k], distances[:k]
+            return rows, distances
+        return self.locator().nearest_where(lat, lon, k, allowed)
+
+    def near_records(self, month, filters, lat, lon, radius_km=None, k=None):
+        """
+        Answer a spatial query (see near) as a JSON-serialisable dict.
+
+        Returns:
+        - A dict with the matching stations and their distances in km.
+        """
+        rows, distances = self.near(month, filters, lat, lon, radius_km, k)
+        stations = self.df_wide.iloc[rows][self.display_columns(month, filters)]
+        return {
+            'month': month,
+            'filters': {p: list(r) for p, r in filters.items()},
+            'center': [lat, lon],
+            'radius_km': radius_km,
+            'count': int(len(rows)),
+            'stations': json_records(stations.assign(**{'Distance (km)': distances}))
+        }
+
+    def similarity_index(self, month=None):
+        """
+        Return the SimilarityIndex over all parameters of one month (or of the
+        whole year for month=None), built on first use.
+        """
+        if month is not None:
+            self.check_month(month)
+        if month not in self._similarity:
+            position = None if month is None else months.index(month)
+            self._similarity[month] = SimilarityIndex(climate_vectors(self.year_tensor(), position))
+        return self._similarity[month]
+
+    def similar(self, station, month=None, k=10, approximate=False):
+        """
+        Find the stations whose climate is most like a station's.
+
+        Duplicate listings of the reference station itself (the same name at
+        the same place, e.g. under two countries) are left out.
+
+        Parameters:
+        - station: The reference station's row position or name (see station_row).
+        - month: Compare this month's parameters, or None for the whole year.
+        - k: Number of stations to return.
+        - approximate: Use the index's IVF buckets instead of an exact scan.
+
+        Returns:
+        - A tuple (rows, distances) of similar stations, most similar first;
+          distances are RMS differences in standard deviations, with parameters
+          the station lacks counted as a typical difference (see MISSING_PENALTY).
+        """
+        self.check_count('k', k)
+        row = self.station_row(station)
+        twins = self.station_twins(row)
+        index = self.similarity_index(month)
+        vector = climate_vectors(self.year_tensor()[row:row + 1], None if month is None else months.index(month))
+        rows, distances = index.search(vector, k + len(twins), exclude=row, approximate=approximate)
+        found = (rows[0] >= 0) & ~np.isin(rows[0], twins)
+        return rows[0][found][:k], distances[0][found][:k].astype(np.float64)
+
+    def station_twins(self, row):
+        """Return the other rows with the same station name within TWIN_DEGREES of a station."""
+        df = self.df_wide
+        same_name = df['Station'].str.upper().to_numpy() == df['Station'].iloc[row].upper()
+        close = ((np.abs(df['Latitude'].to_numpy() - df['Latitude'].iloc[row]) <= TWIN_DEGREES)
+                 & (np.abs(df['Longitude'].to_numpy() - df['Longitude'].iloc[row]) <= TWIN_DEGREES))
+        twins = np.flatnonzero(same_name & close)
+        return twins[twins != row]
+
+    def similar_records(self, station, month=None, k=10, approximate=False):
+        """
+        Answer a similarity query (see similar) as a JSON-serialisable dict.
+
+        Returns:
+        - A dict with the reference station and the most similar stations.
+        """
+        rows, distances = self.similar(station, month, k, approximate)
+        stations = self.df_wide.iloc[rows][self.display_columns(month, param_list)]
+        reference = self.df_wide.iloc[self.station_row(station)]
+        return {
+            'station': reference['Station'],
+            'country': reference['Country'],
+            'month': month,
+            'approximate': approximate,
+            'stations': json_records(stations.assign(Distance=distances))
+        }
+
+    def viewport_rows(self, viewport):
+        """
+        Return the row positions of stations inside a map viewport.
+
+        Parameters:
+        - viewport: A (lon_min, lon_max, lat_min, lat_max) box, or None for all rows.
+
+        Returns:
+        - A sorted array of row positions into df_wide.
+        """
+        if viewport is None:
+            return np.arange(len(self.df_wide))
+        return self.locator().in_viewport(viewport)
+
+    def countries_of(self, rows):
+        """
+        Return the sorted country names of a set of stations.
+
+        Uses the cube's integer country codes, so no strings are compared or sorted.
+
+        Parameters:
+        - rows: Row positions into df_wide.
+
+        Returns:
+        - A list of country names.
+        """
+        codes = np.unique(self.country_cube.station_country[rows])
+        return self.country_cube.countries[codes].tolist()
+
+    def country_records(self, month, filters, stat='mean'):
+        """
+        Recommend countries from the precomputed cube, without touching station rows.
+
+        Parameters:
+        - month: The selected month.
+        - filters: Dict mapping parameter -> (low, high), compared with each
+          country's aggregate.
+        - stat: The aggregate compared with the ranges ('mean', 'min' or 'max').
+
+        Returns:
+        - A JSON-serialisable dict with the matching countries and their aggregates.
+        """
+        self.check_month(month)
+        frame = country_frame(self.country_cube, month, list(filters) or param_list, stat)
+        positions = matching_countries(self.country_cube, month, filters, stat)
+        return {
+            'month': month,
+            'filters': {p: list(r) for p, r in filters.items()},
+            'stat': stat,
+            'count': int(len(positions)),
+            'countries': json_records(frame.iloc[positions])
+        }
+
+    def climate_grid(self, param, month, resolution, method='idw'):
+        """
+        Return one Parameter_Month interpolated onto a global grid (cached on disk).
+
+        Parameters:
+        - param: The climate parameter.
+        - month: The selected month.
+        - resolution: Cell size in degrees.
+        - method: 'idw' or 'gaussian' (see climate_grid.interpolate_grid).
+
+        Returns:
+        - A float16 array (north row first), NaN where no station is near.
+        """
+        self.check_month(month)
+        return load_climate_grid(self.csv_path, self.df_wide, param, month, resolution,
+                                 method, self.cache_dir)
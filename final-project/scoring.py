@@ -0,0 +1,69 @@
+import numpy as np
+
+#########################
+# Ranked closeness to the user's preference box
+#########################
+
+
+def box_distance(matrix, low, high, scale):
+    """
+    Compute each station's normalised distance to a box of parameter ranges.
+
+    For every parameter the distance is how far the value lies outside
+    [low, high] (zero inside), divided by the parameter's scale; the per-parameter
+    distances are combined with the Euclidean norm. Stations with a missing value
+    for any chosen parameter get an infinite distance.
+
+    Parameters:
+    - matrix: A (stations x params) float matrix for the chosen parameters.
+    - low, high: Arrays of shape (params,) with the preference box.
+    - scale: Array of shape (params,) used to make parameters comparable
+      (e.g. each column's max - min).
+
+    Returns:
+    - A float array of shape (stations,).
+    """
+    low = np.asarray(low, dtype=np.float64)
+    high = np.asarray(high, dtype=np.float64)
+    scale = np.where(np.asarray(scale, dtype=np.float64) > 0, scale, 1.0)
+
+    # Reuse three buffers instead of allocating temporaries per parameter
+    squared = np.zeros(matrix.shape[0])
+    outside = np.empty(matrix.shape[0])
+    above = np.empty(matrix.shape[0])
+    for j in range(matrix.shape[1]):
+        column = matrix[:, j]
+        np.subtract(low[j], column, out=outside)
+        np.subtract(column, high[j], out=above)
+        np.maximum(outside, above, out=outside)
+        np.maximum(outside, 0.0, out=outside)
+        outside /= scale[j]
+        outside *= outside
+        squared += outside
+    distance = np.sqrt(squared, out=squared)
+    distance[np.isnan(distance)] = np.inf
+    return distance
+
+
+def top_k(distance, k):
+    """
+    Return the positions of the k smallest distances, nearest first.
+
+    Uses np.argpartition (O(n)) and only sorts the k selected values.
+
+    Parameters:
+    - distance: A float array of distances.
+    - k: Number of positions to return.
+
+    Returns:
+    - An int array of at most k positions, excluding infinite distances.
+    """
+    finite = np.count_nonzero(np.isfinite(distance))
+    k = min(k, finite)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < distance.size:
+        candidates = np.argpartition(distance, k - 1)[:k]
+    else:
+        candidates = np.arange(distance.size)
+    return candidates[np.argsort(distance[candidates], kind='stable')]
@@ -0,0 +1,72 @@
+import io
+
+import datashader as ds
+import datashader.transfer_functions as tf
+import numpy as np
+import pandas as pd
+
+from climate_grid import colour_ramp, projected_extent
+from world_topology import natural_earth1
+
+#########################
+# Server-side datashader rendering of dense point layers
+#########################
+
+# Width in pixels of the rendered image; the height follows the extent's aspect
+IMAGE_WIDTH = 1000
+
+# Radius in pixels each aggregated point is spread to (so single stations stay visible)
+SPREAD_PX = 2
+
+
+def viewport_extent(viewport):
+    """
+    Return the Natural Earth I (x_min, x_max, y_min, y_max) extent of a viewport.
+
+    Parameters:
+    - viewport: A (lon_min, lon_max, lat_min, lat_max) box, or None (or a box
+      crossing the antimeridian) for the whole world.
+
+    Returns:
+    - The extent in projection units.
+    """
+    if viewport is None or viewport[0] > viewport[1]:
+        return projected_extent()
+    lon_min, lon_max, lat_min, lat_max = viewport
+    lon, lat = np.meshgrid(np.linspace(lon_min, lon_max, 9), np.linspace(lat_min, lat_max, 9))
+    x, y = natural_earth1(lon.ravel(), lat.ravel())
+    return float(x.min()), float(x.max()), float(y.min()), float(y.max())
+
+
+def render_points(x, y, values, extent, span, width=IMAGE_WIDTH, spread=SPREAD_PX, scheme='viridis'):
+    """
+    Aggregate points into a fixed-size image, colored by their mean value per pixel.
+
+    The cost of the browser side no longer depends on the number of points:
+    it only draws one image of width x height pixels.
+
+    Parameters:
+    - x, y: Arrays of projected point coordinates (y points north).
+    - values: Array of values to color by (NaN points are skipped).
+    - extent: The (x_min, x_max, y_min, y_max) area to render.
+    - span: The (min, max) values mapped to the ends of the color scale.
+    - width: Image width in pixels.
+    - spread: Radius in pixels to grow each non-empty pixel by.
+    - scheme: Matplotlib color map name.
+
+    Returns:
+    - PNG bytes.
+    """
+    x_min, x_max, y_min, y_max = extent
+    height = max(1, int(round(width * (y_max - y_min) / (x_max - x_min))))
+    points = pd.DataFrame({'x': x, 'y': y, 'value': values}).dropna()
+
+    canvas = ds.Canvas(plot_width=width, plot_height=height, x_range=(x_min, x_max), y_range=(y_min, y_max))
+    agg = canvas.points(points, 'x', 'y', agg=ds.mean('value'))
+    image = tf.shade(agg, cmap=colour_ramp(scheme), span=span, how='linear')
+    if spread:
+        image = tf.spread(image, px=spread, shape='circle')
+
+    buffer = io.BytesIO()
+    image.to_pil().save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
@@ -0,0 +1,215 @@
+import warnings
+
+import numpy as np
+from sklearn.cluster import KMeans
+
+#########################
+# Climate-similarity search over standardised per-station climate vectors
+#########################
+
+# Stations scored per block in exact search; bounds the (block x queries) temporaries
+BLOCK_ROWS = 65536
+
+# A station is only compared with a query if they share at least this
+# fraction of the query's features (both non-missing)
+MIN_OVERLAP = 0.5
+
+# Squared z-score difference charged for each query feature a station lacks:
+# the expected value for two unrelated stations (E[(x - y)^2] = 2 for
+# independent standardised values), so gaps never make a station look closer
+MISSING_PENALTY = 2.0
+
+# Inverted-file (IVF) search: k-means buckets trained on a sample of the
+# stations, of which the N_PROBE closest to a query are scanned exactly
+N_PROBE = 8
+TRAIN_ROWS = 20_000
+
+
+def climate_vectors(tensor, month=None, params=None):
+    """
+    Build per-station climate vectors from a (stations x months x params) tensor.
+
+    Parameters:
+    - tensor: The year tensor (see year_search.year_tensor).
+    - month: A month position for one month's vectors, or None for year-round
+      vectors (every month of every parameter).
+    - params: Optional parameter positions to keep (all by default).
+
+    Returns:
+    - A (stations x features) float array, NaN where data is missing.
+    """
+    if params is not None:
+        tensor = tensor[:, :, params]
+    if month is not None:
+        return tensor[:, month, :]
+    return tensor.reshape(len(tensor), -1)
+
+
+class SimilarityIndex:
+    """
+    Nearest-neighbour index over climate vectors, built once per table.
+
+    Features are standardised (z-scores over stations) so that e.g. hPa and
+    mm count alike. Distances are NaN-aware: the root mean squared difference
+    over the query's features, where a feature the station lacks counts as
+    MISSING_PENALTY, so stations with gaps stay comparable but cannot outrank
+    complete stations on the features they happen to have.
+    Search is exact (batched brute force) or approximate (IVF buckets).
+    """
+
+    def __init__(self, vectors):
+        """
+        Parameters:
+        - vectors: A (stations x features) array (NaN allowed), e.g. from climate_vectors.
+        """
+        vectors = np.asarray(vectors, dtype=np.float64)
+        with warnings.catch_warnings():
+            # Features without any data get mean 0 and std 1
+            warnings.simplefilter('ignore', RuntimeWarning)
+            self.mean = np.nan_to_num(np.nanmean(vectors, axis=0))
+            std = np.nanstd(vectors, axis=0)
+        self.std = np.where(np.nan_to_num(std) > 0, std, 1.0)
+
+        z = self.standardise(vectors)
+        self.present = np.isfinite(z).astype(np.float32)
+        # Missing features hold 0 (the column mean), so they add nothing to the sums below
+        self.values = np.nan_to_num(z).astype(np.float32)
+        self.squares = self.values * self.values
+        self.lists = None
+
+    def standardise(self, vectors):
+        """Return vectors as z-scores of the indexed features."""
+        return (np.asarray(vectors, dtype=np.float64) - self.mean) / self.std
+
+    def distances(self, queries, rows=None):
+        """
+        Compute NaN-aware RMS distances between standardised queries and stations.
+
+        The sum of squared differences over shared features expands into three
+        matrix products, so a block of stations is scored against all queries at
+        once; each of the query's features the station lacks adds MISSING_PENALTY.
+
+        Parameters:
+        - queries: A (queries x features) array of z-scores (NaN = missing).
+        - rows: Optional station positions to score (all by default).
+
+        Returns:
+        - A (stations x queries) float32 array, inf where too few features overlap.
+        """
+        query_present = np.isfinite(queries).astype(np.float32)
+        query_values = np.nan_to_num(queries).astype(np.float32)
+        values = self.values if rows is None else self.values[rows]
+        present = self.present if rows is None else self.present[rows]
+        squares = self.squares if rows is None else self.squares[rows]
+
+        shared = present @ query_present.T
+        squared = (squares @ query_present.T - 2 * values @ query_values.T
+                   + present @ (query_values * query_values).T)
+        n_query = query_present.sum(axis=1)
+        needed = np.maximum(MIN_OVERLAP * n_query, 1)
+        squared = np.maximum(squared, 0) + MISSING_PENALTY * (n_query - shared)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            distance = np.sqrt(squared / n_query)
+        distance[shared < needed] = np.inf
+        return distance
+
+    def _top_k(self, queries, k, rows, exclude):
+        """Exact top-k over the given station positions (None = all), in blocks."""
+        n_rows = len(self.values) if rows is None else len(rows)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best_distance = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, n_rows, BLOCK_ROWS):
+            block = np.arange(start, min(start + BLOCK_ROWS, n_rows))
+            if rows is not None:
+                block = rows[block]
+            distance = self.distances(queries, block).T
+            if exclude is not None:
+                distance[block[None, :] == exclude[:, None]] = np.inf
+            candidates = np.hstack([best_rows, np.broadcast_to(block, distance.shape)])
+            distance = np.hstack([best_distance, distance])
+            if distance.shape[1] > k:
+                keep = np.argpartition(distance, k - 1, axis=1)[:, :k]
+                candidates = np.take_along_axis(candidates, keep, axis=1)
+                distance = np.take_along_axis(distance, keep, axis=1)
+            best_rows, best_distance = candidates, distance
+        order = np.argsort(best_distance, axis=1, kind='stable')
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        best_distance = np.take_along_axis(best_distance, order, axis=1)
+        # Fewer than k candidates: pad with "no neighbour"
+        missing = k - best_rows.shape[1]
+        if missing > 0:
+            best_rows = np.pad(best_rows, ((0, 0), (0, missing)), constant_values=-1)
+            best_distance = np.pad(best_distance, ((0, 0), (0, missing)), constant_values=np.inf)
+        return best_rows, best_distance
+
+    def build_lists(self, n_lists=None, seed=0):
+        """
+        Partition the stations into k-means buckets for approximate search.
+
+        The centroids are trained on at most TRAIN_ROWS stations and every
+        station is then assigned to its nearest centroid.
+
+        Parameters:
+        - n_lists: Number of buckets (about sqrt(stations) by default).
+        - seed: Random seed of the sample and of k-means.
+        """
+        n = len(self.values)
+        n_lists = min(n_lists or max(1, int(np.sqrt(n))), n)
+        rng = np.random.default_rng(seed)
+        sample = self.values[rng.choice(n, min(n, TRAIN_ROWS), replace=False)]
+        kmeans = KMeans(n_clusters=n_lists, n_init=1, max_iter=25, random_state=seed).fit(sample)
+        self.centroids = kmeans.cluster_centers_.astype(np.float32)
+        labels = kmeans.predict(self.values)
+        # Station positions grouped by bucket, with each bucket's start offset
+        self.lists = np.argsort(labels, kind='stable')
+        self.list_starts = np.searchsorted(labels[self.lists], np.arange(n_lists + 1))
+
+    def search(self, queries, k=10, exclude=None, approximate=False, n_probe=N_PROBE):
+        """
+        Find the k stations closest to each query.
+
+        Parameters:
+        - queries: A (queries x features) array in the original units (NaN = missing).
+        - k: Number of stations per query.
+        - exclude: Optional station position per query to leave out (e.g. the
+          query station itself), -1 for none.
+        - approximate: Scan only the n_probe IVF buckets closest to each query
+          (built on first use) instead of every station.
+        - n_probe: Buckets scanned per query in approximate mode.
+
+        Returns:
+        - A tuple (rows, distances) of (queries x k) arrays, nearest first;
+          missing neighbours have row -1 and distance inf.
+        """
+        queries = np.atleast_2d(self.standardise(queries))
+        exclude = None if exclude is None else np.atleast_1d(exclude)
+        if not approximate:
+            rows, distance = self._top_k(queries, k, None, exclude)
+        else:
+            if self.lists is None:
+                self.build_lists()
+            # Centroids have no gaps, so the query's own missing features are skipped
+            to_centroids = np.nan_to_num(self.distances_to_centroids(queries), nan=np.inf)
+            n_probe = min(n_probe, len(self.centroids))
+            probes = np.argpartition(to_centroids, n_probe - 1, axis=1)[:, :n_probe]
+            results = []
+            for i, lists in enumerate(probes):
+                candidates = np.concatenate([self.lists[self.list_starts[j]:self.list_starts[j + 1]]
+                                             for j in lists])
+                results.append(self._top_k(queries[i:i + 1], k, candidates,
+                                           None if exclude is None else exclude[i:i + 1]))
+            rows = np.vstack([r for r, _ in results])
+            distance = np.vstack([d for _, d in results])
+        missing = ~np.isfinite(distance)
+        rows = np.where(missing, -1, rows)
+        return rows, distance
+
+    def distances_to_centroids(self, queries):
+        """RMS distances (queries x buckets) over each query's present features."""
+        present = np.isfinite(queries).astype(np.float32)
+        values = np.nan_to_num(queries).astype(np.float32)
+        centroids = self.centroids
+        squared = (present @ (centroids * centroids).T - 2 * values @ centroids.T
+                   + (values * values).sum(axis=1, keepdims=True))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.sqrt(np.maximum(squared, 0) / present.sum(axis=1, keepdims=True))
@@ -0,0 +1,142 @@
+import numpy as np
+from sklearn.neighbors import BallTree
+
+#########################
+# Spatial index over station coordinates (radius, k-nearest and viewport queries)
+#########################
+
+# Mean Earth radius used to convert between kilometres and radians
+EARTH_RADIUS_KM = 6371.0088
+
+
+def radius_viewport(lat, lon, radius_km):
+    """
+    Return the (lon_min, lon_max, lat_min, lat_max) box enclosing a circle.
+
+    Parameters:
+    - lat, lon: Centre of the circle in degrees.
+    - radius_km: Radius of the circle in kilometres.
+
+    Returns:
+    - A viewport tuple as used by StationLocator.in_viewport; lon_min > lon_max
+      means the box crosses the antimeridian.
+    """
+    angle = radius_km / EARTH_RADIUS_KM
+    lat_min = lat - np.degrees(angle)
+    lat_max = lat + np.degrees(angle)
+    if lat_min <= -90 or lat_max >= 90 or angle >= np.pi / 2:
+        # The circle contains a pole: every longitude is inside
+        return -180.0, 180.0, max(lat_min, -90.0), min(lat_max, 90.0)
+    dlon = np.degrees(np.arcsin(min(1.0, np.sin(angle) / np.cos(np.radians(lat)))))
+    lon_min = (lon - dlon + 180) % 360 - 180
+    lon_max = (lon + dlon + 180) % 360 - 180
+    return float(lon_min), float(lon_max), float(lat_min), float(lat_max)
+
+
+class StationLocator:
+    """
+    Haversine ball tree over station coordinates, built once per table.
+
+    Query methods return row positions into the arrays the locator was built
+    from (i.e. into df_wide) together with great-circle distances in km.
+    """
+
+    def __init__(self, lat, lon, leaf_size=40):
+        """
+        Parameters:
+        - lat, lon: Arrays of station coordinates in degrees (NaN allowed;
+          such stations are never returned).
+        - leaf_size: BallTree leaf size.
+        """
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        self.n_rows = len(lat)
+        self.rows = np.flatnonzero(~(np.isnan(lat) | np.isnan(lon)))
+        self.tree = BallTree(np.radians(np.column_stack([lat[self.rows], lon[self.rows]])),
+                             leaf_size=leaf_size, metric='haversine')
+
+        # Latitude-sorted copy for bounding-box (viewport) queries
+        order = np.argsort(lat[self.rows], kind='stable')
+        self.lat_order = self.rows[order]
+        self.sorted_lat = lat[self.lat_order]
+        self.lon = lon
+
+    def within(self, lat, lon, radius_km):
+        """
+        Find every station within radius_km of a point.
+
+        Parameters:
+        - lat, lon: The query point in degrees.
+        - radius_km: Search radius in kilometres.
+
+        Returns:
+        - A tuple (rows, distances_km), nearest first.
+        """
+        point = np.radians([[lat, lon]])
+        idx, dist = self.tree.query_radius(point, r=radius_km / EARTH_RADIUS_KM,
+                                           return_distance=True, sort_results=True)
+        return self.rows[idx[0]], dist[0] * EARTH_RADIUS_KM
+
+    def nearest(self, lat, lon, k=10):
+        """
+        Find the k stations closest to a point.
+
+        Parameters:
+        - lat, lon: The query point in degrees.
+        - k: Number of stations to return.
+
+        Returns:
+        - A tuple (rows, distances_km), nearest first.
+        """
+        k = min(k, len(self.rows))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        dist, idx = self.tree.query(np.radians([[lat, lon]]), k=k)
+        return self.rows[idx[0]], dist[0] * EARTH_RADIUS_KM
+
+    def nearest_where(self, lat, lon, k, allowed):
+        """
+        Find the k closest stations among those flagged in a boolean mask.
+
+        The tree is queried for a growing number of neighbours until k allowed
+        stations are found, so selective masks near the point stay cheap.
+
+        Parameters:
+        - lat, lon: The query point in degrees.
+        - k: Number of stations to return.
+        - allowed: Boolean array over all rows (e.g. the climate filter result).
+
+        Returns:
+        - A tuple (rows, distances_km), nearest first.
+        """
+        k = min(k, int(np.count_nonzero(allowed[self.rows])))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        n_query = min(len(self.rows), 4 * k)
+        while True:
+            rows, dist = self.nearest(lat, lon, n_query)
+            keep = allowed[rows]
+            if np.count_nonzero(keep) >= k or n_query == len(self.rows):
+                return rows[keep][:k], dist[keep][:k]
+            n_query = min(len(self.rows), n_query * 4)
+
+    def in_viewport(self, viewport):
+        """
+        Return the stations inside a (lon_min, lon_max, lat_min, lat_max) box.
+
+        Parameters:
+        - viewport: The bounding box; lon_min > lon_max crosses the antimeridian.
+
+        Returns:
+        - A sorted array of row positions.
+        """
+        lon_min, lon_max, lat_min, lat_max = viewport
+        start = np.searchsorted(self.sorted_lat, lat_min, side='left')
+        stop = np.searchsorted(self.sorted_lat, lat_max, side='right')
+        band = self.lat_order[start:stop]
+        lon = self.lon[band]
+        if lon_min <= lon_max:
+            inside = (lon >= lon_min) & (lon <= lon_max)
+        else:
+            inside = (lon >= lon_min) | (lon <= lon_max)
+        return np.sort(band[inside])
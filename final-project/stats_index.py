@@ -0,0 +1,117 @@
+import json
+import os
+import tempfile
+import warnings
+
+import numpy as np
+
+from wide_cache import ID_COLUMNS, default_cache_dir, source_hash
+
+#########################
+# Precomputed per-(parameter, month) statistics index
+#########################
+
+# Quantiles stored for every Parameter_Month column
+QUANTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+
+# Number of histogram bins stored for slider density plots
+N_BINS = 20
+
+
+def build_stats_index(df_wide, n_bins=N_BINS, quantiles=QUANTILES):
+    """
+    Compute summary statistics for every Parameter_Month column in one pass.
+
+    Parameters:
+    - df_wide: The wide dataframe (ID_COLUMNS followed by Parameter_Month columns).
+    - n_bins: Number of equal-width histogram bins per column.
+    - quantiles: Quantile levels to store.
+
+    Returns:
+    - A dict mapping each Parameter_Month column to a dict with 'min', 'max',
+      'count', 'nulls', 'quantiles', 'bin_edges' and 'hist'.
+    """
+    value_columns = [c for c in df_wide.columns if c not in ID_COLUMNS]
+    values = df_wide[value_columns].to_numpy(dtype=np.float64)
+    valid = ~np.isnan(values)
+    counts = valid.sum(axis=0)
+
+    # Column-wise reductions over the whole matrix; all-NaN columns are handled below
+    with np.errstate(all='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # nanquantile of all-NaN columns
+        filled_low = np.where(valid, values, np.inf)
+        filled_high = np.where(valid, values, -np.inf)
+        mins = filled_low.min(axis=0)
+        maxs = filled_high.max(axis=0)
+        qs = np.nanquantile(values, quantiles, axis=0) if values.size else None
+
+    index = {}
+    for j, col in enumerate(value_columns):
+        if counts[j] == 0:
+            index[col] = {
+                'min': None, 'max': None, 'count': 0, 'nulls': int(len(values)),
+                'quantiles': {}, 'bin_edges': [], 'hist': []
+            }
+            continue
+        hist, edges = np.histogram(values[valid[:, j], j], bins=n_bins,
+                                   range=(mins[j], maxs[j]))
+        index[col] = {
+            'min': float(mins[j]),
+            'max': float(maxs[j]),
+            'count': int(counts[j]),
+            'nulls': int(len(values) - counts[j]),
+            'quantiles': {str(q): float(qs[k, j]) for k, q in enumerate(quantiles)},
+            'bin_edges': edges.tolist(),
+            'hist': hist.tolist()
+        }
+    return index
+
+
+def load_stats_index(csv_path, df_wide, cache_dir=None):
+    """
+    Return the statistics index for a source CSV, computing it on first use.
+
+    The index is stored as JSON next to the wide table cache and shares its key,
+    so it is rebuilt exactly when the wide table is.
+
+    Parameters:
+    - csv_path: Path to the long-format source CSV.
+    - df_wide: The wide dataframe built from csv_path.
+    - cache_dir: Optional cache directory (defaults to default_cache_dir(csv_path)).
+
+    Returns:
+    - The statistics index (see build_stats_index).
+    """
+    if cache_dir is None:
+        cache_dir = default_cache_dir(csv_path)
+    path = os.path.join(cache_dir, f"stats_{source_hash(csv_path)}.json")
+
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+
+    index = build_stats_index(df_wide)
+    os.makedirs(cache_dir, exist_ok=True)
+    # A unique temporary name, as several processes may build the index at once
+    with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=cache_dir, suffix='.tmp', delete=False) as f:
+        json.dump(index, f, ensure_ascii=False)
+    os.replace(f.name, path)
+    return index
+
+
+def get_column_stats(index, param, month):
+    """
+    Look up the statistics for one parameter and month.
+
+    Parameters:
+    - index: The statistics index.
+    - param: The climate parameter (e.g., 'Precipitation (mm)').
+    - month: The month abbreviation (e.g., 'Jul').
+
+    Returns:
+    - The statistics dict, or None if the column does not exist or is empty.
+    """
+    entry = index.get(f"{param}_{month}")
+    if entry is None or entry['count'] == 0:
+        return None
+    return entry
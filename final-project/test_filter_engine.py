@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from filter_engine import FilterEngine, PredicateBitmaps
+from stats_index import build_stats_index
+from wide_cache import build_wide_table, load_wide_cache, write_wide_cache
+
+#########################
+# FilterEngine must select exactly the rows of the chained boolean-mask filter
+#########################
+
+MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+PARAMS = ['Precipitation (mm)', 'Mean Daily Mean Temperature (degC)', 'Mean Sea Level Pressure (hPa)']
+
+
+def make_wide_table(n_stations=500, seed=0):
+    """Build a wide table from a random long table in the layout of data.csv, with gaps."""
+    rng = np.random.default_rng(seed)
+    stations = pd.DataFrame({
+        'Latitude': rng.uniform(-60, 80, n_stations),
+        'Longitude': rng.uniform(-180, 180, n_stations),
+        'Country': rng.choice(['Algeria', 'Japan', 'Peru'], n_stations),
+        'Station': [f"S{i}" for i in range(n_stations)],
+    })
+    frames = []
+    for k, param in enumerate(PARAMS):
+        frame = stations.copy()
+        values = rng.normal(10 * k, 5 + k, size=(n_stations, len(MONTHS))).round(1)
+        values[rng.random(values.shape) < 0.1] = np.nan
+        frame[MONTHS] = values
+        frame['Parameter'] = param
+        frames.append(frame)
+    return build_wide_table(pd.concat(frames, ignore_index=True))
+
+
+def mask_filter(df_wide, filters, month):
+    """The original app filter: one boolean mask per slider, applied in turn."""
+    filtered = df_wide.copy()
+    for p, (low, high) in filters.items():
+        col_name = f"{p}_{month}"
+        filtered = filtered[(filtered[col_name] >= low) & (filtered[col_name] <= high)]
+    return df_wide.index.get_indexer(filtered.index)
+
+
+def random_filters(rng, df_wide, month):
+    """Draw ranges over a random subset of parameters, some empty, some covering everything."""
+    filters = {}
+    for p in PARAMS:
+        if rng.random() < 0.3:
+            continue
+        column = df_wide[f"{p}_{month}"]
+        low, high = np.sort(rng.uniform(column.min() - 5, column.max() + 5, 2))
+        filters[p] = (low, high)
+    return filters
+
+
+@pytest.fixture(scope='module')
+def df_wide():
+    return make_wide_table()
+
+
+@pytest.mark.parametrize('use_range_index', [False, True])
+def test_filter_indices_matches_mask(df_wide, use_range_index):
+    engine = FilterEngine(df_wide, build_stats_index(df_wide), use_range_index)
+    rng = np.random.default_rng(1)
+    for _ in range(200):
+        month = rng.choice(MONTHS)
+        filters = random_filters(rng, df_wide, month)
+        expected = mask_filter(df_wide, filters, month)
+        np.testing.assert_array_equal(engine.filter_indices(filters, month), expected)
+
+
+def test_incremental_filter_matches_mask(df_wide):
+    engine = FilterEngine(df_wide)
+    bitmaps = PredicateBitmaps()
+    rng = np.random.default_rng(2)
+    month = 'Jul'
+    filters = random_filters(rng, df_wide, month)
+    for _ in range(100):
+        # Move one slider at a time, as in the app
+        moved = random_filters(rng, df_wide, month)
+        p = rng.choice(PARAMS)
+        if p in moved:
+            filters[p] = moved[p]
+        else:
+            filters.pop(p, None)
+        expected = mask_filter(df_wide, filters, month)
+        np.testing.assert_array_equal(engine.filter_indices_incremental(filters, month, bitmaps), expected)
+    assert bitmaps.reused > 0
+
+
+def test_memory_mapped_table_is_not_copied(df_wide, tmp_path):
+    write_wide_cache(df_wide, str(tmp_path), 'key')
+    cached = load_wide_cache(str(tmp_path), 'key')
+    engine = FilterEngine(cached)
+
+    matrix, params = engine.month_matrix('Apr')
+    base = matrix
+    while isinstance(base.base, np.ndarray):
+        base = base.base
+    assert isinstance(base, np.memmap)
+    assert params == sorted(PARAMS)
+    np.testing.assert_array_equal(matrix, df_wide[[f"{p}_Apr" for p in params]].to_numpy())
+
+    filters = {PARAMS[0]: (0.0, 5.0), PARAMS[1]: (5.0, 15.0)}
+    np.testing.assert_array_equal(engine.filter_indices(filters, 'Apr'), mask_filter(df_wide, filters, 'Apr'))
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from stats_index import QUANTILES, build_stats_index, get_column_stats, load_stats_index
+from wide_cache import ID_COLUMNS
+
+#########################
+# The statistics index must agree with pandas on every Parameter_Month column
+#########################
+
+
+@pytest.fixture(scope='module')
+def df_wide():
+    """A wide table with gaps, a constant column and an empty column."""
+    rng = np.random.default_rng(0)
+    n = 300
+    df = pd.DataFrame({
+        'Station': [f"S{i}" for i in range(n)],
+        'Country': rng.choice(['Algeria', 'Japan'], n),
+        'Latitude': rng.uniform(-60, 80, n),
+        'Longitude': rng.uniform(-180, 180, n),
+    })
+    for month in ['Jan', 'Jul']:
+        values = rng.gamma(2.0, 30.0, n)
+        values[rng.random(n) < 0.2] = np.nan
+        df[f"Precipitation (mm)_{month}"] = values
+        df[f"Mean Daily Mean Temperature (degC)_{month}"] = rng.normal(15, 8, n).round(1)
+    df['Mean Sea Level Pressure (hPa)_Jan'] = 1013.0
+    df['Mean Sea Level Pressure (hPa)_Jul'] = np.nan
+    return df
+
+
+def test_matches_pandas(df_wide):
+    index = build_stats_index(df_wide)
+    value_columns = [c for c in df_wide.columns if c not in ID_COLUMNS]
+    assert sorted(index) == sorted(value_columns)
+
+    for col in value_columns:
+        column = df_wide[col]
+        entry = index[col]
+        assert entry['count'] == column.count()
+        assert entry['nulls'] == column.isna().sum()
+        if column.count() == 0:
+            assert entry['min'] is None and entry['max'] is None
+            continue
+        assert entry['min'] == column.min()
+        assert entry['max'] == column.max()
+        for q in QUANTILES:
+            assert entry['quantiles'][str(q)] == pytest.approx(column.quantile(q))
+        hist, edges = np.histogram(column.dropna(), bins=len(entry['hist']), range=(column.min(), column.max()))
+        assert entry['hist'] == hist.tolist()
+        np.testing.assert_allclose(entry['bin_edges'], edges)
+        assert sum(entry['hist']) == entry['count']
+
+
+def test_cached_index_round_trips(df_wide, tmp_path):
+    csv_path = tmp_path / 'data.csv'
+    csv_path.write_text('Station\n')
+    built = load_stats_index(str(csv_path), df_wide, str(tmp_path))
+    assert load_stats_index(str(csv_path), df_wide, str(tmp_path)) == built
+    assert not [p.name for p in tmp_path.iterdir() if p.name.endswith('.tmp')]
+    assert get_column_stats(built, 'Mean Sea Level Pressure (hPa)', 'Jul') is None
+    assert get_column_stats(built, 'Precipitation (mm)', 'Jan')['count'] == df_wide['Precipitation (mm)_Jan'].count()
@@ -1,7 +1,8 @@
 import pandas as pd
 import altair as alt
 import streamlit as st
-from vega_datasets import data
+
+from world_topology import topology_data
 
 #########################
 # 초기 설정 및 데이터 준비
@@ -21,7 +22,7 @@ param_list = [
 ]
 
 months = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
-world_map = alt.topo_feature(data.world_110m.url, feature="countries")
+world_map = topology_data('110m')
 
 # 데이터를 long format으로 변환
 df_long = df.melt(id_vars=['Station', 'Country', 'Latitude', 'Longitude', 'Parameter'], 
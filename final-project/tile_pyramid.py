@@ -0,0 +1,400 @@
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import datashader as ds
+import datashader.transfer_functions as tf
+import numpy as np
+import pandas as pd
+import xarray as xr
+from PIL import Image, ImageDraw
+
+from climate_grid import colour_ramp, grid_axes
+from recommender import RecommendationEngine, months, param_list
+from world_topology import decode_arcs, load_topology, topology_polygons
+
+#########################
+# Offline z/x/y PNG tile pyramid (Web Mercator) for the map background and climate layers
+#########################
+
+# Tiles are written under static/ so Streamlit serves them as app/static/tiles/...
+TILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'tiles')
+TILE_URL = 'app/static/tiles'
+MANIFEST = 'manifest.json'
+
+TILE_SIZE = 256
+MAX_ZOOM = 4
+
+# Web Mercator: sphere radius in metres and the latitude limit of the square world
+MERCATOR_RADIUS = 6378137.0
+MAX_LATITUDE = 85.0511287798
+
+# Inputs of the rendered layers
+GRID_RESOLUTION = 0.25   # climate grid (see climate_grid.py)
+LAND_RESOLUTION = 0.1    # rasterised land mask for the background
+LAND_COLOR = '#d3d3d3'   # 'lightgray', as in the Altair map
+BORDER_COLOR = '#ffffff'
+COLOR_SCHEME = 'viridis'
+CLIMATE_ALPHA = 204
+
+# Latitudes shown by the world view (the polar rows of the mercator square are cropped)
+WORLD_VIEW_LATITUDES = (80, -60)
+
+# Bump to invalidate every built layer when the rendering changes
+TILES_VERSION = 2
+
+
+def mercator(lon, lat):
+    """Project longitude/latitude in degrees to Web Mercator metres."""
+    lat = np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE)
+    x = MERCATOR_RADIUS * np.radians(lon)
+    y = MERCATOR_RADIUS * np.log(np.tan(np.pi / 4 + np.radians(lat) / 2))
+    return x, y
+
+
+def world_pixels(lon, lat, zoom):
+    """Return the global pixel coordinates (origin top-left) of a point at a zoom level."""
+    size = TILE_SIZE * 2**zoom
+    x, y = mercator(lon, lat)
+    half = np.pi * MERCATOR_RADIUS
+    return (x + half) / (2 * half) * size, (half - y) / (2 * half) * size
+
+
+def tile_bounds(zoom, x, y):
+    """Return the ((x_min, x_max), (y_min, y_max)) extent of a tile in mercator metres."""
+    half = np.pi * MERCATOR_RADIUS
+    step = 2 * half / 2**zoom
+    return (-half + x * step, -half + (x + 1) * step), (half - (y + 1) * step, half - y * step)
+
+
+def grid_array(values, lat, lon):
+    """
+    Wrap a north-first lat/lon grid as an xarray DataArray in mercator metres.
+
+    Rows beyond the mercator latitude limit are dropped and the y axis is made
+    ascending, as datashader's quadmesh expects monotonic coordinates.
+    """
+    keep = np.abs(lat) < MAX_LATITUDE
+    x, _ = mercator(lon, 0)
+    _, y = mercator(0, lat[keep])
+    return xr.DataArray(np.asarray(values, dtype=np.float32)[keep][::-1],
+                        coords={'y': y[::-1], 'x': x}, dims=['y', 'x'], name='value')
+
+
+def land_mask(topo, resolution=LAND_RESOLUTION):
+    """
+    Rasterise the topology's polygons into a lat/lon land mask.
+
+    Parameters:
+    - topo: A TopoJSON dict in longitude/latitude.
+    - resolution: Cell size in degrees.
+
+    Returns:
+    - A float32 grid (north row first) with 1 on land and NaN elsewhere.
+    """
+    width, height = int(round(360 / resolution)), int(round(180 / resolution))
+    image = Image.new('L', (width, height), 0)
+    draw = ImageDraw.Draw(image)
+    for polygon in topology_polygons(topo):
+        for k, ring in enumerate(polygon):
+            pixels = np.column_stack([(ring[:, 0] + 180) / resolution, (90 - ring[:, 1]) / resolution])
+            draw.polygon([tuple(p) for p in pixels], fill=1 if k == 0 else 0)
+    mask = np.asarray(image, dtype=np.float32)
+    mask[mask == 0] = np.nan
+    return mask
+
+
+def border_lines(topo):
+    """Return the topology arcs as one NaN-separated line dataframe in mercator metres."""
+    parts = []
+    for points in decode_arcs(topo):
+        x, y = mercator(points[:, 0], points[:, 1])
+        parts.append(np.column_stack([x, y]))
+        parts.append(np.full((1, 2), np.nan))
+    return pd.DataFrame(np.vstack(parts), columns=['x', 'y'])
+
+
+def render_climate_tile(zoom, x, y, grid, span):
+    """
+    Render one tile of a climate grid.
+
+    Parameters:
+    - zoom, x, y: The tile address.
+    - grid: The grid as a DataArray (see grid_array).
+    - span: The (min, max) values mapped to the ends of the colour scale.
+
+    Returns:
+    - A PIL image, or None if the tile has no data.
+    """
+    x_range, y_range = tile_bounds(zoom, x, y)
+    canvas = ds.Canvas(plot_width=TILE_SIZE, plot_height=TILE_SIZE, x_range=x_range, y_range=y_range)
+    agg = canvas.quadmesh(grid, agg=ds.mean('value'))
+    if not np.isfinite(agg.values).any():
+        return None
+    return tf.shade(agg, cmap=colour_ramp(COLOR_SCHEME), span=span, how='linear', alpha=CLIMATE_ALPHA).to_pil()
+
+
+def render_background_tile(zoom, x, y, land, borders):
+    """
+    Render one background tile: land fill with country borders.
+
+    Parameters:
+    - zoom, x, y: The tile address.
+    - land: The land mask as a DataArray (see grid_array and land_mask).
+    - borders: The border line dataframe (see border_lines).
+
+    Returns:
+    - A PIL image, or None if the tile is open sea.
+    """
+    x_range, y_range = tile_bounds(zoom, x, y)
+    canvas = ds.Canvas(plot_width=TILE_SIZE, plot_height=TILE_SIZE, x_range=x_range, y_range=y_range)
+    fill = canvas.quadmesh(land, agg=ds.max('value'))
+    if not np.isfinite(fill.values).any():
+        return None
+    fill_image = tf.shade(fill, cmap=[LAND_COLOR, LAND_COLOR], span=(0, 1), how='linear')
+    lines = canvas.line(borders, 'x', 'y', agg=ds.any())
+    return tf.stack(fill_image, tf.shade(lines, cmap=[BORDER_COLOR])).to_pil()
+
+
+def _render_zoom(args):
+    """Worker: render every tile of one layer at one zoom level into out_dir."""
+    kind, payload, zoom, out_dir = args
+    if kind == 'climate':
+        values, lat, lon, span = payload
+        data = grid_array(values, lat, lon)
+    else:
+        values, lat, lon, borders = payload
+        data = grid_array(values, lat, lon)
+
+    n_written = 0
+    for x in range(2**zoom):
+        for y in range(2**zoom):
+            if kind == 'climate':
+                image = render_climate_tile(zoom, x, y, data, span)
+            else:
+                image = render_background_tile(zoom, x, y, data, borders)
+            if image is None:
+                continue
+            path = os.path.join(out_dir, str(zoom), str(x), f"{y}.png")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            image.save(path, format='PNG', optimize=True)
+            n_written += 1
+    return n_written
+
+
+def read_manifest(tile_dir=TILE_DIR):
+    """Return the manifest of built layers ({} if nothing was built yet)."""
+    path = os.path.join(tile_dir, MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_manifest(manifest, tile_dir=TILE_DIR):
+    """Write the manifest atomically."""
+    os.makedirs(tile_dir, exist_ok=True)
+    path = os.path.join(tile_dir, MANIFEST)
+    with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=tile_dir, suffix='.tmp', delete=False) as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(f.name, path)
+
+
+def layer_key(*parts):
+    """Hash the inputs and settings of a layer; a layer is rebuilt when its key changes."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else json.dumps(part).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def background_layer(level='110m'):
+    """Return (name, key) of the background layer; the land mask is not rasterised."""
+    key = layer_key(json.dumps(load_topology(level)).encode('utf-8'),
+                    [TILES_VERSION, LAND_RESOLUTION, LAND_COLOR, BORDER_COLOR])
+    return f"background-{level}", key
+
+
+def background_payload(level='110m'):
+    """Return the (land mask, lat, lon, borders) payload rendered by _render_zoom."""
+    topo = load_topology(level)
+    lat, lon = grid_axes(LAND_RESOLUTION)
+    return land_mask(topo), lat, lon, border_lines(topo)
+
+
+def climate_layer(engine, param, month):
+    """Return (name, key) of one Parameter_Month climate layer; the grid is not built."""
+    column = engine.df_wide[f"{param}_{month}"].to_numpy(dtype=np.float64)
+    span = engine.get_min_max(param, month)
+    key = layer_key(column.tobytes(), engine.df_wide['Latitude'].to_numpy().tobytes(),
+                    engine.df_wide['Longitude'].to_numpy().tobytes(),
+                    [TILES_VERSION, GRID_RESOLUTION, COLOR_SCHEME, CLIMATE_ALPHA, span])
+    return f"{param}_{month}", key
+
+
+def climate_payload(engine, param, month):
+    """Return the (grid, lat, lon, span) payload rendered by _render_zoom."""
+    lat, lon = grid_axes(GRID_RESOLUTION)
+    grid = np.asarray(engine.climate_grid(param, month, GRID_RESOLUTION), dtype=np.float32)
+    return grid, lat, lon, engine.get_min_max(param, month)
+
+
+def layer_dir_name(name, key):
+    """Directory of a built layer; the key in the name keeps browser caches correct."""
+    slug = ''.join(c if c.isalnum() else '-' for c in name).strip('-')
+    return f"{slug}-{key}"
+
+
+def build_tiles(engine, params=None, level='110m', max_zoom=MAX_ZOOM, max_workers=None,
+                tile_dir=TILE_DIR, force=False):
+    """
+    Build (or bring up to date) the background and climate tile pyramids.
+
+    A layer is only re-rendered when its key changes, i.e. when its source
+    values or the rendering settings change. Keys are compared first, so the
+    grids of up-to-date layers are never built. Each (layer, zoom level) is
+    rendered by one process of the pool, and layers are built and recorded in
+    the manifest one after the other as their tiles are written, so only a
+    few payloads are held in memory and an interrupted build keeps its
+    finished layers.
+
+    Parameters:
+    - engine: A RecommendationEngine (source of the grids and colour spans).
+    - params: Parameters to build (defaults to every parameter); all 12 months
+      of each are built.
+    - level: Topology level of the background.
+    - max_zoom: Highest zoom level to render.
+    - max_workers: Size of the process pool (defaults to the number of CPUs).
+    - tile_dir: Output directory.
+    - force: Rebuild every layer.
+
+    Returns:
+    - A dict mapping each rebuilt layer to the number of tiles written.
+    """
+    manifest = read_manifest(tile_dir)
+    layers = [background_layer(level) + (lambda: background_payload(level),)]
+    for param in params or param_list:
+        for month in months:
+            layers.append(climate_layer(engine, param, month)
+                          + (lambda param=param, month=month: climate_payload(engine, param, month),))
+
+    stale = []
+    for name, key, make_payload in layers:
+        entry = manifest.get(name)
+        if force or entry is None or entry['key'] != key or entry['max_zoom'] < max_zoom:
+            stale.append((name, key, make_payload))
+
+    def finish_layer(name, key, span, futures):
+        # Record a layer in the manifest once all of its zoom levels are on disk
+        written[name] = sum(future.result() for future in futures)
+        old = manifest.get(name)
+        new_dir = layer_dir_name(name, key)
+        if old is not None and old['dir'] != new_dir:
+            shutil.rmtree(os.path.join(tile_dir, old['dir']), ignore_errors=True)
+        manifest[name] = {'key': key, 'dir': new_dir, 'max_zoom': max_zoom}
+        if span is not None:
+            manifest[name]['span'] = span
+        write_manifest(manifest, tile_dir)
+
+    written = {}
+    # Payloads of at most `window` layers are alive at once: a new layer is only
+    # built once the oldest layer in flight has been written
+    window = max_workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        in_flight = deque()
+        for name, key, make_payload in stale:
+            kind = 'background' if name.startswith('background-') else 'climate'
+            payload = make_payload()
+            span = list(payload[3]) if kind == 'climate' else None
+            out_dir = os.path.join(tile_dir, layer_dir_name(name, key))
+            shutil.rmtree(out_dir, ignore_errors=True)
+            futures = [pool.submit(_render_zoom, (kind, payload, zoom, out_dir))
+                       for zoom in range(max_zoom + 1)]
+            del payload
+            in_flight.append((name, key, span, futures))
+            if len(in_flight) >= window:
+                finish_layer(*in_flight.popleft())
+        while in_flight:
+            finish_layer(*in_flight.popleft())
+    return written
+
+
+def view_window(viewport=None, max_zoom=MAX_ZOOM, max_width=1100, max_height=700):
+    """
+    Choose the zoom level, pixel window and display scale that show a viewport.
+
+    The zoom is the lowest level whose tiles are at least as detailed as the
+    chart (or max_zoom); the window is then scaled to fit max_width x max_height.
+
+    Parameters:
+    - viewport: A (lon_min, lon_max, lat_min, lat_max) box, or None for the world.
+      Boxes crossing the antimeridian fall back to the world view.
+    - max_zoom: Highest zoom level available.
+    - max_width, max_height: Largest chart size in pixels.
+
+    Returns:
+    - A tuple (zoom, window, factor): window is (x0, y0, width, height) in
+      global pixels of that zoom, and factor the scale from tile to chart pixels.
+    """
+    if viewport is None or viewport[0] > viewport[1]:
+        lon_min, lon_max = -180, 180
+        lat_max, lat_min = WORLD_VIEW_LATITUDES
+    else:
+        lon_min, lon_max, lat_min, lat_max = viewport
+
+    for zoom in range(max_zoom + 1):
+        x0, y0 = world_pixels(lon_min, lat_max, zoom)
+        x1, y1 = world_pixels(lon_max, lat_min, zoom)
+        if x1 - x0 >= max_width or y1 - y0 >= max_height:
+            break
+    width, height = float(x1 - x0), float(y1 - y0)
+    factor = min(max_width / width, max_height / height)
+    return zoom, (float(x0), float(y0), width, height), factor
+
+
+def visible_tiles(entry, zoom, window, factor=1.0, tile_dir=TILE_DIR, tile_url=TILE_URL):
+    """
+    List the built tiles of a layer that intersect a pixel window.
+
+    Parameters:
+    - entry: The layer's manifest entry.
+    - zoom, window, factor: The view (see view_window).
+
+    Returns:
+    - A dataframe with each tile's 'url' and its top-left 'px'/'py' in chart pixels.
+    """
+    x0, y0, width, height = window
+    last = 2**zoom - 1
+    rows = []
+    for x in range(max(0, int(x0 // TILE_SIZE)), min(last, int((x0 + width) // TILE_SIZE)) + 1):
+        for y in range(max(0, int(y0 // TILE_SIZE)), min(last, int((y0 + height) // TILE_SIZE)) + 1):
+            relative = f"{entry['dir']}/{zoom}/{x}/{y}.png"
+            if os.path.exists(os.path.join(tile_dir, *relative.split('/'))):
+                rows.append({'url': f"{tile_url}/{relative}",
+                             'px': (x * TILE_SIZE - x0) * factor, 'py': (y * TILE_SIZE - y0) * factor})
+    return pd.DataFrame(rows, columns=['url', 'px', 'py'])
+
+
+def window_projection(zoom, window, factor=1.0):
+    """Return the Vega-Lite mercator projection that lines up with a tile view."""
+    size = TILE_SIZE * 2**zoom * factor
+    x0, y0, _, _ = window
+    return {'type': 'mercator', 'scale': size / (2 * np.pi),
+            'translate': [size / 2 - x0 * factor, size / 2 - y0 * factor]}
+
+
+if __name__ == '__main__':
+    # python tile_pyramid.py [data.csv] [max_zoom] [parameter ...]
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else 'data.csv'
+    max_zoom = int(sys.argv[2]) if len(sys.argv) > 2 else MAX_ZOOM
+    params = sys.argv[3:] or None
+    written = build_tiles(RecommendationEngine(csv_path), params, max_zoom=max_zoom)
+    if not written:
+        print("All tile layers are up to date")
+    for name, n in written.items():
+        print(f"{name}: {n} tiles")
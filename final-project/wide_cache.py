@@ -0,0 +1,190 @@
+import hashlib
+import json
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+#########################
+# Build-once columnar cache for the wide Station x (Parameter, Month) table
+#########################
+
+# Columns that identify a station in the wide table
+ID_COLUMNS = ['Station', 'Country', 'Latitude', 'Longitude']
+
+# Bump this when the on-disk layout changes so stale caches are rebuilt
+CACHE_VERSION = 1
+
+
+def default_cache_dir(csv_path):
+    """
+    Return the cache directory used for a given source CSV.
+
+    Parameters:
+    - csv_path: Path to the long-format source CSV (e.g. 'data.csv').
+
+    Returns:
+    - The path of a '.cache' directory next to the CSV.
+    """
+    return os.path.join(os.path.dirname(os.path.abspath(csv_path)), '.cache')
+
+
+def source_hash(csv_path, block_size=1 << 20):
+    """
+    Hash the contents of the source CSV so the cache is rebuilt whenever it changes.
+
+    Parameters:
+    - csv_path: Path to the source CSV.
+    - block_size: Number of bytes read per iteration.
+
+    Returns:
+    - A short hex digest identifying the file contents.
+    """
+    digest = hashlib.sha256()
+    digest.update(f"v{CACHE_VERSION}".encode())
+    with open(csv_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def build_wide_table(df):
+    """
+    Pivot the long Station/Parameter/Month table into one column per Parameter_Month.
+
+    Parameters:
+    - df: The dataframe loaded from 'data.csv' (one row per station and parameter).
+
+    Returns:
+    - The wide dataframe with ID_COLUMNS followed by the Parameter_Month columns.
+    """
+    # Convert the data from wide to long format for easier manipulation
+    df_long = df.melt(
+        id_vars=ID_COLUMNS + ['Parameter'],
+        var_name='Month',
+        value_name='Value'
+    )
+
+    # Combine Parameter and Month into a single column for pivoting
+    df_long['Parameter_Month'] = df_long['Parameter'] + '_' + df_long['Month']
+
+    # Pivot the long dataframe back to wide format, now with Parameter_Month as columns
+    df_wide = df_long.pivot_table(
+        index=ID_COLUMNS,
+        columns='Parameter_Month',
+        values='Value'
+    ).reset_index()
+
+    # Remove the hierarchical column index created by pivot_table
+    df_wide.columns.name = None
+
+    # Remove any columns that contain '_Elem' in their name
+    df_wide = df_wide.loc[:, ~df_wide.columns.str.contains('_Elem')]
+
+    return df_wide
+
+
+def _cache_paths(cache_dir, key):
+    """Return the (values, meta) file paths for a cache key."""
+    prefix = os.path.join(cache_dir, f"wide_{key}")
+    return prefix + '.values.npy', prefix + '.meta.json'
+
+
+def write_wide_cache(df_wide, cache_dir, key):
+    """
+    Materialise the wide table as a float64 matrix (.npy) plus a JSON sidecar.
+
+    The numeric Parameter_Month block is stored as one C-contiguous matrix so it
+    can be memory-mapped back without parsing; station identifiers go in the sidecar.
+
+    Parameters:
+    - df_wide: The wide dataframe returned by build_wide_table.
+    - cache_dir: Directory in which to store the cache files.
+    - key: The cache key (usually source_hash of the CSV).
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    values_path, meta_path = _cache_paths(cache_dir, key)
+
+    value_columns = [c for c in df_wide.columns if c not in ID_COLUMNS]
+    values = np.ascontiguousarray(df_wide[value_columns].to_numpy(dtype=np.float64))
+    meta = {
+        'version': CACHE_VERSION,
+        'value_columns': value_columns,
+        'Station': df_wide['Station'].tolist(),
+        'Country': df_wide['Country'].tolist(),
+        'Latitude': df_wide['Latitude'].astype(float).tolist(),
+        'Longitude': df_wide['Longitude'].astype(float).tolist(),
+    }
+
+    # Write to uniquely named temporary files first, so a concurrent reader never
+    # sees a partial cache and concurrent writers never share a temporary file
+    with tempfile.NamedTemporaryFile(dir=cache_dir, suffix='.tmp', delete=False) as f:
+        np.save(f, values)
+    tmp_values = f.name
+    with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=cache_dir, suffix='.tmp', delete=False) as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp_values, values_path)
+    os.replace(f.name, meta_path)
+
+
+def load_wide_cache(cache_dir, key):
+    """
+    Load a cached wide table, memory-mapping the numeric block instead of copying it.
+
+    Parameters:
+    - cache_dir: Directory containing the cache files.
+    - key: The cache key used when writing.
+
+    Returns:
+    - The wide dataframe, or None if no cache exists for this key.
+    """
+    values_path, meta_path = _cache_paths(cache_dir, key)
+    if not (os.path.exists(values_path) and os.path.exists(meta_path)):
+        return None
+
+    with open(meta_path, encoding='utf-8') as f:
+        meta = json.load(f)
+    if meta.get('version') != CACHE_VERSION:
+        return None
+
+    # Read-only memory map: pages are shared between processes and loaded lazily
+    values = np.load(values_path, mmap_mode='r')
+    df_wide = pd.DataFrame(values, columns=meta['value_columns'], copy=False)
+
+    # Insert the identifier columns in front without consolidating the float block
+    for pos, col in enumerate(ID_COLUMNS):
+        df_wide.insert(pos, col, meta[col])
+
+    return df_wide
+
+
+def load_wide_table(csv_path, cache_dir=None):
+    """
+    Return the wide table for a source CSV, building the cache on first use.
+
+    Parameters:
+    - csv_path: Path to the long-format source CSV.
+    - cache_dir: Optional cache directory (defaults to default_cache_dir(csv_path)).
+
+    Returns:
+    - The wide dataframe backed by the memory-mapped cache.
+    """
+    if cache_dir is None:
+        cache_dir = default_cache_dir(csv_path)
+    key = source_hash(csv_path)
+
+    df_wide = load_wide_cache(cache_dir, key)
+    if df_wide is None:
+        write_wide_cache(build_wide_table(pd.read_csv(csv_path)), cache_dir, key)
+        df_wide = load_wide_cache(cache_dir, key)
+    return df_wide
+
+
+if __name__ == '__main__':
+    # Build the cache ahead of deployment: python wide_cache.py [data.csv]
+    path = sys.argv[1] if len(sys.argv) > 1 else 'data.csv'
+    table = load_wide_table(path)
+    print(f"Cached {table.shape[0]} stations x {table.shape[1] - len(ID_COLUMNS)} columns "
+          f"in {default_cache_dir(path)} (key {source_hash(path)})")
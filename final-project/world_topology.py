@@ -0,0 +1,261 @@
+import json
+import os
+import sys
+import urllib.request
+
+import altair as alt
+import numpy as np
+
+from chart_data import publish_bytes
+
+#########################
+# Local world topology for the map background
+#########################
+
+# Bundled TopoJSON files (object 'countries'); see build_topology for how they were made
+TOPOLOGY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'topology')
+
+# Simplification levels, from most to least detailed
+LEVELS = {
+    '50m': 'world-50m.json',
+    '110m': 'world-110m.json',
+    '110m-coarse': 'world-110m-coarse.json'
+}
+
+# Where fetch_topology downloads a level from when it is not bundled
+REMOTE_TOPOLOGY = {
+    '50m': 'https://cdn.jsdelivr.net/npm/world-atlas@2/countries-50m.json',
+    '110m': 'https://cdn.jsdelivr.net/npm/world-atlas@2/countries-110m.json'
+}
+
+# Name of the TopoJSON object holding the country polygons
+FEATURE = 'countries'
+
+
+def available_levels(topology_dir=TOPOLOGY_DIR):
+    """Return the simplification levels that are present on disk."""
+    return [level for level, name in LEVELS.items()
+            if os.path.exists(os.path.join(topology_dir, name))]
+
+
+def build_topology(shp_path, out_path, simplify=None, quantize=1e5):
+    """
+    Convert a Natural Earth admin-0 shapefile into a TopoJSON file.
+
+    This is how the bundled files were produced (from the public-domain
+    ne_110m_admin_0_countries data). It needs the optional 'pyshp' and
+    'topojson' packages, which the app itself does not use.
+
+    Parameters:
+    - shp_path: Path to the .shp file.
+    - out_path: Path of the TopoJSON file to write.
+    - simplify: Optional Douglas-Peucker tolerance in degrees.
+    - quantize: Quantization factor of the output arcs.
+    """
+    import shapefile
+    import topojson
+
+    reader = shapefile.Reader(shp_path)
+    fields = [f[0] for f in reader.fields[1:]]
+    features = []
+    for shape_record in reader.iterShapeRecords():
+        props = dict(zip(fields, shape_record.record))
+        features.append({
+            'type': 'Feature',
+            'properties': {'name': props.get('name'), 'iso_a3': props.get('iso_a3')},
+            'geometry': shape_record.shape.__geo_interface__
+        })
+    collection = {'type': 'FeatureCollection', 'features': features}
+
+    topo = topojson.Topology(
+        collection,
+        object_name=FEATURE,
+        prequantize=quantize,
+        toposimplify=simplify if simplify else False
+    )
+    with open(out_path, 'w', encoding='utf-8') as f:
+        f.write(topo.to_json())
+
+
+def fetch_topology(level, topology_dir=TOPOLOGY_DIR):
+    """
+    Download a simplification level into the topology directory (needs network).
+
+    Parameters:
+    - level: A key of REMOTE_TOPOLOGY.
+    - topology_dir: Directory to store the file in.
+
+    Returns:
+    - The path of the stored file.
+    """
+    path = os.path.join(topology_dir, LEVELS[level])
+    os.makedirs(topology_dir, exist_ok=True)
+    with urllib.request.urlopen(REMOTE_TOPOLOGY[level]) as response:
+        payload = response.read()
+    with open(path, 'wb') as f:
+        f.write(payload)
+    return path
+
+
+def load_topology(level='110m', topology_dir=TOPOLOGY_DIR):
+    """Read a bundled TopoJSON file."""
+    with open(os.path.join(topology_dir, LEVELS[level]), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def natural_earth1(lon, lat):
+    """
+    Project longitude/latitude in degrees with the Natural Earth I projection.
+
+    Uses the same polynomial as d3-geo's geoNaturalEarth1, so the result lines
+    up with what Vega-Lite draws for project('naturalEarth1').
+
+    Parameters:
+    - lon, lat: Arrays of coordinates in degrees.
+
+    Returns:
+    - A tuple (x, y) of arrays in projection units (y points north).
+    """
+    lam = np.radians(np.asarray(lon, dtype=np.float64))
+    phi = np.radians(np.asarray(lat, dtype=np.float64))
+    phi2 = phi * phi
+    phi4 = phi2 * phi2
+    x = lam * (0.8707 - 0.131979 * phi2 + phi4 * (-0.013791 + phi4 * (0.003971 * phi2 - 0.001529 * phi4)))
+    y = phi * (1.007226 + phi2 * (0.015085 + phi4 * (-0.044475 + 0.028874 * phi2 - 0.005916 * phi4)))
+    return x, y
+
+
+def natural_earth1_inverse(x, y, iterations=25, eps=1e-9):
+    """
+    Invert natural_earth1 (Newton's method on the latitude, as in d3-geo).
+
+    Parameters:
+    - x, y: Arrays of projected coordinates (y points north).
+    - iterations: Maximum number of Newton steps.
+    - eps: Convergence threshold in radians.
+
+    Returns:
+    - A tuple (lon, lat) of arrays in degrees; points outside the projected
+      world have |lon| > 180.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    phi = y.copy()
+    for _ in range(iterations):
+        phi2 = phi * phi
+        phi4 = phi2 * phi2
+        delta = (phi * (1.007226 + phi2 * (0.015085 + phi4 * (-0.044475 + 0.028874 * phi2 - 0.005916 * phi4))) - y) / \
+            (1.007226 + phi2 * (0.015085 * 3 + phi4 * (-0.044475 * 7 + 0.028874 * 9 * phi2 - 0.005916 * 11 * phi4)))
+        phi -= delta
+        if np.all(np.abs(delta) <= eps):
+            break
+    phi2 = phi * phi
+    lam = x / (0.8707 + phi2 * (-0.131979 + phi2 * (-0.013791 + phi2 * phi2 * phi2 * (0.003971 - 0.001529 * phi2))))
+    return np.degrees(lam), np.degrees(phi)
+
+
+def decode_arcs(topo):
+    """
+    Decode the (possibly quantized, delta-encoded) arcs of a topology.
+
+    Parameters:
+    - topo: A TopoJSON dict.
+
+    Returns:
+    - A list of (n, 2) float arrays of longitude/latitude.
+    """
+    transform = topo.get('transform')
+    arcs = []
+    for arc in topo['arcs']:
+        points = np.asarray(arc, dtype=np.float64)[:, :2]
+        if transform is not None:
+            points = np.cumsum(points, axis=0)
+            points = points * transform['scale'] + transform['translate']
+        arcs.append(points)
+    return arcs
+
+
+def topology_polygons(topo, feature=FEATURE):
+    """
+    Assemble the polygons of a topology object from its shared arcs.
+
+    Parameters:
+    - topo: A TopoJSON dict.
+    - feature: Name of the object to read.
+
+    Returns:
+    - A list of polygons, each a list of rings ((n, 2) longitude/latitude arrays,
+      exterior ring first, then holes).
+    """
+    arcs = decode_arcs(topo)
+
+    def ring(indexes):
+        parts = [arcs[i] if i >= 0 else arcs[~i][::-1] for i in indexes]
+        # Consecutive arcs share their end/start point
+        return np.vstack([parts[0]] + [p[1:] for p in parts[1:]])
+
+    polygons = []
+    for geometry in topo['objects'][feature]['geometries']:
+        if geometry['type'] == 'Polygon':
+            polygons.append([ring(r) for r in geometry['arcs']])
+        elif geometry['type'] == 'MultiPolygon':
+            polygons.extend([ring(r) for r in polygon] for polygon in geometry['arcs'])
+    return polygons
+
+
+def project_topology(topo, decimals=5):
+    """
+    Return a copy of a topology whose arcs are already in Natural Earth I units.
+
+    The result is meant to be drawn with project(type='identity', reflectY=True),
+    so the browser only scales the coordinates instead of projecting every vertex
+    on each render.
+
+    Parameters:
+    - topo: A TopoJSON dict in longitude/latitude.
+    - decimals: Rounding of the projected coordinates (keeps the file small).
+
+    Returns:
+    - The projected TopoJSON dict (unquantized, without 'transform').
+    """
+    projected = dict(topo)
+    projected.pop('transform', None)
+    projected.pop('bbox', None)
+    arcs = []
+    for points in decode_arcs(topo):
+        x, y = natural_earth1(points[:, 0], points[:, 1])
+        arcs.append(np.round(np.column_stack([x, y]), decimals).tolist())
+    projected['arcs'] = arcs
+    return projected
+
+
+def topology_data(level='110m', projected=False, topology_dir=TOPOLOGY_DIR):
+    """
+    Publish a local topology as a content-hashed static asset.
+
+    Parameters:
+    - level: One of LEVELS that is available on disk.
+    - projected: Publish the pre-projected Natural Earth I variant.
+    - topology_dir: Directory holding the bundled files.
+
+    Returns:
+    - An Altair UrlData referencing the 'countries' feature.
+    """
+    if projected:
+        topo = project_topology(load_topology(level, topology_dir))
+        payload = json.dumps(topo, separators=(',', ':')).encode('utf-8')
+        published = publish_bytes(payload, f"world-{level}-naturalEarth1")
+    else:
+        with open(os.path.join(topology_dir, LEVELS[level]), 'rb') as f:
+            published = publish_bytes(f.read(), f"world-{level}")
+    return alt.UrlData(url=published.url, format=alt.TopoDataFormat(type='topojson', feature=FEATURE))
+
+
+if __name__ == '__main__':
+    # python world_topology.py fetch 50m | python world_topology.py build <shp> <out> [tolerance]
+    if len(sys.argv) >= 3 and sys.argv[1] == 'fetch':
+        print(fetch_topology(sys.argv[2]))
+    elif len(sys.argv) >= 4 and sys.argv[1] == 'build':
+        build_topology(sys.argv[2], sys.argv[3], float(sys.argv[4]) if len(sys.argv) > 4 else None)
+    else:
+        print(f"Available levels: {available_levels()}")
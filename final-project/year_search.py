@@ -0,0 +1,71 @@
+import numpy as np
+
+#########################
+# Whole-year "best month" search over a stations x months x params tensor
+#########################
+
+
+def year_tensor(values, column_positions, params, months):
+    """
+    Gather the Parameter_Month columns into a (stations x months x params) tensor.
+
+    Parameters:
+    - values: The (stations x Parameter_Month) matrix (e.g. FilterEngine.values).
+    - column_positions: Dict mapping column name -> column index in values.
+    - params: The parameters to include, in order.
+    - months: The months to include, in order.
+
+    Returns:
+    - A float64 array of shape (stations, len(months), len(params)); missing
+      Parameter_Month columns are filled with NaN.
+    """
+    tensor = np.full((values.shape[0], len(months), len(params)), np.nan)
+    for i, m in enumerate(months):
+        for j, p in enumerate(params):
+            pos = column_positions.get(f"{p}_{m}")
+            if pos is not None:
+                tensor[:, i, j] = values[:, pos]
+    return tensor
+
+
+def month_matches(tensor, low, high, scale):
+    """
+    Evaluate one set of ranges against all months at once.
+
+    Parameters:
+    - tensor: A (stations x months x params) array restricted to the chosen params.
+    - low, high: Arrays of shape (params,) with the ranges.
+    - scale: Array of shape (params,) normalising each parameter (e.g. its range).
+
+    Returns:
+    - mask: uint16 array (stations,), bit i set when month i satisfies every range.
+    - best: int array (stations,) with the best month index, or -1 if no data.
+    - distance: float array (stations, months) of normalised distance to the box
+      (0 inside, inf where data is missing).
+    """
+    low = np.asarray(low, dtype=np.float64)
+    high = np.asarray(high, dtype=np.float64)
+    scale = np.where(np.asarray(scale, dtype=np.float64) > 0, scale, 1.0)
+
+    # Per (station, month): distance outside the box and distance from its centre
+    outside = np.maximum(np.maximum(low - tensor, tensor - high), 0.0) / scale
+    distance = np.sqrt((outside ** 2).sum(axis=2))
+    centre = np.sqrt((((tensor - (low + high) / 2) / scale) ** 2).sum(axis=2))
+    distance[np.isnan(distance)] = np.inf
+    centre[np.isnan(centre)] = np.inf
+
+    inside = distance == 0
+    weights = (1 << np.arange(tensor.shape[1])).astype(np.uint16)
+    mask = (inside * weights).sum(axis=1).astype(np.uint16)
+
+    # Best month: among matching months the one nearest the centre of the ranges,
+    # otherwise the month that comes closest to the ranges
+    key = np.where(inside, centre, np.inf)
+    best = np.where(inside.any(axis=1), key.argmin(axis=1), distance.argmin(axis=1))
+    best[~np.isfinite(distance).any(axis=1)] = -1
+    return mask, best, distance
+
+
+def mask_to_months(mask, months):
+    """Decode a 12-bit month mask into the list of month names."""
+    return [m for i, m in enumerate(months) if mask >> i & 1]